@@ -0,0 +1,116 @@
+## Copyright 2024 Kaden Bilyeu (Bikatr7) (https://github.com/Bikatr7) (https://github.com/Bikatr7/Kairyou)
+## Use of this source code is governed by a GNU Lesser General Public License v2.1
+## license that can be found in the LICENSE file.
+
+## Times NER over paragraphs with no newlines, such as those of scraped web novels, at each chunk size NERRunner can split them into.
+## The paragraphs are made by joining the lines of a text, and the entities found at each chunk size are compared with those found in whole paragraphs.
+##
+## python benchmarks/ner_chunking.py --model lg --text tests/testing_preprocessing_text.txt --paragraph-length 20000
+
+## built-in libraries
+import argparse
+import typing
+import time
+
+## third-party libraries
+from kairyou import SpacyBackend
+from kairyou.ner import NERRunner
+
+##-------------------start-of-make_paragraphs()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def make_paragraphs(lines:typing.List[str], paragraph_length:int, count:int) -> typing.List[str]:
+
+    """
+
+    Joins the lines, over and over, into paragraphs of about the given length.
+
+    Parameters:
+    lines (list - str) : The lines.
+    paragraph_length (int) : How long each paragraph should be, in characters.
+    count (int) : How many paragraphs to make.
+
+    Returns:
+    paragraphs (list - str) : The paragraphs.
+
+    """
+
+    _text = "".join(lines)
+    _text = _text * (paragraph_length // len(_text) + 1)
+
+    return [_text[:paragraph_length]] * count
+
+##-------------------start-of-measure()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def measure(backend:SpacyBackend, paragraphs:typing.List[str], chunk_size:int | None, repeat:int) -> typing.Tuple[float, list]:
+
+    """
+
+    Times NER over the paragraphs at a chunk size.
+
+    Parameters:
+    backend (SpacyBackend) : The backend.
+    paragraphs (list - str) : The paragraphs.
+    chunk_size (int | None) : The chunk size, None for whole paragraphs.
+    repeat (int) : How many times to run over the paragraphs.
+
+    Returns:
+    seconds (float) : The time per paragraph.
+    entities (list) : The entities found in each paragraph.
+
+    """
+
+    _runner = NERRunner(chunk_size=chunk_size)
+
+    _time_start = time.perf_counter()
+
+    for _ in range(repeat):
+        _entities = list(_runner.pipe(backend, paragraphs))
+
+    return (time.perf_counter() - _time_start) / (repeat * len(paragraphs)), _entities
+
+##-------------------start-of-main()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def main() -> None:
+
+    _parser = argparse.ArgumentParser(description="Benchmarks NER over long paragraphs at each chunk size.")
+    _parser.add_argument("--model", default="lg", help="The model, a size such as sm, md and lg, or the name of an installed model.")
+    _parser.add_argument("--text", default="tests/testing_preprocessing_text.txt", help="The text the paragraphs are made from.")
+    _parser.add_argument("--paragraph-length", type=int, default=20000, help="How long each paragraph is, in characters.")
+    _parser.add_argument("--paragraphs", type=int, default=4, help="How many paragraphs to parse.")
+    _parser.add_argument("--chunk-sizes", nargs="+", type=int, default=[250, 500, 1000, 2000, 4000, 8000], help="The chunk sizes to compare.")
+    _parser.add_argument("--repeat", type=int, default=3, help="How many times to run over the paragraphs.")
+
+    _args = _parser.parse_args()
+
+    with open(_args.text, "r", encoding="utf-8") as _file:
+        _lines = [_line for _line in _file.read().split("\n") if _line.strip()]
+
+    _paragraphs = make_paragraphs(_lines, _args.paragraph_length, _args.paragraphs)
+
+    _backend = SpacyBackend(_args.model)
+
+    ## loaded before timing, so the first chunk size doesn't pay for it
+    _backend.nlp
+
+    print(f"{len(_paragraphs)} paragraphs of {_args.paragraph_length} characters, {_args.repeat} runs\n")
+    print(f"{'chunk size':>10} {'paragraph (ms)':>15} {'entities':>9} {'same ents':>10}")
+
+    ## whole paragraphs can be too long for the model, in which case they are only compared with each other
+    try:
+        _whole_time, _whole_entities = measure(_backend, _paragraphs, None, _args.repeat)
+        print(f"{'whole':>10} {_whole_time * 1000:>15.2f} {sum(map(len, _whole_entities)):>9} {'True':>10}")
+
+    except Exception as _error:
+        _whole_entities = None
+        print(f"{'whole':>10} {'failed':>15}  {type(_error).__name__}: {_error}")
+
+    for _chunk_size in _args.chunk_sizes:
+
+        _time, _entities = measure(_backend, _paragraphs, _chunk_size, _args.repeat)
+
+        print(f"{_chunk_size:>10} {_time * 1000:>15.2f} {sum(map(len, _entities)):>9} {str(_entities == _whole_entities) if _whole_entities is not None else '-':>10}")
+
+    _backend.close()
+
+if(__name__ == "__main__"):
+    main()
@@ -0,0 +1,131 @@
+## Copyright 2024 Kaden Bilyeu (Bikatr7) (https://github.com/Bikatr7) (https://github.com/Bikatr7/Kairyou)
+## Use of this source code is governed by a GNU Lesser General Public License v2.1
+## license that can be found in the LICENSE file.
+
+## Compares the load time, memory, and per-line latency of each spacy model and profile Kairyou can run NER with.
+## Each model and profile is measured in a fresh process, so the memory of one doesn't count towards the next.
+##
+## python benchmarks/ner_profiles.py --models sm md lg --text tests/testing_preprocessing_text.txt
+
+## built-in libraries
+import multiprocessing
+import argparse
+import typing
+import time
+import os
+
+## third-party libraries
+from kairyou import SpacyBackend, ModelManager
+from kairyou.models import PROFILES
+
+##-------------------start-of-get_rss()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def get_rss() -> int:
+
+    """
+
+    Gets the resident memory of the process, where /proc is available.
+
+    Returns:
+    rss (int) : The resident memory in bytes, 0 if it can't be read.
+
+    """
+
+    try:
+        with open("/proc/self/statm", "r") as _file:
+            return int(_file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    except (OSError, ValueError, IndexError):
+        return 0
+
+##-------------------start-of-measure()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def measure(model:str, profile:str, lines:typing.List[str], repeat:int) -> dict:
+
+    """
+
+    Loads a model with a profile and times NER over the lines. Runs in its own process.
+
+    Parameters:
+    model (str) : The model, a size such as "lg" or the name of an installed model.
+    profile (str) : The profile.
+    lines (list - str) : The lines to run NER over.
+    repeat (int) : How many times to run over the lines.
+
+    Returns:
+    result (dict) : The load time, memory, latencies, and entities found.
+
+    """
+
+    _rss_before = get_rss()
+
+    _backend = SpacyBackend(model, profile=profile)
+    _nlp = _backend.nlp
+
+    _load_time = ModelManager.get_metrics(_backend.model, profile).last_load_time
+    _rss = get_rss() - _rss_before
+
+    ## one line at a time, as enhanced replacement used to parse
+    _time_start = time.perf_counter()
+
+    for _ in range(repeat):
+        for _line in lines:
+            list(_backend.pipe([_line]))
+
+    _single = (time.perf_counter() - _time_start) / (repeat * len(lines))
+
+    ## in batches, as the prefetch and the indexer parse
+    _time_start = time.perf_counter()
+
+    for _ in range(repeat):
+        _entities = list(_backend.pipe(lines))
+
+    _batched = (time.perf_counter() - _time_start) / (repeat * len(lines))
+
+    return {"model": _backend.model,
+            "profile": profile,
+            "pipeline": ", ".join(_nlp.pipe_names),
+            "vectors": _nlp.vocab.vectors.shape[0],
+            "load_time": _load_time,
+            "rss": _rss,
+            "single": _single,
+            "batched": _batched,
+            "entities": _entities}
+
+##-------------------start-of-main()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def main() -> None:
+
+    _parser = argparse.ArgumentParser(description="Benchmarks the spacy models and profiles Kairyou can run NER with.")
+    _parser.add_argument("--models", nargs="+", default=["lg"], help="The models to compare, sizes such as sm, md and lg, or names of installed models.")
+    _parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=PROFILES, help="The profiles to compare.")
+    _parser.add_argument("--text", default="tests/testing_preprocessing_text.txt", help="The text to run NER over, one line per line.")
+    _parser.add_argument("--repeat", type=int, default=3, help="How many times to run over the text.")
+
+    _args = _parser.parse_args()
+
+    with open(_args.text, "r", encoding="utf-8") as _file:
+        _lines = [_line for _line in _file.read().split("\n") if _line.strip()]
+
+    print(f"{len(_lines)} lines, {_args.repeat} runs\n")
+    print(f"{'model':<18} {'profile':<10} {'load (s)':>9} {'rss (MiB)':>10} {'line (ms)':>10} {'batched (ms)':>13} {'same ents':>10}  pipeline")
+
+    ## spawn, so every measurement starts from a process with nothing loaded
+    _context = multiprocessing.get_context("spawn")
+
+    for _model in _args.models:
+
+        _full_entities = None
+
+        for _profile in _args.profiles:
+
+            with _context.Pool(1) as _pool:
+                _result = _pool.apply(measure, (_model, _profile, _lines, _args.repeat))
+
+            if(_full_entities is None):
+                _full_entities = _result["entities"]
+
+            print(f"{_result['model']:<18} {_result['profile']:<10} {_result['load_time']:>9.2f} {_result['rss'] / 1024 ** 2:>10.0f} {_result['single'] * 1000:>10.2f} {_result['batched'] * 1000:>13.2f} {str(_result['entities'] == _full_entities):>10}  {_result['pipeline']} ({_result['vectors']} vectors)")
+
+if(__name__ == "__main__"):
+    main()
@@ -1,13 +1,19 @@
-## Copyright 2024 Kaden Bilyeu (Bikatr7) (https://github.com/Bikatr7) (https://github.com/Bikatr7/Kairyou)
-## Use of this source code is governed by a GNU Lesser General Public License v2.1
-## license that can be found in the LICENSE file.
-
-from .version import VERSION as __version__  # noqa
-
-__author__ = "Kaden Bilyeu (Bikatr7) <Bikatr7@proton.me>"
-
-from .kairyou import Kairyou
-from .katakana_util import KatakanaUtil
-from .indexer import Indexer
-from .types import NameAndOccurrence
-from .exceptions import KairyouException, InvalidReplacementJsonName, InvalidReplacementJsonKeys, InvalidReplacementJsonPath, SpacyModelNotFound
\ No newline at end of file
+## Copyright 2024 Kaden Bilyeu (Bikatr7) (https://github.com/Bikatr7) (https://github.com/Bikatr7/Kairyou)
+## Use of this source code is governed by a GNU Lesser General Public License v2.1
+## license that can be found in the LICENSE file.
+
+from .version import VERSION as __version__  # noqa
+
+__author__ = "Kaden Bilyeu (Bikatr7) <Bikatr7@proton.me>"
+
+from .kairyou import Kairyou
+from .katakana_util import KatakanaUtil
+from .indexer import Indexer, IndexerSession
+from .types import NameAndOccurrence, Entity, LineCacheStats, ModelMetrics, KnowledgeBaseIndex
+from .plan import ReplacementPlan
+from .client import KairyouClient
+from .cache import LineCache, NERCache, KnowledgeBaseCache
+from .models import ModelManager
+from .backends import NERBackend, SpacyBackend, DictionaryBackend, FakeBackend
+from .aio import AsyncKairyou
+from .exceptions import KairyouException, KairyouWarning, InvalidReplacementJsonName, InvalidReplacementJsonKeys, InvalidReplacementJsonPath, SpacyModelNotFound, PlanNotStreamable
\ No newline at end of file
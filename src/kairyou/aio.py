@@ -0,0 +1,222 @@
+## Copyright 2024 Kaden Bilyeu (Bikatr7) (https://github.com/Bikatr7) (https://github.com/Bikatr7/Kairyou)
+## Use of this source code is governed by a GNU Lesser General Public License v2.1
+## license that can be found in the LICENSE file.
+
+## built-in libraries
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import threading
+import typing
+
+## third-party libraries
+import spacy
+
+## custom modules
+from .backends import NERBackend
+from .client import KairyouClient
+from .indexer import IndexerSession
+from .models import ModelManager
+from .plan import ReplacementPlan, _get_replacement_plan
+from .types import NameAndOccurrence, KnowledgeBaseIndex
+
+##-------------------start-of-AsyncKairyou---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class AsyncKairyou:
+
+    """
+
+    An asyncio front-end for preprocessing and indexing.
+
+    The work runs in a thread pool owned by the instance, so the event loop is never blocked, and at most max_in_flight jobs run at once, the rest wait their turn.
+    The spacy model is loaded once, in the pool, the first time a job needs it, and shared by every job. Cancelling a job stops it before its next step or NER line.
+
+    Use it as an async context manager, or call close() when done.
+
+    """
+
+##-------------------start-of-__init__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__(self, max_workers:int = 4, max_in_flight:int | None = None, ner:spacy.language.Language | NERBackend | None = None) -> None:
+
+        """
+
+        Creates the front-end. Nothing is loaded until the first job.
+
+        Parameters:
+        max_workers (int | optional | default=4) : How many threads the pool has.
+        max_in_flight (int | optional | default=None) : How many jobs can run at once. Defaults to max_workers.
+        ner (spacy.language.Language | NERBackend | optional | default=None) : The spacy NER model or NER backend to use. If None, the spacy model is loaded on the first job.
+
+        """
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kairyou")
+        self._in_flight = asyncio.Semaphore(max_in_flight or max_workers)
+
+        self._ner = ner
+        self._ner_lock = asyncio.Lock()
+
+        ## whether the model was loaded by the instance, in which case close() gives it back to the ModelManager
+        self._owns_ner = False
+
+##-------------------start-of-__aenter__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    async def __aenter__(self) -> "AsyncKairyou":
+
+        return self
+
+##-------------------start-of-__aexit__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    async def __aexit__(self, *args) -> None:
+
+        await self.close()
+
+##-------------------start-of-close()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    async def close(self) -> None:
+
+        """
+
+        Shuts the thread pool down, waiting for running jobs to finish, and gives back the model if it was loaded by the instance.
+
+        """
+
+        await asyncio.get_running_loop().run_in_executor(None, functools.partial(self._executor.shutdown, wait=True))
+
+        if(self._owns_ner):
+            ModelManager.release(self._ner)
+            self._ner = None
+            self._owns_ner = False
+
+##-------------------start-of-preprocess()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    async def preprocess(self, text_to_preprocess:str, replacement_json:typing.Union[dict,str,ReplacementPlan], add_closing_period:bool = False) -> typing.Tuple[str, str, str]:
+
+        """
+
+        Preprocesses the text using the replacement json, see KairyouClient.preprocess().
+
+        Parameters:
+        text_to_preprocess (str) : The text to be preprocessed.
+        replacement_json (dict | str | ReplacementPlan) : The rules for preprocessing. Can be a dictionary, a path to a json file, or a plan from Kairyou.compile(). A json is only compiled again once it changes, see Kairyou.preprocess().
+        add_closing_period (bool | optional | default=False) : Whether to add closing periods (。) before 」 where missing.
+
+        Returns:
+        text (str) : The preprocessed text.
+        preprocessing_log (str) : The log of replacements made.
+        error_log (str) : The log of errors encountered (if any).
+
+        Raises:
+        InvalidPreprocessingText : If the text to be preprocessed is empty.
+        SpacyModelNotFound : If the model is needed but not installed.
+
+        """
+
+        async with self._in_flight:
+
+            if(isinstance(replacement_json, ReplacementPlan)):
+                _plan = replacement_json
+
+            else:
+                _plan = await self._run(lambda _cancel_event: _get_replacement_plan(replacement_json))
+
+            ## a plan without enhanced ops never needs the model, so it isn't loaded for it
+            _ner = await self._get_ner() if _plan.needs_ner else None
+
+            def _preprocess(cancel_event:threading.Event) -> typing.Tuple[str, str, str]:
+                _client = KairyouClient(_plan, ner=_ner, add_closing_period=add_closing_period)
+                return _client.preprocess(text_to_preprocess, cancel_event=cancel_event)
+
+            return await self._run(_preprocess)
+
+##-------------------start-of-index()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    async def index(self, text_to_index:str, knowledge_base:str | KnowledgeBaseIndex, replacement_json:typing.Union[str, dict], blacklist:typing.List[str] = []) -> typing.Tuple[typing.List[NameAndOccurrence], str]:
+
+        """
+
+        Indexes the text, see Indexer.index(). Each job runs in an IndexerSession of its own, so index jobs run side by side like preprocess jobs.
+
+        Parameters:
+        text_to_index (str) : The text to index. Can be a path to a text file, or just the text itself.
+        knowledge_base (str | KnowledgeBaseIndex) : The knowledge base. Can be a path to a directory containing text files, a path to a text file, just the text itself, or an index from Indexer.build_knowledge_base_index().
+        replacement_json (str) : The replacement json. Can be a path to a json, or as the json itself.
+        blacklist (list - str) : A list of strings to ignore.
+
+        Returns:
+        new_names (NameAndOccurrence): A list of names that are not in the knowledge base or replacement_json.
+        indexing_log (str): Log of the indexing process.
+
+        Raises:
+        SpacyModelNotFound : If the model is needed but not installed.
+
+        """
+
+        async with self._in_flight:
+
+            _ner = await self._get_ner()
+
+            def _index(cancel_event:threading.Event) -> typing.Tuple[typing.List[NameAndOccurrence], str]:
+                _session = IndexerSession(_ner)
+                return _session.index(text_to_index, knowledge_base, replacement_json, blacklist, cancel_event=cancel_event)
+
+            return await self._run(_index)
+
+##-------------------start-of-_get_ner()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    async def _get_ner(self) -> spacy.language.Language | NERBackend:
+
+        """
+
+        Gets the shared spacy NER model, loading it in the pool on first use.
+
+        Returns:
+        ner (spacy.language.Language) : The model.
+
+        Raises:
+        SpacyModelNotFound : If the model is needed but not installed.
+
+        """
+
+        async with self._ner_lock:
+
+            if(self._ner is None):
+                self._ner = await asyncio.get_running_loop().run_in_executor(self._executor, KairyouClient.load_ner)
+                self._owns_ner = True
+
+        return self._ner
+
+##-------------------start-of-_run()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    async def _run(self, job:typing.Callable[[threading.Event], typing.Any]) -> typing.Any:
+
+        """
+
+        Runs a job in the pool.
+
+        If the awaiting task is cancelled, the job is told to stop and is waited for, so it keeps counting towards max_in_flight until its thread is actually free.
+
+        Parameters:
+        job (callable) : The job, which takes the event that is set when it should stop.
+
+        Returns:
+        result (any) : What the job returned.
+
+        """
+
+        _cancel_event = threading.Event()
+        _future = asyncio.get_running_loop().run_in_executor(self._executor, job, _cancel_event)
+
+        try:
+            return await asyncio.shield(_future)
+
+        except asyncio.CancelledError:
+            _cancel_event.set()
+
+            try:
+                await _future
+
+            except BaseException:
+                pass
+
+            raise
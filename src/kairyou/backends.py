@@ -0,0 +1,353 @@
+## Copyright 2024 Kaden Bilyeu (Bikatr7) (https://github.com/Bikatr7) (https://github.com/Bikatr7/Kairyou)
+## Use of this source code is governed by a GNU Lesser General Public License v2.1
+## license that can be found in the LICENSE file.
+
+## built-in libraries
+import threading
+import typing
+import time
+import abc
+
+## third-party libraries
+import spacy
+import regex
+
+## custom modules
+from .matcher import MultiPatternMatcher
+from .models import ModelManager, DEFAULT_MODEL
+from .plan import ReplacementPlan, _compile_replacement_plan
+from .types import Entity
+
+##-------------------start-of-NERBackend---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class NERBackend(abc.ABC):
+
+    """
+
+    Something that finds the entities in lines. Kairyou only needs the PERSON ones, the Indexer also logs the labels of the rest.
+
+    KairyouClient, Kairyou and Indexer take a backend wherever they take a spacy model, a spacy model on its own is used as a SpacyBackend.
+    Subclasses have to implement pipe(), a backend without it can't be created, and model_key if their results can be kept in a NERCache.
+
+    """
+
+##-------------------start-of-model_key()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @property
+    def model_key(self) -> typing.Tuple[str, str] | None:
+
+        """
+
+        The name and version the results of the backend are cached under in a NERCache. None if they aren't cached, the default.
+
+        """
+
+        return None
+
+##-------------------start-of-pipe()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @abc.abstractmethod
+    def pipe(self, lines:typing.Sequence[str], batch_size:int = 256, n_process:int = 1) -> typing.Iterator[typing.Tuple[Entity, ...]]:
+
+        """
+
+        Finds the entities in many lines.
+
+        Parameters:
+        lines (sequence - str) : The lines.
+        batch_size (int | optional | default=256) : How many lines to work on at a time, for backends that batch.
+        n_process (int | optional | default=1) : How many processes to work with, for backends that can use several.
+
+        Returns:
+        entities (tuple - Entity) : The entities in each line, in order.
+
+        """
+
+##-------------------start-of-close()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def close(self) -> None:
+
+        """
+
+        Frees what the backend holds, such as a loaded model. Does nothing by default.
+
+        """
+
+        pass
+
+##-------------------start-of-SpacyBackend---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class SpacyBackend(NERBackend):
+
+    """
+
+    Finds entities with a spacy model, the default backend.
+
+    The model is only loaded, through the ModelManager, the first time it is needed, and close() gives it back.
+    The backend is pickled as the name and profile of its model, so a worker process it is sent to loads the model itself.
+
+    """
+
+    ## the japanese pipelines by size, sm and md are smaller and faster to load than lg, but miss more names
+    MODELS = {"sm": "ja_core_news_sm", "md": "ja_core_news_md", "lg": "ja_core_news_lg", "trf": "ja_core_news_trf"}
+
+##-------------------start-of-__init__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__(self, model:str = DEFAULT_MODEL, nlp:spacy.language.Language | None = None, profile:str | None = None) -> None:
+
+        """
+
+        Creates the backend. Nothing is loaded until the first lines are parsed.
+
+        Parameters:
+        model (str | optional | default="ja_core_news_lg") : The spacy model to load. Either a size from MODELS, such as "sm", or the name of an installed model.
+        nlp (spacy.language.Language | optional | default=None) : An already loaded model to use instead. It is left alone by close().
+        profile (str | optional | default=None) : How to load the model, "full" or "ner-only", see kairyou.models.PROFILES. Defaults to ModelManager.profile.
+
+        """
+
+        self.model = SpacyBackend.MODELS.get(model, model)
+        self.profile = profile
+
+        self._nlp = nlp
+        self._owns_nlp = False
+        self._lock = threading.Lock()
+
+##-------------------start-of-__getstate__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __getstate__(self) -> dict:
+
+        return {"model": self.model, "profile": self.profile}
+
+##-------------------start-of-__setstate__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __setstate__(self, state:dict) -> None:
+
+        self.__init__(state["model"], profile=state["profile"])
+
+##-------------------start-of-nlp()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @property
+    def nlp(self) -> spacy.language.Language:
+
+        """
+
+        The spacy model, loaded on first use.
+
+        Raises:
+        SpacyModelNotFound : If the model is not installed.
+
+        """
+
+        if(self._nlp is None):
+            with self._lock:
+                if(self._nlp is None):
+                    self._nlp = ModelManager.acquire(self.model, self.profile)
+                    self._owns_nlp = True
+
+        return self._nlp
+
+##-------------------start-of-model_key()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @property
+    def model_key(self) -> typing.Tuple[str, str] | None:
+
+        """
+
+        The name of the model, such as ja_core_news_lg, and its version, from its meta. None if the meta doesn't have them.
+
+        """
+
+        _meta = getattr(self.nlp, "meta", None)
+
+        if(not isinstance(_meta, dict) or not _meta.get("name") or not _meta.get("version")):
+            return None
+
+        _name = f"{_meta['lang']}_{_meta['name']}" if _meta.get("lang") else _meta["name"]
+
+        return (_name, str(_meta["version"]))
+
+##-------------------start-of-pipe()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def pipe(self, lines:typing.Sequence[str], batch_size:int = 256, n_process:int = 1) -> typing.Iterator[typing.Tuple[Entity, ...]]:
+
+        """
+
+        Parses lines with nlp.pipe(), see NERBackend.pipe().
+
+        """
+
+        ## a single line skips the batching machinery of nlp.pipe()
+        if(len(lines) == 1):
+            yield _to_entities(self.nlp(lines[0]))
+            return
+
+        for _doc in self.nlp.pipe(lines, batch_size=batch_size, n_process=n_process):
+            yield _to_entities(_doc)
+
+##-------------------start-of-close()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def close(self) -> None:
+
+        """
+
+        Gives the model back to the ModelManager if the backend loaded it. It is loaded again if the backend is used after this.
+
+        """
+
+        with self._lock:
+
+            if(self._owns_nlp):
+                ModelManager.release(self._nlp)
+                self._nlp = None
+                self._owns_nlp = False
+
+##-------------------start-of-DictionaryBackend---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class DictionaryBackend(NERBackend):
+
+    """
+
+    Finds known names without a model, labelling every leftmost-longest occurrence of one as a PERSON.
+
+    Loads instantly and is much faster than spacy, but can't tell a name from the same characters used as a word, so every enhanced replacement behaves like a plain one.
+
+    """
+
+##-------------------start-of-__init__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__(self, names:typing.Iterable[str]) -> None:
+
+        """
+
+        Creates the backend.
+
+        Parameters:
+        names (iterable - str) : The names to find.
+
+        """
+
+        self.names = tuple(dict.fromkeys(_name for _name in names if _name))
+
+        self._matcher = MultiPatternMatcher(self.names)
+
+##-------------------start-of-from_replacement_json()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def from_replacement_json(replacement_json:typing.Any) -> "DictionaryBackend":
+
+        """
+
+        Creates a backend that finds every name variant of a replacement json, such as the full name and each part of it.
+
+        Parameters:
+        replacement_json (dict | str | ReplacementPlan) : The replacement json. Can be a dictionary, a path to a json file, or a plan from Kairyou.compile().
+
+        Returns:
+        backend (DictionaryBackend) : The backend.
+
+        Raises:
+        InvalidReplacementJsonPath : If the replacement json path could not be loaded.
+        InvalidReplacementJsonKeys : If the replacement json is missing keys.
+
+        """
+
+        if(not isinstance(replacement_json, ReplacementPlan)):
+            replacement_json = _compile_replacement_plan(replacement_json)
+
+        return DictionaryBackend(_variant.jap for _variant in replacement_json.variants)
+
+##-------------------start-of-pipe()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def pipe(self, lines:typing.Sequence[str], batch_size:int = 256, n_process:int = 1) -> typing.Iterator[typing.Tuple[Entity, ...]]:
+
+        """
+
+        Finds the names in lines, see NERBackend.pipe(). batch_size and n_process are ignored.
+
+        """
+
+        for _line in lines:
+            yield tuple(Entity(_line[_start:_end], "PERSON", _start, _end) for _start, _end, _ in self._matcher.finditer(_line))
+
+##-------------------start-of-FakeBackend---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class FakeBackend(NERBackend):
+
+    """
+
+    A deterministic stand-in for a model, for tests and benchmarks. Labels every katakana word of two or more characters as a PERSON.
+
+    The same lines always give the same entities, and latency can be set to make each line cost what a real model would.
+
+    """
+
+    _katakana_word = regex.compile(r"[ァ-ヺ][ァ-ヺー]+")
+
+##-------------------start-of-__init__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__(self, latency:float = 0.0) -> None:
+
+        """
+
+        Creates the backend.
+
+        Parameters:
+        latency (float | optional | default=0.0) : Seconds each line takes.
+
+        """
+
+        self.latency = latency
+
+        ## how many lines have been parsed, to check what was or wasn't parsed
+        self.lines_parsed = 0
+
+##-------------------start-of-model_key()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @property
+    def model_key(self) -> typing.Tuple[str, str] | None:
+
+        """
+
+        Results are cached under "fake", as they never change.
+
+        """
+
+        return ("fake", "1")
+
+##-------------------start-of-pipe()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def pipe(self, lines:typing.Sequence[str], batch_size:int = 256, n_process:int = 1) -> typing.Iterator[typing.Tuple[Entity, ...]]:
+
+        """
+
+        Labels the katakana words of lines, see NERBackend.pipe(). batch_size and n_process are ignored.
+
+        """
+
+        for _line in lines:
+
+            if(self.latency > 0):
+                time.sleep(self.latency)
+
+            self.lines_parsed += 1
+
+            yield tuple(Entity(_match.group(), "PERSON", _match.start(), _match.end()) for _match in FakeBackend._katakana_word.finditer(_line))
+
+##-------------------start-of-_to_entities()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def _to_entities(doc:typing.Any) -> typing.Tuple[Entity, ...]:
+
+    """
+
+    Converts the entities of a parsed spacy doc.
+
+    Parameters:
+    doc (spacy.tokens.Doc) : The doc.
+
+    Returns:
+    entities (tuple - Entity) : The entities in the doc, in order.
+
+    """
+
+    return tuple(Entity(_entity.text, _entity.label_, _entity.start_char, _entity.end_char) for _entity in doc.ents)
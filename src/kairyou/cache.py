@@ -0,0 +1,713 @@
+## Copyright 2024 Kaden Bilyeu (Bikatr7) (https://github.com/Bikatr7) (https://github.com/Bikatr7/Kairyou)
+## Use of this source code is governed by a GNU Lesser General Public License v2.1
+## license that can be found in the LICENSE file.
+
+## built-in libraries
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import typing
+
+## custom modules
+from .types import Entity, LineCacheStats
+
+##-------------------start-of-LineCache---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class LineCache:
+
+    """
+
+    A bounded LRU cache of preprocessed lines, for lines that repeat across texts, such as 「……」, scene breaks, chapter headers and catchphrases.
+
+    Each entry maps a plan fingerprint and a line to the preprocessed line and the replacements made in it, so a hit skips both the replacements and NER.
+    Opt-in, pass one to KairyouClient or Kairyou.preprocess(). One cache can be shared by several clients and threads, entries of different plans never mix.
+
+    """
+
+##-------------------start-of-__init__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__(self, max_size:int = 100000) -> None:
+
+        """
+
+        Creates an empty cache.
+
+        Parameters:
+        max_size (int | optional | default=100000) : How many lines are kept. Once full, the least recently used line is dropped.
+
+        Raises:
+        ValueError : If max_size is less than 1.
+
+        """
+
+        if(max_size < 1):
+            raise ValueError("max_size must be at least 1.")
+
+        self.max_size = max_size
+
+        self._entries:collections.OrderedDict[typing.Tuple[str, str], typing.Tuple[str, typing.Tuple[typing.Tuple[int, int], ...]]] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+
+##-------------------start-of-__len__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __len__(self) -> int:
+
+        return len(self._entries)
+
+##-------------------start-of-get()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get(self, fingerprint:str, line:str) -> typing.Tuple[str, typing.Tuple[typing.Tuple[int, int], ...]] | None:
+
+        """
+
+        Looks a line up, counting a hit or a miss.
+
+        Parameters:
+        fingerprint (str) : The fingerprint of the plan the line is preprocessed with.
+        line (str) : The line, as the replacements see it.
+
+        Returns:
+        line (str) : The preprocessed line.
+        counts (tuple - tuple (int, int)) : The op index and count of every op that made a replacement in the line.
+        None if the line isn't cached.
+
+        """
+
+        _key = (fingerprint, line)
+
+        with self._lock:
+
+            _entry = self._entries.get(_key)
+
+            if(_entry is None):
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(_key)
+            self._hits += 1
+
+            return _entry
+
+##-------------------start-of-put()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def put(self, fingerprint:str, line:str, preprocessed_line:str, counts:typing.Tuple[typing.Tuple[int, int], ...]) -> None:
+
+        """
+
+        Caches a preprocessed line, dropping the least recently used one if the cache is full.
+
+        Parameters:
+        fingerprint (str) : The fingerprint of the plan the line was preprocessed with.
+        line (str) : The line, as the replacements saw it.
+        preprocessed_line (str) : The preprocessed line.
+        counts (tuple - tuple (int, int)) : The op index and count of every op that made a replacement in the line.
+
+        """
+
+        _key = (fingerprint, line)
+
+        with self._lock:
+
+            self._entries[_key] = (preprocessed_line, counts)
+            self._entries.move_to_end(_key)
+
+            while(len(self._entries) > self.max_size):
+                self._entries.popitem(last=False)
+
+##-------------------start-of-stats()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def stats(self) -> LineCacheStats:
+
+        """
+
+        Gets how the cache has done so far.
+
+        Returns:
+        stats (LineCacheStats) : The hits, misses, current size, and max size of the cache.
+
+        """
+
+        with self._lock:
+            return LineCacheStats(self._hits, self._misses, len(self._entries), self.max_size)
+
+##-------------------start-of-clear()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def clear(self) -> None:
+
+        """
+
+        Empties the cache and resets its stats.
+
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self._hits = 0
+            self._misses = 0
+
+##-------------------start-of-_EntityCache---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class _EntityCache:
+
+    """
+
+    The entities NER found in lines, remembered across the texts of a batch so a line that comes up again isn't parsed again.
+
+    Bounded like LineCache, dropping the least recently used line once full, so a long batch of mostly distinct lines doesn't grow without end.
+    Not locked, as it is only used by the calls of one batch, which run one after another.
+
+    """
+
+##-------------------start-of-__init__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__(self, max_size:int = 100000) -> None:
+
+        """
+
+        Creates an empty cache.
+
+        Parameters:
+        max_size (int | optional | default=100000) : How many lines are kept.
+
+        Raises:
+        ValueError : If max_size is less than 1.
+
+        """
+
+        if(max_size < 1):
+            raise ValueError("max_size must be at least 1.")
+
+        self.max_size = max_size
+
+        self._entries:collections.OrderedDict[str, typing.Tuple[Entity, ...]] = collections.OrderedDict()
+
+##-------------------start-of-__len__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __len__(self) -> int:
+
+        return len(self._entries)
+
+##-------------------start-of-get()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get(self, line:str) -> typing.Tuple[Entity, ...] | None:
+
+        """
+
+        Looks a line up.
+
+        Parameters:
+        line (str) : The line.
+
+        Returns:
+        entities (tuple - Entity) : The entities in the line, None if the line isn't cached.
+
+        """
+
+        _entities = self._entries.get(line)
+
+        if(_entities is not None):
+            self._entries.move_to_end(line)
+
+        return _entities
+
+##-------------------start-of-put()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def put(self, line:str, entities:typing.Tuple[Entity, ...]) -> None:
+
+        """
+
+        Caches the entities of a line, dropping the least recently used line if the cache is full.
+
+        Parameters:
+        line (str) : The line.
+        entities (tuple - Entity) : The entities in the line.
+
+        """
+
+        self._entries[line] = entities
+        self._entries.move_to_end(line)
+
+        while(len(self._entries) > self.max_size):
+            self._entries.popitem(last=False)
+
+##-------------------start-of-clear()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def clear(self) -> None:
+
+        """
+
+        Empties the cache.
+
+        """
+
+        self._entries.clear()
+
+##-------------------start-of-NERCache---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class NERCache:
+
+    """
+
+    A persistent cache of NER results in a SQLite database, so lines parsed in an earlier run, or by another process, don't have to be parsed again.
+
+    Each entry maps the name and version of a model and the hash of a line to the entities the model found in it, as the entities of a line never change for a given model.
+    Opt-in, pass one to KairyouClient, Kairyou.preprocess() or Indexer.index(). Every NER call they make looks the lines up in it before running spacy.
+    One cache can be shared by several clients and threads.
+
+    """
+
+##-------------------start-of-__init__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__(self, path:str, max_size:int = 1000000) -> None:
+
+        """
+
+        Opens the cache, creating the database if it doesn't exist yet.
+
+        Parameters:
+        path (str) : The path to the database file. ":memory:" keeps it in memory, for the lifetime of the cache.
+        max_size (int | optional | default=1000000) : How many lines are kept. Once full, the least recently used lines are dropped.
+
+        Raises:
+        ValueError : If max_size is less than 1.
+
+        """
+
+        if(max_size < 1):
+            raise ValueError("max_size must be at least 1.")
+
+        self.path = path
+        self.max_size = max_size
+
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+        ## ticks on every lookup and write, a row with a lower one was used less recently
+        self._clock = 0
+
+        self._hits = 0
+        self._misses = 0
+
+        with self._lock, self._connection:
+
+            self._connection.execute("CREATE TABLE IF NOT EXISTS entities (model TEXT NOT NULL, version TEXT NOT NULL, line_hash BLOB NOT NULL, entities TEXT NOT NULL, last_used INTEGER NOT NULL, PRIMARY KEY (model, version, line_hash))")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS entities_last_used ON entities (last_used)")
+
+            self._clock = self._connection.execute("SELECT COALESCE(MAX(last_used), 0) FROM entities").fetchone()[0]
+
+            ## the database may have been filled by a cache with a larger max_size
+            self._evict_excess()
+
+##-------------------start-of-__len__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __len__(self) -> int:
+
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM entities").fetchone()[0]
+
+##-------------------start-of-get_many()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get_many(self, model:typing.Tuple[str, str], lines:typing.Iterable[str]) -> typing.Dict[str, typing.Tuple[Entity, ...]]:
+
+        """
+
+        Looks lines up, counting a hit or a miss for each distinct one.
+
+        Parameters:
+        model (tuple - (str, str)) : The name and version of the model.
+        lines (iterable - str) : The lines.
+
+        Returns:
+        entities (dict - str, tuple - Entity) : The entities of each line that is cached.
+
+        """
+
+        _hashes = {NERCache._hash(_line): _line for _line in lines}
+        _found:typing.Dict[str, typing.Tuple[Entity, ...]] = {}
+
+        _keys = list(_hashes)
+
+        with self._lock, self._connection:
+
+            self._clock += 1
+
+            ## sqlite limits how many parameters a statement can have
+            for _start in range(0, len(_keys), 500):
+
+                _chunk = _keys[_start:_start + 500]
+                _placeholders = ",".join("?" * len(_chunk))
+
+                _rows = self._connection.execute(f"SELECT line_hash, entities FROM entities WHERE model = ? AND version = ? AND line_hash IN ({_placeholders})", (*model, *_chunk)).fetchall()
+
+                for _hash, _entities in _rows:
+                    _found[_hashes[_hash]] = tuple(Entity(*_entity) for _entity in json.loads(_entities))
+
+                self._connection.executemany("UPDATE entities SET last_used = ? WHERE model = ? AND version = ? AND line_hash = ?", ((self._clock, *model, _hash) for _hash, _ in _rows))
+
+            self._hits += len(_found)
+            self._misses += len(_keys) - len(_found)
+
+        return _found
+
+##-------------------start-of-put_many()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def put_many(self, model:typing.Tuple[str, str], entries:typing.Iterable[typing.Tuple[str, typing.Tuple[Entity, ...]]]) -> None:
+
+        """
+
+        Caches the entities of lines, dropping the least recently used lines if the cache is full.
+
+        Parameters:
+        model (tuple - (str, str)) : The name and version of the model.
+        entries (iterable - tuple (str, tuple - Entity)) : Each line and the entities the model found in it.
+
+        """
+
+        _rows = [(*model, NERCache._hash(_line), json.dumps([list(_entity) for _entity in _entities], ensure_ascii=False)) for _line, _entities in entries]
+
+        if(not _rows):
+            return
+
+        with self._lock, self._connection:
+
+            self._clock += 1
+
+            self._connection.executemany("INSERT OR REPLACE INTO entities (model, version, line_hash, entities, last_used) VALUES (?, ?, ?, ?, ?)", (_row + (self._clock,) for _row in _rows))
+
+            self._evict_excess()
+
+##-------------------start-of-stats()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def stats(self) -> LineCacheStats:
+
+        """
+
+        Gets how the cache has done since it was opened.
+
+        Returns:
+        stats (LineCacheStats) : The hits, misses, current size, and max size of the cache.
+
+        """
+
+        _size = len(self)
+
+        with self._lock:
+            return LineCacheStats(self._hits, self._misses, _size, self.max_size)
+
+##-------------------start-of-clear()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def clear(self, model:typing.Tuple[str, str] | None = None) -> None:
+
+        """
+
+        Empties the cache and resets its stats.
+
+        Parameters:
+        model (tuple - (str, str) | optional | default=None) : The name and version of a model, to only drop the entries of that model. Clears everything if None.
+
+        """
+
+        with self._lock, self._connection:
+
+            if(model is None):
+                self._connection.execute("DELETE FROM entities")
+
+            else:
+                self._connection.execute("DELETE FROM entities WHERE model = ? AND version = ?", model)
+
+            self._hits = 0
+            self._misses = 0
+
+##-------------------start-of-close()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def close(self) -> None:
+
+        """
+
+        Closes the database. The cache can't be used afterwards.
+
+        """
+
+        with self._lock:
+            self._connection.close()
+
+##-------------------start-of-_evict_excess()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _evict_excess(self) -> None:
+
+        """
+
+        Drops the least recently used lines until the cache is no larger than max_size. Must be called with the lock held.
+
+        """
+
+        _excess = self._connection.execute("SELECT COUNT(*) FROM entities").fetchone()[0] - self.max_size
+
+        if(_excess > 0):
+            self._connection.execute("DELETE FROM entities WHERE rowid IN (SELECT rowid FROM entities ORDER BY last_used LIMIT ?)", (_excess,))
+
+##-------------------start-of-_hash()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def _hash(line:str) -> bytes:
+
+        """
+
+        Hashes a line.
+
+        Parameters:
+        line (str) : The line.
+
+        Returns:
+        hash (bytes) : The sha1 digest of the line.
+
+        """
+
+        return hashlib.sha1(line.encode("utf-8")).digest()
+
+##-------------------start-of-KnowledgeBaseCache---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class KnowledgeBaseCache:
+
+    """
+
+    A persistent cache of what NER found in each file of a knowledge base, in a SQLite database, so Indexer.index() only parses the files added or changed since the last call.
+
+    Each entry maps the path of a file, and the model and chunk size it was parsed with, to how many times each entity was found in it under each label, along with the mtime, size and content hash of the file.
+    A file whose mtime and size haven't changed isn't read at all. One that has is read and hashed, and only parsed again if its content changed.
+    Opt-in, pass one to Indexer.index() along with a knowledge base that is a path to a directory or file. One cache can be shared by several threads.
+
+    """
+
+##-------------------start-of-__init__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__(self, path:str) -> None:
+
+        """
+
+        Opens the cache, creating the database if it doesn't exist yet.
+
+        Parameters:
+        path (str) : The path to the database file. ":memory:" keeps it in memory, for the lifetime of the cache.
+
+        """
+
+        self.path = path
+
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+
+        with self._lock, self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS files (path TEXT NOT NULL, model TEXT NOT NULL, version TEXT NOT NULL, chunk_size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, content_hash BLOB NOT NULL, entities TEXT NOT NULL, PRIMARY KEY (path, model, version, chunk_size))")
+
+##-------------------start-of-__len__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __len__(self) -> int:
+
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+##-------------------start-of-get()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get(self, model:typing.Tuple[str, str], path:str, chunk_size:int | None, mtime_ns:int, size:int, content_hash:bytes | None = None) -> typing.Dict[str, typing.Dict[str, int]] | None:
+
+        """
+
+        Looks a file up. It is found if its mtime and size are the ones it was cached with, or, when content_hash is given, if its content is.
+        A file found by its content has its new mtime and size cached, so it is found by them next time.
+
+        Parameters:
+        model (tuple - (str, str)) : The name and version of the model.
+        path (str) : The absolute path to the file.
+        chunk_size (int | None) : The chunk size the file is parsed with, see NERRunner.
+        mtime_ns (int) : The mtime of the file, in nanoseconds.
+        size (int) : The size of the file, in bytes.
+        content_hash (bytes | optional | default=None) : The hash of the content of the file, see hash_content(). If None, only the mtime and size are compared.
+
+        Returns:
+        entities (dict - str, dict - str, int) : How many times each entity was found under each label, by label, or None if the file isn't cached or changed.
+
+        """
+
+        with self._lock, self._connection:
+
+            _row = self._connection.execute("SELECT mtime_ns, size, content_hash, entities FROM files WHERE path = ? AND model = ? AND version = ? AND chunk_size = ?", (path, *model, KnowledgeBaseCache._chunk_key(chunk_size))).fetchone()
+
+            if(_row is not None and (_row[0], _row[1]) != (mtime_ns, size)):
+
+                if(content_hash is None or _row[2] != content_hash):
+                    _row = None
+
+                else:
+                    self._connection.execute("UPDATE files SET mtime_ns = ?, size = ? WHERE path = ? AND model = ? AND version = ? AND chunk_size = ?", (mtime_ns, size, path, *model, KnowledgeBaseCache._chunk_key(chunk_size)))
+
+            ## a lookup by mtime alone that misses is followed by one with the hash, so only the last one counts
+            if(_row is not None):
+                self._hits += 1
+
+            elif(content_hash is not None):
+                self._misses += 1
+
+        return json.loads(_row[3]) if _row is not None else None
+
+##-------------------start-of-put()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def put(self, model:typing.Tuple[str, str], path:str, chunk_size:int | None, mtime_ns:int, size:int, content_hash:bytes, entities:typing.Dict[str, typing.Dict[str, int]]) -> None:
+
+        """
+
+        Caches what was found in a file, replacing what was cached for it before.
+
+        Parameters:
+        model (tuple - (str, str)) : The name and version of the model.
+        path (str) : The absolute path to the file.
+        chunk_size (int | None) : The chunk size the file was parsed with.
+        mtime_ns (int) : The mtime of the file, in nanoseconds.
+        size (int) : The size of the file, in bytes.
+        content_hash (bytes) : The hash of the content of the file, see hash_content().
+        entities (dict - str, dict - str, int) : How many times each entity was found under each label, by label.
+
+        """
+
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO files (path, model, version, chunk_size, mtime_ns, size, content_hash, entities) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (path, *model, KnowledgeBaseCache._chunk_key(chunk_size), mtime_ns, size, content_hash, json.dumps(entities, ensure_ascii=False)))
+
+##-------------------start-of-drop_missing()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def drop_missing(self, directory:str, paths:typing.Iterable[str]) -> int:
+
+        """
+
+        Drops the files of a directory that are cached but no longer in it, such as deleted volumes.
+
+        Parameters:
+        directory (str) : The absolute path to the directory.
+        paths (iterable - str) : The absolute paths to the files in the directory now.
+
+        Returns:
+        dropped (int) : How many entries were dropped.
+
+        """
+
+        _paths = set(paths)
+        _prefix = os.path.join(directory, "")
+
+        with self._lock, self._connection:
+
+            _missing = [(_path,) for (_path,) in self._connection.execute("SELECT DISTINCT path FROM files").fetchall() if _path.startswith(_prefix) and _path not in _paths]
+
+            return self._connection.executemany("DELETE FROM files WHERE path = ?", _missing).rowcount
+
+##-------------------start-of-stats()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def stats(self) -> LineCacheStats:
+
+        """
+
+        Gets how the cache has done since it was opened, counting files rather than lines.
+
+        Returns:
+        stats (LineCacheStats) : The files reused, the files parsed, and the number of files cached. The cache isn't bounded, so max_size is always 0.
+
+        """
+
+        _size = len(self)
+
+        with self._lock:
+            return LineCacheStats(self._hits, self._misses, _size, 0)
+
+##-------------------start-of-clear()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def clear(self) -> None:
+
+        """
+
+        Empties the cache and resets its stats.
+
+        """
+
+        with self._lock, self._connection:
+
+            self._connection.execute("DELETE FROM files")
+
+            self._hits = 0
+            self._misses = 0
+
+##-------------------start-of-close()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def close(self) -> None:
+
+        """
+
+        Closes the database. The cache can't be used afterwards.
+
+        """
+
+        with self._lock:
+            self._connection.close()
+
+##-------------------start-of-hash_content()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def hash_content(content:str) -> bytes:
+
+        """
+
+        Hashes the content of a file.
+
+        Parameters:
+        content (str) : The content.
+
+        Returns:
+        hash (bytes) : The sha1 digest of the content.
+
+        """
+
+        _hash = KnowledgeBaseCache.start_content_hash()
+        _hash.update(content.encode("utf-8"))
+
+        return _hash.digest()
+
+##-------------------start-of-start_content_hash()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def start_content_hash() -> typing.Any:
+
+        """
+
+        Starts a hash of the content of a file, for a file read a piece at a time. Fed the utf-8 of every piece in order, its digest is what hash_content() gives for the whole content.
+
+        Returns:
+        hash (hashlib._Hash) : The hash.
+
+        """
+
+        return hashlib.sha1()
+
+##-------------------start-of-_chunk_key()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def _chunk_key(chunk_size:int | None) -> int:
+
+        """
+
+        Gets the chunk size as it is stored, 0 for whole lines, as a NULL can't be part of the key.
+
+        Parameters:
+        chunk_size (int | None) : The chunk size.
+
+        Returns:
+        chunk_key (int) : The stored chunk size.
+
+        """
+
+        return chunk_size if chunk_size is not None else 0
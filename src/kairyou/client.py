@@ -0,0 +1,1567 @@
+## Copyright 2024 Kaden Bilyeu (Bikatr7) (https://github.com/Bikatr7) (https://github.com/Bikatr7/Kairyou)
+## Use of this source code is governed by a GNU Lesser General Public License v2.1
+## license that can be found in the LICENSE file.
+
+## built-in libraries
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+import collections
+import itertools
+import typing
+import threading
+import warnings
+import time
+import os
+
+## third-party libraries
+import spacy
+import regex
+
+## custom modules
+from .plan import ReplacementPlan, PlanStep, _get_replacement_plan, _get_changed_patterns, _get_fingerprint
+from .matcher import MultiPatternMatcher, _find_literal
+from .backends import NERBackend
+from .cache import LineCache, NERCache, _EntityCache
+from .ner import NERRunner, _SpanIndex
+from .models import ModelManager
+from .types import Entity
+from .util import _get_elapsed_time
+from .exceptions import InvalidPreprocessingText, PlanNotStreamable, KairyouWarning
+
+##-------------------start-of-_PreprocessingState---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class _PreprocessingState:
+
+    """
+
+    Everything a single preprocess call changes. Each call gets its own, which is what keeps concurrent calls on one client apart.
+
+    entity_cache, if given, holds the entities NER found in lines. It can be shared by calls that run one after another, such as those of a batch.
+    cancel_event, if given, stops the call once set, see KairyouClient.preprocess().
+    entity_index maps line numbers to the PERSON spans of the line, see KairyouClient._get_person_spans().
+    span_index holds the PERSON spans of the whole text when the client parses it once, see KairyouClient._build_span_index().
+
+    """
+
+    def __init__(self, text:str, preprocessing_log:str = "", error_log:str = "", total_replacements:int = 0, entity_cache:_EntityCache | None = None, cancel_event:threading.Event | None = None) -> None:
+
+        self.text = text
+        self.preprocessing_log = preprocessing_log
+        self.error_log = error_log
+        self.total_replacements = total_replacements
+        self.entity_cache = entity_cache
+        self.cancel_event = cancel_event
+
+        self.entity_index:typing.Dict[int, typing.Tuple[str, typing.Tuple[Entity, ...]]] = {}
+        self.span_index:_SpanIndex | None = None
+
+##-------------------start-of-check_cancelled()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def check_cancelled(self) -> None:
+
+        """
+
+        Stops the call if it has been cancelled.
+
+        Raises:
+        CancelledError : If the cancel event is set.
+
+        """
+
+        if(self.cancel_event is not None and self.cancel_event.is_set()):
+            raise CancelledError("Preprocessing was cancelled.")
+
+##-------------------start-of-KairyouClient---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class KairyouClient:
+
+    """
+
+    An instance based Kairyou client for preprocessing Japanese text.
+
+    Holds a compiled plan and a spacy NER model, both of which are only ever read, and keeps everything else per call.
+    So one client can serve concurrent preprocess calls from several threads, and several clients can share one plan and one model.
+
+    """
+
+##-------------------start-of-__init__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__(self, replacement_json:typing.Union[dict,str,ReplacementPlan], ner:spacy.language.Language | NERBackend | None = None, add_closing_period:bool = False, line_cache:LineCache | None = None, ner_batch_size:int = 256, ner_n_process:int = 1, ner_cache:NERCache | None = None, parse_once:bool = False, ner_chunk_size:int | None = 2000) -> None:
+
+        """
+
+        Creates the client, compiling the replacement json if it hasn't been compiled since it last changed, see _get_replacement_plan().
+
+        Parameters:
+        replacement_json (dict | str | ReplacementPlan) : The rules for preprocessing. Can be a dictionary, a path to a json file, or a plan from Kairyou.compile().
+        ner (spacy.language.Language | NERBackend | optional | default=None) : The spacy NER model or NER backend to use, see NERBackend. Pass the same one to several clients to share it, see load_ner(). If None, the client loads its own spacy model on first use.
+        add_closing_period (bool | optional | default=False) : Whether to add closing periods (。) before 」 where missing.
+        line_cache (LineCache | optional | default=None) : A cache of preprocessed lines to look lines up in, see _replace_lines(). Can be shared between clients. Only used if the plan preprocesses each line on its own, a KairyouWarning is given if it doesn't.
+        ner_batch_size (int | optional | default=256) : How many lines spacy parses at a time, see NERRunner.
+        ner_n_process (int | optional | default=1) : How many processes spacy parses large batches of lines with, see NERRunner.
+        ner_cache (NERCache | optional | default=None) : A persistent cache of NER results, so lines parsed in earlier runs aren't parsed again. Can be shared between clients.
+        parse_once (bool | optional | default=False) : Whether to parse the text once, before the first enhanced replacement, and carry the PERSON spans found through every later replacement, see _build_span_index(). Otherwise a line that changed since it was parsed is parsed again.
+        ner_chunk_size (int | optional | default=2000) : The longest line, in characters, spacy parses whole. Longer lines are parsed a chunk of sentences at a time, see NERRunner. None to always parse whole lines.
+
+        Raises:
+        InvalidReplacementJsonPath : If the replacement json path could not be loaded.
+        InvalidReplacementJsonKeys : If the replacement json is missing keys.
+
+        """
+
+        self.plan:ReplacementPlan = _get_replacement_plan(replacement_json)
+        self.add_closing_period = add_closing_period
+
+        self.parse_once = parse_once
+
+        self.line_cache = line_cache
+
+        ## a cached line is only exact when the plan preprocesses each line on its own, so the cache would never be read or written
+        if(line_cache is not None and not KairyouClient._is_streamable(self.plan)):
+            warnings.warn("The line cache is not used, as the replacement json has rules that can't be applied one line at a time, such as a name in more than one category.", KairyouWarning, stacklevel=2)
+
+        ## the two ways of parsing, or parsing long lines in other chunks, can find different names, so their lines are cached apart
+        self._fingerprint = f"{_get_fingerprint(self.plan)}{':parse_once' if parse_once else ''}:{ner_chunk_size}" if line_cache is not None else None
+
+        ## matchers for the japanese of the enhanced ops in a range of steps, see _prefetch_entities()
+        self._enhanced_matchers:typing.Dict[typing.Tuple[int, int | None], MultiPatternMatcher] = {}
+
+        self._ner = ner
+        self._ner_lock = threading.Lock()
+
+        ## whether the model was loaded by the client, in which case close() gives it back
+        self._owns_ner = False
+
+        self._ner_runner = NERRunner(ner_batch_size, ner_n_process, ner_cache, ner_chunk_size)
+
+##-------------------start-of-load_ner()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def load_ner() -> spacy.language.Language:
+
+        """
+
+        Gets the spacy NER model used for enhanced replacement checking from the ModelManager, which only loads it if it isn't already loaded.
+
+        The model is held until it is given back with ModelManager.release().
+
+        Returns:
+        ner (spacy.language.Language) : The model, which can be shared between clients.
+
+        Raises:
+        SpacyModelNotFound : If the model is needed but not installed.
+
+        """
+
+        return ModelManager.acquire()
+
+##-------------------start-of-ner()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @property
+    def ner(self) -> spacy.language.Language | NERBackend:
+
+        """
+
+        The spacy NER model or NER backend of the client, the default spacy model is loaded on first use if neither was given.
+
+        Raises:
+        SpacyModelNotFound : If the model is needed but not installed.
+
+        """
+
+        if(self._ner is None):
+            with self._ner_lock:
+                if(self._ner is None):
+                    self._ner = KairyouClient.load_ner()
+                    self._owns_ner = True
+
+        return self._ner
+
+##-------------------start-of-_get_worker_backend()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _get_worker_backend(self) -> NERBackend | None:
+
+        """
+
+        Gets the NER backend to send to the worker processes of preprocess_parallel() and preprocess_chunked(). A spacy model can't be sent, so the workers load their own.
+
+        Returns:
+        backend (NERBackend | None) : The backend of the client, None if it uses a spacy model.
+
+        """
+
+        return self._ner if isinstance(self._ner, NERBackend) else None
+
+##-------------------start-of-close()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def close(self) -> None:
+
+        """
+
+        Gives back the model the client loaded itself to the ModelManager, which evicts it once nothing else is using it. A model that was passed in is left alone.
+
+        The client loads it again if it is used after this.
+
+        """
+
+        with self._ner_lock:
+
+            if(self._owns_ner):
+                ModelManager.release(self._ner)
+                self._ner = None
+                self._owns_ner = False
+
+##-------------------start-of-preprocess()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def preprocess(self, text_to_preprocess:str, cancel_event:threading.Event | None = None) -> typing.Tuple[str, str, str]:
+
+        """
+
+        Preprocesses the text using the client's plan. Safe to call from several threads at once.
+
+        Will skip the preprocessing if the replacement json is blank.
+
+        Parameters:
+        text_to_preprocess (str) : The text to be preprocessed.
+        cancel_event (threading.Event | optional | default=None) : Setting this from another thread stops the call before its next step or NER line.
+
+        Returns:
+        text (str) : The preprocessed text.
+        preprocessing_log (str) : The log of replacements made.
+        error_log (str) : The log of errors encountered (if any).
+
+        Raises:
+        InvalidPreprocessingText : If the text to be preprocessed is empty.
+        SpacyModelNotFound : If the model is needed but not installed.
+        CancelledError : If cancel_event was set.
+
+        """
+
+        ## If the replacement json is blank, skip the preprocessing.
+        if(self.plan.is_blank):
+            return text_to_preprocess, "Skipped", ""
+
+        if(len(text_to_preprocess) == 0):
+            raise InvalidPreprocessingText("Text to be preprocessed is empty.")
+
+        _state = _PreprocessingState(text_to_preprocess, cancel_event=cancel_event)
+
+        self._preprocess(_state)
+
+        return _state.text, _state.preprocessing_log, _state.error_log
+
+##-------------------start-of-preprocess_batch()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def preprocess_batch(self, texts:typing.Iterable[str], entity_cache_size:int = 100000) -> typing.Generator[typing.Tuple[str, str, str], None, None]:
+
+        """
+
+        Preprocesses several texts one after another, yielding the result of each as soon as it is done.
+
+        NER results are remembered across the batch, so a line that comes up again in a later text (headers, recurring dialogue, etc.) is only parsed once.
+        The last entity_cache_size lines parsed are remembered, so a long batch doesn't grow without end.
+
+        Parameters:
+        texts (iterable - str) : The texts to be preprocessed. Can be a generator, texts are only read as they are needed.
+        entity_cache_size (int | optional | default=100000) : How many lines' NER results are remembered for the rest of the batch.
+
+        Returns:
+        tuple (str, str, str) : The preprocessed text, preprocessing log, and error log of each text, in order.
+
+        Raises:
+        InvalidPreprocessingText : If one of the texts is empty. The texts before it have already been yielded.
+        ValueError : If entity_cache_size is less than 1.
+        SpacyModelNotFound : If the model is needed but not installed.
+
+        """
+
+        _entity_cache = _EntityCache(entity_cache_size)
+
+        for _text in texts:
+
+            if(self.plan.is_blank):
+                yield _text, "Skipped", ""
+                continue
+
+            if(len(_text) == 0):
+                raise InvalidPreprocessingText("Text to be preprocessed is empty.")
+
+            _state = _PreprocessingState(_text, entity_cache=_entity_cache)
+
+            self._preprocess(_state)
+
+            yield _state.text, _state.preprocessing_log, _state.error_log
+
+##-------------------start-of-preprocess_parallel()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def preprocess_parallel(self, texts:typing.Iterable[str], max_workers:int | None = None, entity_cache_size:int = 100000) -> typing.Generator[typing.Tuple[str, str, str], None, None]:
+
+        """
+
+        Preprocesses several texts across a pool of processes, yielding the results in order.
+
+        Each worker process receives the plan once and loads its own spacy model once, then preprocesses whole texts as they come, see preprocess_batch().
+        The line_cache and ner_cache of the client aren't used, the worker processes don't share them, so every line is parsed and preprocessed again.
+
+        Parameters:
+        texts (iterable - str) : The texts to be preprocessed.
+        max_workers (int | optional | default=None) : How many processes to use. Defaults to the number of CPUs.
+        entity_cache_size (int | optional | default=100000) : How many lines' NER results each worker process remembers for the texts it gets later.
+
+        Returns:
+        tuple (str, str, str) : The preprocessed text, preprocessing log, and error log of each text, in order.
+
+        Raises:
+        InvalidPreprocessingText : If one of the texts is empty.
+        ValueError : If entity_cache_size is less than 1.
+        SpacyModelNotFound : If the model is needed but not installed.
+
+        """
+
+        if(self.plan.is_blank):
+            for _text in texts:
+                yield _text, "Skipped", ""
+            return
+
+        ## checked here, as a worker failing to start only shows up as a broken pool
+        if(entity_cache_size < 1):
+            raise ValueError("entity_cache_size must be at least 1.")
+
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(self.plan, self.add_closing_period, self._get_worker_backend(), self.parse_once, self._ner_runner.chunk_size, entity_cache_size)) as _executor:
+            yield from _executor.map(_preprocess_in_worker, texts)
+
+##-------------------start-of-preprocess_chunked()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def preprocess_chunked(self, text_to_preprocess:str, max_workers:int | None = None, lines_per_chunk:int | None = None) -> typing.Tuple[str, str, str]:
+
+        """
+
+        Preprocesses one large text across a pool of processes, by splitting it into chunks of lines and making the replacements of each chunk in a different process.
+
+        Gives the same result as preprocess(). The counts of every chunk are added up and logged once, and postprocessing runs on the joined text.
+        If the plan has replacements that can match or create a line break (see ReplacementPlan.is_line_local), the text can't be split and this falls back to preprocess().
+        When the text is split, the line_cache and ner_cache of the client aren't used, the worker processes don't share them.
+
+        Parameters:
+        text_to_preprocess (str) : The text to be preprocessed.
+        max_workers (int | optional | default=None) : How many processes to use. Defaults to the number of CPUs.
+        lines_per_chunk (int | optional | default=None) : How many lines go in each chunk. Defaults to enough for about four chunks per process.
+
+        Returns:
+        text (str) : The preprocessed text.
+        preprocessing_log (str) : The log of replacements made.
+        error_log (str) : The log of errors encountered (if any).
+
+        Raises:
+        InvalidPreprocessingText : If the text to be preprocessed is empty.
+        SpacyModelNotFound : If the model is needed but not installed.
+
+        """
+
+        if(self.plan.is_blank or not self.plan.is_line_local):
+            return self.preprocess(text_to_preprocess)
+
+        if(len(text_to_preprocess) == 0):
+            raise InvalidPreprocessingText("Text to be preprocessed is empty.")
+
+        _state = _PreprocessingState(text_to_preprocess)
+
+        ## periods are added to the whole text, as the pattern looks at the character before a line's first 」
+        if(self.add_closing_period):
+            _state.text = KairyouClient._add_missing_periods(_state.text)
+
+        _time_start = time.time()
+
+        _lines = _state.text.split("\n")
+        _max_workers = max_workers or os.cpu_count() or 1
+        _lines_per_chunk = lines_per_chunk or max(1, -(-len(_lines) // (_max_workers * 4)))
+
+        _chunks = ["\n".join(_lines[_index:_index + _lines_per_chunk]) for _index in range(0, len(_lines), _lines_per_chunk)]
+
+        _counts = [0] * len(self.plan.ops)
+        _errors = {}
+
+        with ProcessPoolExecutor(max_workers=_max_workers, initializer=_init_worker, initargs=(self.plan, False, self._get_worker_backend(), self.parse_once, self._ner_runner.chunk_size)) as _executor:
+
+            for _start, _end in self._get_segments():
+
+                ## whether a guarded variant is skipped depends on the counts of the whole text, so every chunk gets the counts of the segments before
+                _counts_so_far = {_op: _count for _op, _count in enumerate(_counts) if _count > 0}
+
+                _results = list(_executor.map(_replace_in_worker, _chunks, itertools.repeat(_start), itertools.repeat(_end), itertools.repeat(_counts_so_far)))
+
+                _chunks = [_chunk for _chunk, _, _ in _results]
+
+                for _, _chunk_counts, _chunk_errors in _results:
+
+                    for _op, _count in _chunk_counts.items():
+                        _counts[_op] += _count
+
+                    _errors.update(_chunk_errors)
+
+        _state.text = "\n".join(_chunks)
+
+        self._finish(_state, _counts, _errors, _time_start)
+
+        return _state.text, _state.preprocessing_log, _state.error_log
+
+##-------------------start-of-_get_segments()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _get_segments(self) -> typing.List[typing.Tuple[int, int]]:
+
+        """
+
+        Splits the steps of the plan into the runs that can be made on each chunk on its own.
+
+        A guarded variant is skipped by the counts of the whole text, so a run ends before a guarded step when a variant of its guard has ops in the run,
+        the chunks only know their own counts for those. Every other guard is decided in the worker from the counts of the runs before.
+
+        Returns:
+        segments (list - tuple (int, int)) : The start and end of each run.
+
+        """
+
+        _segments = []
+        _start = 0
+
+        ## the variants with ops in the current run
+        _variants:typing.Set[int] = set()
+
+        for _index, _step in enumerate(self.plan.steps):
+
+            if(_step.guard is not None and _index > _start and not _variants.isdisjoint(self.plan.variants[_step.guard].guard)):
+                _segments.append((_start, _index))
+                _start = _index
+                _variants.clear()
+
+            _variants.update(self.plan.ops[_op].variant for _op in _step.ops if self.plan.ops[_op].variant is not None)
+
+        _segments.append((_start, len(self.plan.steps)))
+
+        return _segments
+
+##-------------------start-of-preprocess_stream()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def preprocess_stream(self, lines:typing.Union[str, typing.Iterable[str]], lines_per_block:int = 1000, strict:bool = False) -> typing.Generator[str, None, typing.Tuple[str, str]]:
+
+        """
+
+        Preprocesses a text given as lines, reading and yielding them a block at a time so the whole text is never in memory.
+
+        The lines yielded are the lines of what preprocess() gives for the lines joined with line breaks.
+        That holds block by block when the plan is line local, has no guarded variants, and all its full names are two latin words (see _is_streamable()),
+        otherwise a block can't be preprocessed without the rest of the text, and all the lines are read first, with a KairyouWarning.
+
+        Parameters:
+        lines (str | iterable - str) : The lines, such as an open file, or a path to a text file. A trailing line break on each line is removed.
+        lines_per_block (int | optional | default=1000) : How many lines are read ahead and preprocessed together.
+        strict (bool | optional | default=False) : Whether to raise instead of reading all the lines first when the plan can't be applied a block at a time.
+
+        Returns:
+        line (str) : Each preprocessed line, without a line break.
+        logs (tuple - str, str) : The preprocessing log and the error log, as the return value of the generator. (logs = yield from client.preprocess_stream(...))
+
+        Raises:
+        InvalidPreprocessingText : If the text is empty.
+        PlanNotStreamable : If strict is set and the plan can't be applied a block at a time.
+        SpacyModelNotFound : If the model is needed but not installed.
+
+        """
+
+        if(isinstance(lines, str)):
+            with open(lines, 'r', encoding='utf-8') as _file:
+                return (yield from self.preprocess_stream(_file, lines_per_block, strict))
+
+        _lines = (_line[:-1] if _line.endswith("\n") else _line for _line in lines)
+
+        if(self.plan.is_blank):
+            yield from _lines
+            return "Skipped", ""
+
+        if(not KairyouClient._is_streamable(self.plan)):
+
+            _message = "The replacement json has rules that can't be applied a block of lines at a time, such as a name in more than one category, so the whole text has to be read first."
+
+            if(strict):
+                raise PlanNotStreamable(_message)
+
+            warnings.warn(_message, KairyouWarning, stacklevel=2)
+
+            _text, _preprocessing_log, _error_log = self.preprocess("\n".join(_lines))
+            yield from _text.split("\n")
+            return _preprocessing_log, _error_log
+
+        _state = _PreprocessingState("")
+
+        _counts = [0] * len(self.plan.ops)
+        _errors = {}
+
+        _time_start = time.time()
+
+        _blocks = iter(lambda: list(itertools.islice(_lines, lines_per_block)), [])
+        _block = next(_blocks, [])
+
+        if(_block == [] or _block == [""]):
+            _next_block = next(_blocks, [])
+
+            if(_next_block == []):
+                raise InvalidPreprocessingText("Text to be preprocessed is empty.")
+
+            _blocks = itertools.chain([_next_block], _blocks)
+
+        _is_first = True
+
+        while(_block):
+
+            _block_state = _PreprocessingState("\n".join(_block))
+
+            if(self.add_closing_period):
+                _block_state.text = KairyouClient._add_missing_periods_to_block(_block_state.text, _is_first)
+
+            self._replace_all(_block_state, _counts, _errors)
+
+            if(self.plan.json_type == "kudasai"):
+                _block_state.text = self._correct_missing_spaces(_block_state.text)
+
+            yield from _block_state.text.split("\n")
+
+            _block = next(_blocks, [])
+            _is_first = False
+
+        self._finish(_state, _counts, _errors, _time_start, postprocess=False)
+
+        return _state.preprocessing_log, _state.error_log
+
+##-------------------start-of-_is_streamable()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def _is_streamable(plan:ReplacementPlan) -> bool:
+
+        """
+
+        Checks if preprocessing a block of lines on its own with the plan gives the same lines as preprocessing the whole text.
+
+        Replacements have to be line local, and no variant can be guarded, as whether one is skipped depends on the whole text.
+        The missing space correction only looks at the text after the first latin character, which is fine as long as every full name it fixes starts with one.
+
+        Parameters:
+        plan (ReplacementPlan) : The plan.
+
+        Returns:
+        bool : True if the text can be preprocessed block by block, False otherwise.
+
+        """
+
+        if(not plan.is_line_local or any(_step.guard is not None for _step in plan.steps)):
+            return False
+
+        if(plan.json_type != "kudasai"):
+            return True
+
+        return all(len(_full_name.split(" ")) == 2 and regex.match(r'\p{Latin}', _full_name) is not None for _full_name in plan.full_names)
+
+##-------------------start-of-_correct_missing_spaces()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _correct_missing_spaces(self, text:str) -> str:
+
+        """
+
+        The missing space correction of _perform_missing_space_correction() for a block of lines.
+
+        A full name with its space missing is all latin, so it always comes after the first latin character, which makes checking for its parts there redundant.
+
+        Parameters:
+        text (str) : The block.
+
+        Returns:
+        text (str) : The block with the missing spaces added.
+
+        """
+
+        for _full_name in self.plan.full_names:
+            _first_name, _last_name = _full_name.split(" ")
+            text = text.replace(_first_name + _last_name, _first_name + " " + _last_name)
+
+        return text
+
+##-------------------start-of-preprocess_incremental()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def preprocess_incremental(self, text_to_preprocess:str, previous_output:str, previous_replacement_json:typing.Union[dict,str,ReplacementPlan]) -> typing.Tuple[str, str, str]:
+
+        """
+
+        Preprocesses a text again after its replacement json changed, keeping the lines of the previous output the change can't make a difference to.
+
+        Only lines containing the japanese of an added, removed or modified entry, or of an entry whose replacement could create one, are preprocessed again, see _get_changed_patterns().
+        That needs both plans to preprocess each line on its own (see _is_streamable()) and to make the replacements they share in the same order, and the previous output to have a line for each line of the text.
+        Otherwise, or if the previous json was blank, this falls back to preprocess().
+
+        The preprocessing log only counts the lines that were preprocessed again, and ends with how many those were.
+
+        Parameters:
+        text_to_preprocess (str) : The original text.
+        previous_output (str) : The text as preprocessed with the previous json, with the same add_closing_period as the client.
+        previous_replacement_json (dict | str | ReplacementPlan) : The json the previous output was made with. Can be a dictionary, a path to a json file, or a plan from Kairyou.compile().
+
+        Returns:
+        text (str) : The preprocessed text.
+        preprocessing_log (str) : The log of replacements made.
+        error_log (str) : The log of errors encountered (if any).
+
+        Raises:
+        InvalidPreprocessingText : If the text to be preprocessed is empty.
+        SpacyModelNotFound : If the model is needed but not installed.
+
+        """
+
+        if(self.plan.is_blank):
+            return text_to_preprocess, "Skipped", ""
+
+        if(len(text_to_preprocess) == 0):
+            raise InvalidPreprocessingText("Text to be preprocessed is empty.")
+
+        previous_replacement_json = _get_replacement_plan(previous_replacement_json)
+
+        _lines = text_to_preprocess.split("\n")
+        _output_lines = previous_output.split("\n")
+
+        _changes = None
+
+        if(not previous_replacement_json.is_blank and len(_lines) == len(_output_lines) and KairyouClient._is_streamable(previous_replacement_json) and KairyouClient._is_streamable(self.plan)):
+            _changes = _get_changed_patterns(previous_replacement_json, self.plan)
+
+        if(_changes is None):
+            _text, _preprocessing_log, _error_log = self.preprocess(text_to_preprocess)
+            return _text, _preprocessing_log + "\nLines Preprocessed : " + str(len(_lines)) + "/" + str(len(_lines)), _error_log
+
+        _time_start = time.time()
+
+        _patterns, _full_names = _changes
+        _matcher = MultiPatternMatcher(_patterns) if _patterns else None
+
+        ## the output only differs from the line before correction by the spaces added, so a full name missing its space there is still in the output without spaces
+        _joined_full_names = ["".join(_full_name.split(" ")) for _full_name in _full_names]
+
+        _indices = []
+        _block = []
+
+        for _index, _line in enumerate(_lines):
+
+            if(self.add_closing_period):
+                _line = KairyouClient._add_missing_periods_to_block(_line, _index == 0)
+
+            if((_matcher is not None and _matcher.search(_line)) or any(_full_name in _output_lines[_index].replace(" ", "") for _full_name in _joined_full_names)):
+                _indices.append(_index)
+                _block.append(_line)
+
+        _counts = [0] * len(self.plan.ops)
+        _errors = {}
+
+        ## each line is preprocessed on its own, so the lines that changed can be preprocessed together whether they are next to each other or not
+        if(_block):
+
+            _block_state = _PreprocessingState("\n".join(_block))
+
+            self._replace_all(_block_state, _counts, _errors)
+
+            if(self.plan.json_type == "kudasai"):
+                _block_state.text = self._correct_missing_spaces(_block_state.text)
+
+            for _index, _line in zip(_indices, _block_state.text.split("\n")):
+                _output_lines[_index] = _line
+
+        _state = _PreprocessingState("\n".join(_output_lines))
+
+        self._finish(_state, _counts, _errors, _time_start, postprocess=False)
+
+        _state.preprocessing_log += "\nLines Preprocessed : " + str(len(_indices)) + "/" + str(len(_lines))
+
+        return _state.text, _state.preprocessing_log, _state.error_log
+
+##-------------------start-of-_preprocess()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _preprocess(self, state:_PreprocessingState) -> None:
+
+        """
+
+        Preprocesses the text of the state in-place. The text is assumed to be non-empty and the plan non-blank.
+
+        Parameters:
+        state (object - _PreprocessingState) : The state of the call.
+
+        """
+
+        if(self.add_closing_period):
+            state.text = KairyouClient._add_missing_periods(state.text)
+
+        _time_start = time.time()
+
+        if(self.line_cache is not None and KairyouClient._is_streamable(self.plan)):
+            _counts, _errors = self._replace_lines(state)
+            self._finish(state, _counts, _errors, _time_start, postprocess=False)
+            return
+
+        _counts, _errors = self._replace_all(state)
+
+        self._finish(state, _counts, _errors, _time_start)
+
+##-------------------start-of-_replace_lines()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _replace_lines(self, state:_PreprocessingState) -> typing.Tuple[typing.List[int], dict]:
+
+        """
+
+        Makes every replacement of the plan line by line, looking each line up in the line cache first and caching the ones that weren't there.
+
+        Only used when the plan preprocesses each line on its own (see _is_streamable()), which is what makes a cached line exact.
+        The missing space correction is part of what is cached, so the text comes out fully postprocessed.
+
+        Parameters:
+        state (object - _PreprocessingState) : The state of the call.
+
+        Returns:
+        counts (list - int) : The replacements made by each op.
+        errors (dict) : Error log entries by op, always empty as plans with such ops aren't preprocessed line by line.
+
+        """
+
+        _cache:LineCache = self.line_cache ## type: ignore (checked by the caller)
+        _fingerprint:str = self._fingerprint ## type: ignore (set alongside the cache)
+
+        _counts = [0] * len(self.plan.ops)
+        _lines = state.text.split("\n")
+
+        for _index, _line in enumerate(_lines):
+
+            _entry = _cache.get(_fingerprint, _line)
+
+            if(_entry is None):
+
+                _line_state = _PreprocessingState(_line, entity_cache=state.entity_cache, cancel_event=state.cancel_event)
+
+                ## a line only touches a few ops, so its counts are kept sparse
+                _line_counts, _ = self._replace_all(_line_state, collections.Counter()) ## type: ignore (indexed the same as a list)
+
+                if(self.plan.json_type == "kudasai"):
+                    _line_state.text = self._correct_missing_spaces(_line_state.text)
+
+                _entry = (_line_state.text, tuple((_op, _count) for _op, _count in _line_counts.items() if _count > 0)) ## type: ignore (a Counter)
+
+                _cache.put(_fingerprint, _line, *_entry)
+
+            _lines[_index] = _entry[0]
+
+            for _op, _count in _entry[1]:
+                _counts[_op] += _count
+
+        state.text = "\n".join(_lines)
+
+        return _counts, {}
+
+##-------------------start-of-_finish()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _finish(self, state:_PreprocessingState, counts:typing.List[int], errors:dict, time_start:float, postprocess:bool = True) -> None:
+
+        """
+
+        Logs the replacements made, then postprocesses the text.
+
+        Parameters:
+        state (object - _PreprocessingState) : The state of the call.
+        counts (list - int) : The replacements made by each op.
+        errors (dict) : Error log entries by op.
+        time_start (float) : When the replacements started.
+        postprocess (bool | optional | default=True) : Whether to postprocess the text, False if it has already been done.
+
+        """
+
+        _replacement_tracker = {
+            'punctuation': {},  ## For kutouten
+            'names': {
+                'base': {},     ## Name without honorific
+                'honorific': {} ## Name with honorific - flat structure
+            },
+            'words': {},       ## Regular words
+            'phrases': {},     ## Multi-word phrases
+            'debug': []        ## Track all operations in order
+        }
+
+        self._log_replacements(state, counts, errors, _replacement_tracker)
+
+        if(postprocess):
+            self._perform_postprocessing(state)
+
+        KairyouClient._print_tracking(_replacement_tracker, state.total_replacements)
+
+        _time_end = time.time()
+
+        state.preprocessing_log += "\nTotal Replacements  : " + \
+            str(state.total_replacements)
+        state.preprocessing_log += "\nTime Elapsed : " + \
+            _get_elapsed_time(time_start, _time_end)
+
+##-------------------start-of-_print_tracking()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def _print_tracking(replacement_tracker:dict, total_replacements:int) -> None:
+
+        """
+
+        Prints the detailed tracking analysis of a preprocess call.
+
+        Parameters:
+        replacement_tracker (dict) : The tracker of the call.
+        total_replacements (int) : The running total of replacements.
+
+        """
+
+        print("\nDetailed Tracking Analysis:")
+        print("--------------------------")
+
+        total = 0
+        for category in ['punctuation', 'words', 'phrases']:
+            if(replacement_tracker[category]):
+                print(f"\n{category.title()}:")
+                cat_total = sum(replacement_tracker[category].values())
+                total += cat_total
+                print(f"Total: {cat_total}")
+                for item, count in replacement_tracker[category].items():
+                    print(f"  {item}: {count}")
+
+        print("\nNames:")
+        name_total = sum(replacement_tracker['names']['base'].values())
+        honorific_total = sum(replacement_tracker['names']['honorific'].values())
+        total += name_total + honorific_total
+        print(f"Base names total: {name_total}")
+        print(f"Honorific names total: {honorific_total}")
+
+        print("\nDetailed name replacements:")
+        for name, count in replacement_tracker['names']['base'].items():
+            print(f"  {name}: {count}")
+            honorifics = {k.replace(name, ''): v
+                         for k, v in replacement_tracker['names']['honorific'].items()
+                         if(k.startswith(name))}
+            if(honorifics):
+                for honorific, hon_count in honorifics.items():
+                    print(f"    with {honorific}: {hon_count}")
+
+        print("\nDebug log:")
+        for entry in replacement_tracker['debug']:
+            print(f"  {entry}")
+
+        print("\nTotals:")
+        print(f"Sum of all tracked replacements: {total}")
+        print(f"Running counter total: {total_replacements}")
+
+##-------------------start-of-_perform_postprocessing()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _perform_postprocessing(self, state:_PreprocessingState) -> None:
+
+        """
+
+        Performs postprocessing on the text after the replacements have been made.
+
+        Parameters:
+        state (object - _PreprocessingState) : The state of the call.
+
+        """
+
+        self._perform_missing_space_correction(state)
+
+##-------------------start-of-_perform_missing_space_correction()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _perform_missing_space_correction(self, state:_PreprocessingState) -> None:
+
+        """
+
+        Sometimes, two individual names maybe be replaced separately, rather than as a single name, leading to a missing space. This function corrects that.
+        Seems to occur rarely, but better to have it than not. Only occurs in Kudasai type jsons.
+
+        Parameters:
+        state (object - _PreprocessingState) : The state of the call.
+
+        """
+
+        if(self.plan.json_type != "kudasai"):
+            return
+
+        english_starts = [match.start() for match in regex.finditer(r'\p{Latin}+', state.text)]
+
+        if(len(english_starts) == 0):
+            return
+
+        full_names = []
+
+        for full_name in self.plan.full_names:
+            first_name, last_name = full_name.split(" ")
+
+            ## putting spaces into a text can't form a name written without its space, so a name that isn't in the text already never changes it
+            if(first_name + last_name in state.text):
+                full_names.append((first_name, last_name))
+
+        ## whether each name is in the text without its space, and where the last occurrence of either of its parts starts,
+        ## which is what checking for both parts after a start comes down to, worked out again only when the text changes
+        _text = None
+        _is_joined:typing.List[bool] = []
+        _last_starts:typing.List[int] = []
+
+        for start in english_starts:
+            for _index, (first_name, last_name) in enumerate(full_names):
+
+                if(state.text is not _text):
+                    _text = state.text
+                    _is_joined = [_first + _last in _text for _first, _last in full_names]
+                    _last_starts = [min(_text.rfind(_first), _text.rfind(_last)) for _first, _last in full_names]
+
+                if(_is_joined[_index] and _last_starts[_index] >= start):
+                    state.text = state.text.replace(first_name + last_name, first_name + " " + last_name)
+
+##-------------------start-of-_replace_all()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _replace_all(self, state:_PreprocessingState, counts:typing.List[int] | None = None, errors:dict | None = None, start:int = 0, end:int | None = None) -> typing.Tuple[typing.List[int], dict]:
+
+        """
+
+        Makes every replacement of the plan, or of a range of its steps.
+
+        Non-katakana replacements come first in rule order, then katakana ones longest first, the plan has already laid them out that way.
+
+        Parameters:
+        state (object - _PreprocessingState) : The state of the call.
+        counts (list - int | optional | default=None) : The replacements made so far by each op, updated in place. Starts from zeroes if None.
+        errors (dict | optional | default=None) : Error log entries by op, updated in place. Starts empty if None.
+        start (int | optional | default=0) : The first step to make.
+        end (int | optional | default=None) : The step to stop before, the last one if None.
+
+        Returns:
+        counts (list - int) : The replacements made by each op.
+        errors (dict) : Error log entries by op.
+
+        """
+
+        ## how many replacements each op of the plan made
+        _counts = counts if counts is not None else [0] * len(self.plan.ops)
+        _errors = errors if errors is not None else {}
+
+        _is_prefetched = False
+
+        ## one scan for what every step looks for, so the steps whose patterns aren't in the text don't each scan it again, see PlanStep
+        _present = self.plan.scanner.find_present(state.text)
+
+        ## the steps that changed the text so far, and whether one without patterns did, after which anything could be in the text
+        _changed:typing.Set[int] = set()
+        _is_scanned = True
+
+        for _index, _step in enumerate(self.plan.steps[start:end], start):
+
+            state.check_cancelled()
+
+            if(_step.guard is not None and self._is_skipped(_step.guard, _counts)):
+                continue
+
+            ## the passes before the first enhanced op are what change most lines (punctuation and so on), so lines are parsed from there on
+            if(_step.kind == "enhanced" and not _is_prefetched):
+                self._prefetch_entities(state, _index, end)
+                _is_prefetched = True
+
+                if(self.parse_once and state.span_index is None):
+                    self._build_span_index(state)
+
+            if(_is_scanned and _step.patterns is not None and _present.isdisjoint(_step.patterns) and _changed.isdisjoint(_step.creators)):
+                continue
+
+            if(_step.kind == "pass"):
+
+                ## once the whole text is parsed, the spans are moved along with every edit
+                _edits = [] if state.span_index is not None else None
+
+                state.text, _pass_counts = _step.replacement_pass.apply(state.text, _edits) ## type: ignore (always set for passes)
+
+                if(_edits):
+                    state.span_index.apply(_edits) ## type: ignore (checked above)
+
+                ## passes can hold thousands of ops, most of which match nothing in a short text
+                if(any(_pass_counts)):
+                    _changed.add(_index)
+
+                    for _op, _count in zip(_step.ops, _pass_counts):
+                        _counts[_op] += _count
+
+            elif(_step.kind == "enhanced"):
+                _op = self.plan.ops[_step.ops[0]]
+
+                if(state.span_index is not None):
+                    _count = self._perform_indexed_replace(state, _op.jap, _op.eng)
+
+                else:
+                    _count = self._perform_enhanced_replace(state, _op.jap, _op.eng)
+
+                _counts[_step.ops[0]] += _count
+
+                if(_count > 0):
+                    _changed.add(_index)
+
+            else:
+                _total = sum(_counts[_op] for _op in _step.ops)
+
+                self._replace_sequentially(state, _step, _counts, _errors)
+
+                if(sum(_counts[_op] for _op in _step.ops) > _total):
+                    _changed.add(_index)
+
+            if(_step.patterns is None and _index in _changed):
+                _is_scanned = False
+
+        return _counts, _errors
+
+##-------------------start-of-_is_skipped()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _is_skipped(self, variant:int, counts:typing.List[int]) -> bool:
+
+        """
+
+        Checks if a name variant has already been replaced under an earlier variant with the same japanese, in which case it is skipped.
+
+        Parameters:
+        variant (int) : The index of the variant.
+        counts (list - int) : The replacements made so far by each op.
+
+        Returns:
+        bool : True if the variant should be skipped, False otherwise.
+
+        """
+
+        _variants = self.plan.variants
+
+        return any(not _variants[_earlier].unlogged and sum(counts[_op] for _op in _variants[_earlier].ops) > 0
+                   for _earlier in _variants[variant].guard)
+
+##-------------------start-of-_replace_sequentially()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _replace_sequentially(self, state:_PreprocessingState, step:PlanStep, counts:typing.List[int], errors:dict) -> None:
+
+        """
+
+        Makes the replacements of a sequential or category step one at a time, for replacements that aren't strings.
+
+        Parameters:
+        state (object - _PreprocessingState) : The state of the call.
+        step (object - PlanStep) : The step.
+        counts (list - int) : The replacements made so far by each op, updated in place.
+        errors (dict) : Error log entries by op, updated in place.
+
+        """
+
+        for _op in step.ops:
+
+            _jap, _eng = self.plan.ops[_op].jap, self.plan.ops[_op].eng
+
+            try:
+                _num_occurrences = state.text.count(_jap)
+
+                if(_num_occurrences > 0):
+                    _text = state.text
+                    state.text = state.text.replace(_jap, _eng)
+
+                    if(state.span_index is not None):
+                        state.span_index.apply(_find_literal(_text, _jap, len(_eng)))
+
+                counts[_op] += _num_occurrences
+
+            except Exception as _e:
+
+                if(step.kind == "category"):
+                    errors[_op] = "Issue with the following key : " + str(step.json_key) + "\n" + "Error is as follows : " + str(_e)
+                    break
+
+                errors[_op] = "Issue with the word : " + _jap + "\n" + "Error is as follows : " + str(_e)
+
+##-------------------start-of-_log_replacements()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _log_replacements(self, state:_PreprocessingState, counts:typing.List[int], errors:dict, tracker=None) -> None:
+
+        """
+
+        Writes the replacements made to the logs and the tracker, in the order they were made.
+
+        Parameters:
+        state (object - _PreprocessingState) : The state of the call.
+        counts (list - int) : The replacements made by each op.
+        errors (dict) : Error log entries by op.
+        tracker (dict | optional | default=None) : A dictionary to track the replacements.
+
+        """
+
+        _plan = self.plan
+
+        state.total_replacements += sum(counts)
+
+        for _kind, _value in _plan.entries:
+
+            if(_kind == "error"):
+                state.error_log += _value
+                continue
+
+            if(_kind == "op"):
+
+                if(_value in errors):
+                    state.error_log += errors[_value]
+
+                _jap, _eng, _num_replacements = _plan.ops[_value].jap, _plan.ops[_value].eng, counts[_value]
+
+                if(_num_replacements > 0):
+                    self._track_replacement(_jap, _num_replacements, is_potential_name=False, tracker=tracker)
+
+                    state.preprocessing_log += str(_jap) + " → " + str(
+                        _eng) + " : " + str(_num_replacements) + "\n"
+
+                continue
+
+            _variant = _plan.variants[_value]
+            _replacement_data = dict()
+
+            for _op in _variant.ops:
+
+                _count = counts[_op]
+
+                if(_count == 0):
+                    continue
+
+                if(_plan.ops[_op].kind == "honorific"):
+                    if(tracker is not None):
+                        tracker['names']['honorific'][_plan.ops[_op].jap] = _count
+                        tracker['debug'].append(f"Name with honorific: {_plan.ops[_op].jap} → {_plan.ops[_op].eng} ({_count})")
+                    _replacement_data[_plan.ops[_op].honorific] = _count
+
+                else:
+                    if(_plan.ops[_op].kind == "enhanced"):
+                        if(tracker is not None):
+                            tracker['names']['base'][_variant.jap] = tracker['names']['base'].get(_variant.jap, 0) + _count
+                    else:
+                        self._track_replacement(_variant.jap, _count, is_potential_name=True, tracker=tracker)
+
+                    _replacement_data['NA'] = _count
+
+            ## Sum and log
+            _total = sum(_replacement_data.values())
+            if(_total > 0 and not _variant.unlogged):
+                state.preprocessing_log += f'{_variant.eng} : {_total} ('
+                state.preprocessing_log += ', '.join(
+                    [f'{_key}-{_value}' for _key, _value in _replacement_data.items()]) + ')\n'
+
+##-------------------start-of-_track_replacement()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _track_replacement(self, word:str, num_occurrences:int, is_potential_name:bool, tracker=None) -> None:
+
+        """
+
+        Records a replacement in the tracker under the category it belongs to.
+
+        Parameters:
+        word (string) : The word that was replaced.
+        num_occurrences (int) : How many times it was replaced.
+        is_potential_name (bool) : Indicates if the word is a potential name.
+        tracker (dict | optional | default=None) : A dictionary to track the replacements.
+
+        """
+
+        if(tracker is None):
+            return
+
+        if(word in self.plan.kutouten):
+            tracker['punctuation'][word] = tracker['punctuation'].get(word, 0) + num_occurrences
+        elif(' ' in word):  ## Multi-word phrase
+            tracker['phrases'][word] = tracker['phrases'].get(word, 0) + num_occurrences
+        elif(is_potential_name):
+            tracker['names']['base'][word] = tracker['names']['base'].get(word, 0) + num_occurrences
+        else:
+            tracker['words'][word] = tracker['words'].get(word, 0) + num_occurrences
+
+##-------------------start-of-_perform_enhanced_replace()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _perform_enhanced_replace(self, state:_PreprocessingState, jap:str, replacement:str) -> int:
+        """
+
+        Uses NER (Named Entity Recognition) from the spacy module to replace names that need to be more carefully replaced, such as single kanji, katakana names, or those placed in the user whitelist.
+
+        May miss true positives, but should not replace false positives.
+
+        A line is only parsed once for all the enhanced replacements, the spans left over are shifted past the replacements made and kept for the next one, see _get_person_spans().
+
+        Parameters:
+        state (object - _PreprocessingState) : The state of the call.
+        jap (str) : Japanese to be replaced.
+        replacement (str) : The replacement for the Japanese
+
+        Returns:
+        jap_replace_count (int) : How many japanese replacements that were made.
+
+        """
+
+        _jap_replace_count = 0
+
+        _jap_lines = state.text.split('\n')
+
+        for i, _line in enumerate(_jap_lines):
+
+            if(jap not in _line):
+                continue
+
+            state.check_cancelled()
+
+            _pieces = []
+            _kept_spans = []
+            _last_end = 0
+            _shift = 0
+
+            for _span in self._get_person_spans(state, i, _line):
+
+                if(_span.text == jap):
+                    _jap_replace_count += 1
+                    _pieces.append(_line[_last_end:_span.start_char] + replacement)
+                    _last_end = _span.end_char
+                    _shift += len(replacement) - len(jap)
+
+                else:
+                    _kept_spans.append(_span._replace(start_char=_span.start_char + _shift, end_char=_span.end_char + _shift))
+
+            if(_pieces):
+                _line = "".join(_pieces) + _line[_last_end:]
+                _jap_lines[i] = _line
+
+            state.entity_index[i] = (_line, tuple(_kept_spans))
+
+        state.text = '\n'.join(_jap_lines)
+
+        return _jap_replace_count
+
+##-------------------start-of-_perform_indexed_replace()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _perform_indexed_replace(self, state:_PreprocessingState, jap:str, replacement:str) -> int:
+
+        """
+
+        Replaces the PERSON spans of the span index whose text is the japanese, the enhanced replacement of a client that parses the text once.
+
+        Parameters:
+        state (object - _PreprocessingState) : The state of the call, with its span index built.
+        jap (str) : The japanese to replace.
+        replacement (str) : The replacement for the japanese.
+
+        Returns:
+        jap_replace_count (int) : How many japanese replacements that were made.
+
+        """
+
+        state.check_cancelled()
+
+        _index:_SpanIndex = state.span_index ## type: ignore (checked by the caller)
+        _spans = _index.find(jap)
+
+        if(not _spans):
+            return 0
+
+        _pieces = []
+        _edits = []
+        _last_end = 0
+
+        for _span in _spans:
+            _start, _end = _index.starts[_span], _index.ends[_span]
+            _pieces.append(state.text[_last_end:_start] + replacement)
+            _edits.append((_start, _end, len(replacement)))
+            _last_end = _end
+
+        state.text = "".join(_pieces) + state.text[_last_end:]
+
+        _index.drop(_spans)
+        _index.apply(_edits)
+
+        return len(_spans)
+
+##-------------------start-of-_build_span_index()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _build_span_index(self, state:_PreprocessingState) -> None:
+
+        """
+
+        Builds the span index of the call from the PERSON spans of every line the prefetch parsed, moving them to where they are in the whole text.
+
+        From then on the spans are moved along with every replacement, and a span a replacement touches is dropped, so no line is parsed again.
+        Unlike parsing a changed line again, a name a replacement creates or changes the context of is not looked at anew.
+
+        Parameters:
+        state (object - _PreprocessingState) : The state of the call, just after the prefetch.
+
+        """
+
+        _spans = []
+        _offset = 0
+
+        for _line_number, _line in enumerate(state.text.split("\n")):
+
+            _entry = state.entity_index.get(_line_number)
+
+            if(_entry is not None and _entry[0] == _line):
+                _spans.extend(_span._replace(start_char=_span.start_char + _offset, end_char=_span.end_char + _offset) for _span in _entry[1])
+
+            _offset += len(_line) + 1
+
+        state.span_index = _SpanIndex(_spans)
+
+##-------------------start-of-_get_person_spans()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _get_person_spans(self, state:_PreprocessingState, line_number:int, line:str) -> typing.Tuple[Entity, ...]:
+
+        """
+
+        Gets the PERSON entities of a line, from the entity index of the call if the line hasn't changed since an earlier enhanced replacement saw it.
+        If anything else changed the line since, the spans can't be trusted, and it is parsed again.
+
+        Parameters:
+        state (object - _PreprocessingState) : The state of the call.
+        line_number (int) : The number of the line in the text.
+        line (str) : The line as it is now.
+
+        Returns:
+        spans (tuple - Entity) : The PERSON entities of the line, in order.
+
+        """
+
+        _entry = state.entity_index.get(line_number)
+
+        if(_entry is not None and _entry[0] == line):
+            return _entry[1]
+
+        return KairyouClient._get_persons(self._get_entities(state, line))
+
+##-------------------start-of-_get_entities()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _get_entities(self, state:_PreprocessingState, line:str) -> typing.Tuple[Entity, ...]:
+
+        """
+
+        Gets the entities NER finds in a line, from the entity cache of the call if it has already been parsed.
+
+        Parameters:
+        state (object - _PreprocessingState) : The state of the call.
+        line (str) : The line to parse.
+
+        Returns:
+        entities (tuple - Entity) : The entities in the line, in order.
+
+        """
+
+        _entities = state.entity_cache.get(line) if state.entity_cache is not None else None
+
+        if(_entities is not None):
+            return _entities
+
+        _entities = self._ner_runner.parse(self.ner, line)
+
+        if(state.entity_cache is not None):
+            state.entity_cache.put(line, _entities)
+
+        return _entities
+
+##-------------------start-of-_prefetch_entities()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _prefetch_entities(self, state:_PreprocessingState, start:int, end:int | None) -> None:
+
+        """
+
+        Finds every line containing the japanese of an enhanced op of a range of steps in one scan, and parses them all in one batch, filling the entity index of the call.
+
+        A line that changes before its enhanced op gets to it is parsed again then, see _get_person_spans().
+
+        Parameters:
+        state (object - _PreprocessingState) : The state of the call.
+        start (int) : The first step of the range.
+        end (int | None) : The step to stop before, the last one if None.
+
+        """
+
+        _key = (start, end)
+
+        if(_key not in self._enhanced_matchers):
+            self._enhanced_matchers[_key] = MultiPatternMatcher(self.plan.ops[_step.ops[0]].jap for _step in self.plan.steps[start:end] if _step.kind == "enhanced")
+
+        _matcher = self._enhanced_matchers[_key]
+
+        ## the line numbers of each distinct line to parse
+        _to_parse:typing.Dict[str, typing.List[int]] = {}
+
+        for _line_number, _line in enumerate(state.text.split("\n")):
+
+            if(not _matcher.search(_line)):
+                continue
+
+            _entry = state.entity_index.get(_line_number)
+
+            if(_entry is not None and _entry[0] == _line):
+                continue
+
+            _entities = state.entity_cache.get(_line) if state.entity_cache is not None else None
+
+            if(_entities is not None):
+                state.entity_index[_line_number] = (_line, KairyouClient._get_persons(_entities))
+                continue
+
+            _to_parse.setdefault(_line, []).append(_line_number)
+
+        ## nothing to parse, so no reason to load the model
+        if(not _to_parse):
+            return
+
+        for _line, _entities in zip(_to_parse, self._ner_runner.pipe(self.ner, list(_to_parse))):
+
+            state.check_cancelled()
+
+            if(state.entity_cache is not None):
+                state.entity_cache.put(_line, _entities)
+
+            for _line_number in _to_parse[_line]:
+                state.entity_index[_line_number] = (_line, KairyouClient._get_persons(_entities))
+
+##-------------------start-of-_get_persons()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def _get_persons(entities:typing.Tuple[Entity, ...]) -> typing.Tuple[Entity, ...]:
+
+        """
+
+        Keeps the PERSON entities.
+
+        Parameters:
+        entities (tuple - Entity) : The entities.
+
+        Returns:
+        persons (tuple - Entity) : The PERSON entities, in order.
+
+        """
+
+        return tuple(_entity for _entity in entities if _entity.label == "PERSON")
+
+##-------------------start-of-_add_missing_periods()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def _add_missing_periods(text:str) -> str:
+        """
+        Adds closing periods before 」 where no punctuation is present.
+        Must be called before any replacements occur.
+
+        Parameters:
+        text (str): The text to process
+
+        Returns:
+        str: The processed text with periods added where needed
+        """
+        pattern = r'([^。！？\.\!\?])」'
+        return regex.sub(pattern, r'\1。」', text)
+
+##-------------------start-of-_add_missing_periods_to_block()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def _add_missing_periods_to_block(text:str, is_first:bool) -> str:
+
+        """
+
+        Adds closing periods to a block of lines, the same as _add_missing_periods() would as part of the whole text.
+
+        In the whole text, a 」 starting a block is preceded by a line break, which counts as missing punctuation.
+
+        Parameters:
+        text (str) : The block.
+        is_first (bool) : Whether this is the first block of the text.
+
+        Returns:
+        text (str) : The block with periods added where needed.
+
+        """
+
+        if(not is_first and text.startswith("」")):
+            return "。」" + KairyouClient._add_missing_periods(text[1:])
+
+        return KairyouClient._add_missing_periods(text)
+
+##-------------------start-of-_init_worker()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+## The client of a worker process of preprocess_parallel() or preprocess_chunked(), and the NER results it has seen so far, bounded as the process lives as long as the pool.
+_worker_client:KairyouClient | None = None
+_worker_entity_cache:_EntityCache = _EntityCache()
+
+def _init_worker(plan:ReplacementPlan, add_closing_period:bool, backend:NERBackend | None, parse_once:bool, ner_chunk_size:int | None, entity_cache_size:int = 100000) -> None:
+
+    """
+
+    Sets up a worker process. Runs once per process, so the plan is only sent once and the model is only loaded once.
+
+    Parameters:
+    plan (ReplacementPlan) : The plan of the client.
+    add_closing_period (bool) : Whether to add closing periods (。) before 」 where missing.
+    backend (NERBackend | None) : The NER backend of the client. If None, the worker loads the default spacy model.
+    parse_once (bool) : Whether the client parses the text once, see KairyouClient.
+    ner_chunk_size (int | None) : The longest line the client parses whole, see KairyouClient.
+    entity_cache_size (int | optional | default=100000) : How many lines' NER results the process remembers, see _EntityCache.
+
+    """
+
+    global _worker_client, _worker_entity_cache
+
+    _worker_client = KairyouClient(plan, ner=backend, add_closing_period=add_closing_period, parse_once=parse_once, ner_chunk_size=ner_chunk_size)
+    _worker_entity_cache = _EntityCache(entity_cache_size)
+
+##-------------------start-of-_preprocess_in_worker()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def _preprocess_in_worker(text:str) -> typing.Tuple[str, str, str]:
+
+    """
+
+    Preprocesses a whole text in a worker process.
+
+    Parameters:
+    text (str) : The text to be preprocessed.
+
+    Returns:
+    tuple (str, str, str) : The preprocessed text, preprocessing log, and error log.
+
+    """
+
+    if(len(text) == 0):
+        raise InvalidPreprocessingText("Text to be preprocessed is empty.")
+
+    _state = _PreprocessingState(text, entity_cache=_worker_entity_cache)
+
+    _worker_client._preprocess(_state) ## type: ignore (set by _init_worker)
+
+    return _state.text, _state.preprocessing_log, _state.error_log
+
+##-------------------start-of-_replace_in_worker()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def _replace_in_worker(chunk:str, start:int, end:int, counts_so_far:typing.Dict[int, int]) -> typing.Tuple[str, typing.Dict[int, int], dict]:
+
+    """
+
+    Makes the replacements of a range of steps in a chunk of lines, in a worker process.
+
+    Parameters:
+    chunk (str) : The chunk.
+    start (int) : The first step to make.
+    end (int) : The step to stop before.
+    counts_so_far (dict - int) : The replacements made in the whole text by the steps before, only for ops that made any. Decides which guarded variants are skipped.
+
+    Returns:
+    chunk (str) : The chunk with the replacements made.
+    counts (dict - int) : The replacements made in the chunk by each op, only for ops that made any.
+    errors (dict) : Error log entries by op.
+
+    """
+
+    _state = _PreprocessingState(chunk, entity_cache=_worker_entity_cache)
+
+    _counts = [0] * len(_worker_client.plan.ops) ## type: ignore (set by _init_worker)
+
+    for _op, _count in counts_so_far.items():
+        _counts[_op] = _count
+
+    _counts, _errors = _worker_client._replace_all(_state, counts=_counts, start=start, end=end) ## type: ignore (set by _init_worker)
+
+    return _state.text, {_op: _count - counts_so_far.get(_op, 0) for _op, _count in enumerate(_counts) if _count > counts_so_far.get(_op, 0)}, _errors
@@ -108,4 +108,31 @@ class InvalidPreprocessingText(KairyouException):
 
     def __init__(self, message:str):
         
-        super().__init__(message)
\ No newline at end of file
+        super().__init__(message)
+
+##-------------------start-of-PlanNotStreamable---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class PlanNotStreamable(KairyouException):
+
+    """
+
+    Exception raised when a text is streamed with strict set, but the replacement json can't be applied a block of lines at a time.
+
+    """
+
+##-------------------start-of-__init__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__(self, message:str):
+
+        super().__init__(message)
+
+##-------------------start-of-KairyouWarning---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class KairyouWarning(UserWarning):
+
+    """
+
+    Warning raised when something asked of Kairyou can't be done the way it was asked, such as a line cache given with a plan that needs the whole text.
+    The text is still preprocessed, and comes out the same.
+
+    """
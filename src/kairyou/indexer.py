@@ -3,8 +3,13 @@
 ## license that can be found in the LICENSE file.
 
 ## built-in libraries
+from concurrent.futures import CancelledError
+import collections
+import hashlib
 import os
 import typing
+import threading
+import warnings
 import json
 import time
 
@@ -14,8 +19,13 @@ import spacy
 ## custom modules
 from .util import _validate_replacement_json, _get_elapsed_time
 from .katakana_util import KatakanaUtil
-from .types import NameAndOccurrence
-from .exceptions import InvalidReplacementJsonPath, SpacyModelNotFound
+from .types import NameAndOccurrence, KnowledgeBaseIndex, LineCacheStats
+from .ner import NERRunner, _as_backend
+from .matcher import ContainmentMatcher
+from .cache import NERCache, KnowledgeBaseCache
+from .backends import NERBackend
+from .models import ModelManager
+from .exceptions import InvalidReplacementJsonPath, KairyouWarning
 
 class Indexer:
 
@@ -23,104 +33,109 @@ class Indexer:
 
     The global Indexer client for indexing names.
 
-    """
-
-    _replacement_json:dict
+    Every index() call runs in an IndexerSession of its own, so nothing one call reads or finds is carried over to the next. Use an IndexerSession directly to index many texts in a long-running process.
 
-    _json_type:typing.Literal["kudasai", "fukuin"]
-
-    _text_to_index:str
+    """
 
+    ## The log of the last index() call
     indexing_log = ""
 
-    _knowledge_base:typing.List[str] = []
+    ## How much of a knowledge base file is read from disk at a time
+    _read_buffer_size:int = 1024 * 1024
 
-    _blacklisted_names:typing.List[str] = []
-
-    ## dict of entity labels and their occurrences
+    ## dict of entity labels and their occurrences, in the last index() call
     _entity_occurrences:dict = {}
 
-    _ner:spacy.language.Language | None = None
+    _ner:spacy.language.Language | NERBackend | None = None
+
+##-------------------start-of-_read_knowledge_base()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
-##-------------------start-of-load_static_data()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-    
     @staticmethod
-    def _load_static_data(text_to_index:str, knowledge_base:str, replacement_json:typing.Union[str, dict]) -> None:
-        
+    def _read_knowledge_base(knowledge_base:str) -> typing.Generator[str, None, None]:
+
         """
-        
-        Loads static data into the Indexer class.
+
+        Reads the knowledge base a line at a time, so a knowledge base of many large files is never held in memory as a whole.
+
+        The lines of each file are the same as splitting its whole text on newlines would give.
 
         Parameters:
-        text_to_index (str) : The text to index. Can be a path to a text file, or just the text itself.
         knowledge_base (str) : The knowledge base. Can be a path to a directory containing text files, a path to a text file, or just the text itself.
-        replacement_json (str) : The replacement json. Can be a path to a json, or as the json itself.
+
+        Returns:
+        line (str) : Each line of each file of the knowledge base, or of the knowledge base itself.
 
         """
 
-        ## text_to_index can be sent in a path to a text file, or just the text itself
-        if(os.path.exists(text_to_index)):
-            with open(text_to_index, "r", encoding="utf-8") as file:
-                Indexer._text_to_index = file.read()
+        ## knowledge_base can be sent in a path to a directory containing text files, a path to a text file, or just the text itself
+        if(not os.path.exists(knowledge_base)):
+            yield from knowledge_base.split("\n")
+            return
 
-        else:
-            Indexer._text_to_index = text_to_index
+        for _path in Indexer._get_knowledge_base_files(knowledge_base):
 
-        ## knowledge_base can be sent in a path to a directory containing text files, a path to a text file, or just the text itself            
-        if(os.path.exists(knowledge_base)):
-            if(os.path.isdir(knowledge_base)):
-                for file in os.listdir(knowledge_base):
-                    if(file.endswith(".txt")):
-                      with open(os.path.join(knowledge_base, file), "r", encoding="utf-8") as file:
-                          Indexer._knowledge_base.append(file.read())
-            else:
-                with open(knowledge_base, "r", encoding="utf-8") as file:
-                    Indexer._knowledge_base.append(file.read())
+            with open(_path, "r", encoding="utf-8", buffering=Indexer._read_buffer_size) as file:
 
-        else:
-            Indexer._knowledge_base.append(knowledge_base)
+                _ends_with_newline = True
 
-        ## replacement_json can be sent in a path to a json, or as the json itself
-        if(isinstance(replacement_json, str)):
+                for _line in file:
+                    _ends_with_newline = _line.endswith("\n")
+                    yield _line[:-1] if _ends_with_newline else _line
 
-            try:
-                ## Try to load the string as JSON
-                Indexer._replacement_json = json.loads(replacement_json)
+                ## splitting gives an empty last line after a final newline, and for an empty file
+                if(_ends_with_newline):
+                    yield ""
+
+##-------------------start-of-_get_knowledge_base_files()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def _get_knowledge_base_files(knowledge_base:str) -> typing.List[str]:
+
+        """
+
+        Gets the files of a knowledge base that is a path.
+
+        Parameters:
+        knowledge_base (str) : A path to a directory containing text files, or a path to a text file.
+
+        Returns:
+        paths (list - str) : The text files in the directory, or the file itself.
+
+        """
+
+        if(os.path.isdir(knowledge_base)):
+            return [os.path.join(knowledge_base, file) for file in os.listdir(knowledge_base) if file.endswith(".txt")]
+
+        return [knowledge_base]
 
-            except json.JSONDecodeError:
-                ## If it fails, treat the string as a file path
-                if(os.path.isfile(replacement_json)):
-                    with open(replacement_json, "r", encoding="utf-8") as file:
-                        Indexer._replacement_json = json.load(file)
-                else:
-                    raise InvalidReplacementJsonPath(replacement_json)
-        else:
-            Indexer._replacement_json = replacement_json
-                        
 ##-------------------start-of-_get_names_from_replacement_json()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
     @staticmethod
-    def _get_names_from_replacement_json() -> typing.List[str]:
+    def _get_names_from_replacement_json(replacement_json:dict) -> typing.Tuple[typing.List[str], typing.Literal["kudasai", "fukuin"]]:
 
         """
-        
+
         Fetches all names from the replacement json and returns them as a list.
 
+        Parameters:
+        replacement_json (dict) : The replacement json.
+
         Returns:
         list (str) : A list of names from the replacement json.
+        json_type (str) : The type of the replacement json, "kudasai" or "fukuin".
 
         """
 
         _entries = []
 
-        Indexer._json_type, _ = _validate_replacement_json(Indexer._replacement_json)
+        _json_type, _ = _validate_replacement_json(replacement_json)
 
-        if(Indexer._json_type == "kudasai"):
+        if(_json_type == "kudasai"):
 
             _key_to_fetch_from = ["single_names", "full_names"]
 
         else:
-            
+
             _key_to_fetch_from = ["names", "single-names", "full-names"]
 
         for _key in _key_to_fetch_from:
@@ -128,7 +143,7 @@ class Indexer:
             ## entries can sometimes look like ("Yamanaka Ikuko": ["山中","郁子"])
             ## so we need to split the japanese names and add them to the list
 
-            _entry = Indexer._replacement_json.get(_key, [])
+            _entry = replacement_json.get(_key, [])
 
             if(isinstance(_entry, tuple) or isinstance(_entry, list)):
 
@@ -137,7 +152,7 @@ class Indexer:
                     _entries.append(_name)
 
             elif(isinstance(_entry, dict)):
-                
+
                 for _name in _entry.values():
 
                     _entries.extend(_name if isinstance(_name, list) else [_name])
@@ -146,73 +161,17 @@ class Indexer:
 
                 _entries.append(_entry)
 
-        return list(set(_entries))        
+        return list(set(_entries)), _json_type
 
-##-------------------start-of-_get_names_from_all_sources()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+##-------------------start-of-_perform_further_elimination()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
     @staticmethod
-    def _get_names_from_all_sources() -> typing.Tuple[typing.List[NameAndOccurrence], typing.List[NameAndOccurrence], typing.List[NameAndOccurrence]]:
-        
-        """
-        
-        Fetches all names from the knowledge base, text to index, and replacement json and returns them as a list.
-
-        Returns:
-        names_in_knowledge_base (NameAndOccurrence): A list of names from the knowledge base.
-        names_in_text_to_index (NameAndOccurrence): A list of names from the text to index.
-        names_in_replacement_json (NameAndOccurrence): A list of names from the replacement json.
+    def _perform_further_elimination(names_in_knowledge_base:typing.List[NameAndOccurrence],
+                                    names_in_text_to_index:typing.List[NameAndOccurrence],
+                                    names_in_replacement_json:typing.List[NameAndOccurrence]) -> typing.Tuple[typing.List[NameAndOccurrence], typing.List[NameAndOccurrence], typing.List[NameAndOccurrence]]:
 
         """
 
-        _names_in_knowledge_base = []
-        _names_in_text_to_index = []
-        _names_in_replacement_json = [NameAndOccurrence(_name, 1) for _name in Indexer._get_names_from_replacement_json()]
-
-        _name_occurrences = {}
-        for _entry in Indexer._knowledge_base:
-            _entry = _entry.split("\n")
-            for _line in _entry:
-                assert Indexer._ner is not None, "Indexer._ner is None. Please ensure that the NER object is loaded before calling this method."
-                _sentence = Indexer._ner(_line)
-                for _entity in _sentence.ents:
-
-                    if(_entity.text in Indexer._blacklisted_names):
-                        continue
-
-                    ## log label and occurrence
-                    Indexer._entity_occurrences[_entity.label_] = Indexer._entity_occurrences.get(_entity.label_, 0) + 1
-
-                    if(_entity.label_ == "PERSON"):
-                        _name_occurrences[_entity.text] = _name_occurrences.get(_entity.text, 0) + 1
-                        _names_in_knowledge_base.append(NameAndOccurrence(_entity.text, _name_occurrences[_entity.text]))
-
-        _name_occurrences = {}
-        for _entry in Indexer._text_to_index.split("\n"):
-            assert Indexer._ner is not None, "Indexer._ner is None. Please ensure that the NER object is loaded before calling this method."
-            _sentence = Indexer._ner(_entry)
-            for _entity in _sentence.ents:
-
-                if(_entity.text in Indexer._blacklisted_names):
-                    continue
-
-                ## log label and occurrence
-                Indexer._entity_occurrences[_entity.label_] = Indexer._entity_occurrences.get(_entity.label_, 0) + 1
-
-                if(_entity.label_ == "PERSON"):
-                    _name_occurrences[_entity.text] = _name_occurrences.get(_entity.text, 0) + 1
-                    _names_in_text_to_index.append(NameAndOccurrence(_entity.text, _name_occurrences[_entity.text]))
-
-        return _names_in_knowledge_base, _names_in_text_to_index, _names_in_replacement_json
-    
-##-------------------start-of-_perform_further_elimination()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-    
-    @staticmethod
-    def _perform_further_elimination(names_in_knowledge_base:typing.List[NameAndOccurrence], 
-                                    names_in_text_to_index:typing.List[NameAndOccurrence], 
-                                    names_in_replacement_json:typing.List[NameAndOccurrence]) -> typing.Tuple[typing.List[NameAndOccurrence], typing.List[NameAndOccurrence], typing.List[NameAndOccurrence]]:
-        
-        """
-        
         Performs further elimination of names.
 
         Elimination Criteria:
@@ -234,40 +193,42 @@ class Indexer:
         """
 
         _names_in_knowledge_base = [_name for _name in names_in_knowledge_base if not (
-                                                KatakanaUtil.is_more_punctuation_than_japanese(_name.name) or 
-                                                KatakanaUtil.is_actual_word(_name.name) or 
+                                                KatakanaUtil.is_more_punctuation_than_japanese(_name.name) or
+                                                KatakanaUtil.is_actual_word(_name.name) or
                                                 KatakanaUtil.is_partially_english(_name.name) or
                                                 KatakanaUtil.is_repeating_sequence(_name.name))]
-        
+
         _names_in_text_to_index = [_name for _name in names_in_text_to_index if not (
-                                                KatakanaUtil.is_more_punctuation_than_japanese(_name.name) or 
-                                                KatakanaUtil.is_actual_word(_name.name) or 
+                                                KatakanaUtil.is_more_punctuation_than_japanese(_name.name) or
+                                                KatakanaUtil.is_actual_word(_name.name) or
                                                 KatakanaUtil.is_partially_english(_name.name) or
                                                 KatakanaUtil.is_repeating_sequence(_name.name))]
-        
+
         _names_in_replacement_json = [_name for _name in names_in_replacement_json if not (
-                                                KatakanaUtil.is_more_punctuation_than_japanese(_name.name) or 
-                                                KatakanaUtil.is_actual_word(_name.name) or 
+                                                KatakanaUtil.is_more_punctuation_than_japanese(_name.name) or
+                                                KatakanaUtil.is_actual_word(_name.name) or
                                                 KatakanaUtil.is_partially_english(_name.name) or
                                                 KatakanaUtil.is_repeating_sequence(_name.name))]
 
         return _names_in_knowledge_base, _names_in_text_to_index, _names_in_replacement_json
-    
+
 ##-------------------start-of-trim_honorifics()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-    
+
     @staticmethod
-    def _trim_honorifics(names_in_knowledge_base:typing.List[NameAndOccurrence], 
-                        names_in_text_to_index:typing.List[NameAndOccurrence], 
-                        names_in_replacement_json:typing.List[NameAndOccurrence]) -> typing.Tuple[typing.List[NameAndOccurrence], typing.List[NameAndOccurrence], typing.List[NameAndOccurrence]]:
-        
+    def _trim_honorifics(names_in_knowledge_base:typing.List[NameAndOccurrence],
+                        names_in_text_to_index:typing.List[NameAndOccurrence],
+                        names_in_replacement_json:typing.List[NameAndOccurrence],
+                        replacement_json:dict) -> typing.Tuple[typing.List[NameAndOccurrence], typing.List[NameAndOccurrence], typing.List[NameAndOccurrence]]:
+
         """
-        
+
         Trims honorifics from names.
 
         Parameters:
         names_in_knowledge_base (NameAndOccurrence): A list of names from the knowledge base.
         names_in_text_to_index (NameAndOccurrence): A list of names from the text to index.
         names_in_replacement_json (NameAndOccurrence): A list of names from the replacement json.
+        replacement_json (dict): The replacement json, which has the honorifics.
 
         Returns:
         names_in_knowledge_base (NameAndOccurrence): A list of names from the knowledge base.
@@ -277,7 +238,7 @@ class Indexer:
         """
 
         ## both kudasai and fukuin jsons have honorifics
-        _honorifics = Indexer._replacement_json.get('honorifics', [])
+        _honorifics = replacement_json.get('honorifics', [])
 
         for _honorific in _honorifics:
             _names_in_knowledge_base = [NameAndOccurrence(_name.name.replace(_honorific, ""), _name.occurrence) for _name in names_in_knowledge_base]
@@ -285,103 +246,862 @@ class Indexer:
             _names_in_replacement_json = [NameAndOccurrence(_name.name.replace(_honorific, ""), _name.occurrence) for _name in names_in_replacement_json]
 
         return _names_in_knowledge_base, _names_in_text_to_index, _names_in_replacement_json
-    
+
 ##-------------------start-of-is_name_in_other_sources()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
     @staticmethod
-    def _is_name_in_other_sources(name:str, all_names:typing.Set[str]) -> bool:
+    def _is_name_in_other_sources(name:str, all_names:ContainmentMatcher) -> bool:
 
         """
 
-        Checks if a name is in the knowledge base or replacement json.
+        Checks if a name is in the knowledge base or replacement json, that is if any of their names occurs in it.
 
         Parameters:
         name (str): The name to check.
-        all_names (set): A set of all names.
+        all_names (ContainmentMatcher): A matcher of all the names, so the check is a single scan of the name however many names there are.
 
         Returns:
         bool: True if the name is in the knowledge base or replacement json, False otherwise.
 
         """
 
-        return any(_other_name in name for _other_name in all_names)
-    
+        return all_names.search(name)
+
 ##-------------------start-of-index()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
     @staticmethod
-    def index(text_to_index:str, 
-              knowledge_base:str, 
+    def index(text_to_index:str,
+              knowledge_base:str | KnowledgeBaseIndex,
               replacement_json:typing.Union[str, dict],
               blacklist:typing.List[str] = [],
-              discard_ner_objects:bool = True
+              discard_ner_objects:bool = True,
+              ner_batch_size:int = 256,
+              ner_n_process:int = 1,
+              ner_cache:NERCache | None = None,
+              backend:NERBackend | None = None,
+              ner_chunk_size:int | None = 2000,
+              knowledge_base_cache:KnowledgeBaseCache | None = None
               ) -> typing.Tuple[typing.List[NameAndOccurrence], str]:
 
         """
-        
+
         Determines which names in the text to index are not in the knowledge base or replacement json and returns them as a list of NameAndOccurrence named tuples.
 
         Returns a tuple of tuples. That tuple has the name itself and the occurrence of the name that was flagged.
 
         Parameters:
         text_to_index (str) : The text to index. Can be a path to a text file, or just the text itself.
-        knowledge_base (str) : The knowledge base. Can be a path to a directory containing text files, a path to a text file, or just the text itself.
+        knowledge_base (str | KnowledgeBaseIndex) : The knowledge base. Can be a path to a directory containing text files, a path to a text file, or just the text itself. Or an index from build_knowledge_base_index(), in which case the knowledge base isn't parsed at all. A KairyouWarning is given if the index was built with another model than the backend's.
         replacement_json (str) : The replacement json. Can be a path to a json, or as the json itself.
         blacklist (list - str) : A list of strings to ignore.
-        discard_ner_objects (bool - default: True) : Whether to discard the spacy NER object after processing. This is because having the NER object continuously in memory can be memory intensive.
-        
+        discard_ner_objects (bool - default: True) : Whether to discard the spacy NER object after processing. This is because having the NER object continuously in memory can be memory intensive. The ModelManager keeps it loaded for ModelManager.idle_timeout seconds in case another call needs it.
+        ner_batch_size (int - default: 256) : How many lines spacy parses at a time.
+        ner_n_process (int - default: 1) : How many processes spacy parses with, for large texts and knowledge bases.
+        ner_cache (NERCache - default: None) : A persistent cache of NER results, so lines of the text and knowledge base parsed in earlier runs aren't parsed again.
+        backend (NERBackend - default: None) : The NER backend to use instead of the spacy model, such as a SpacyBackend with a smaller model. Only used for this call, and left alone by discard_ner_objects.
+        ner_chunk_size (int - default: 2000) : The longest line, in characters, spacy parses whole. Longer lines, such as the paragraphs of scraped web novels, are parsed a chunk of sentences at a time. None to always parse whole lines.
+        knowledge_base_cache (KnowledgeBaseCache - default: None) : A persistent cache of what was found in each file of the knowledge base, so only the files added or changed since the last call are parsed. Only used when the knowledge base is a path, with backends that have a model_key.
+
         Returns:
         new_names (NameAndOccurrence): A list of names that are not in the knowledge base or replacement_json. (NameAndOccurrence is a named tuple with the fields name and occurrence).
         indexing_log (str): Log of the indexing process (names that were flagged as unique 'names' and which occurrence they were flagged at).
-        
+
         """
 
-        _time_start = time.time()
-    
         try:
 
-            if(Indexer._ner is None):
-                Indexer._ner = spacy.load("ja_core_news_lg")
+            ## a backend is only used for this call, the model kept between calls is left as it is
+            if(backend is None and Indexer._ner is None):
+                Indexer._ner = ModelManager.acquire()
+
+            _session = IndexerSession(backend if backend is not None else Indexer._ner, ner_batch_size, ner_n_process, ner_cache, ner_chunk_size, knowledge_base_cache)
+            _state = _IndexingState(blacklist)
+
+            try:
+                _new_names = _session._index(_state, text_to_index, knowledge_base, replacement_json)
+
+            finally:
+                ## only what this call found is kept, so a long-running process doesn't grow with every call
+                Indexer.indexing_log = _state.indexing_log
+                Indexer._entity_occurrences = _state.entity_occurrences
+
+        finally:
+
+            ## the model is given back even if indexing failed, otherwise the manager would hold it forever
+            if(discard_ner_objects and Indexer._ner is not None):
+                ModelManager.release(Indexer._ner)
+                Indexer._ner = None
+
+        return _new_names, Indexer.indexing_log
+
+##-------------------start-of-build_knowledge_base_index()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def build_knowledge_base_index(knowledge_base:str,
+                                   path:str,
+                                   ner_batch_size:int = 256,
+                                   ner_n_process:int = 1,
+                                   ner_cache:NERCache | None = None,
+                                   backend:NERBackend | None = None,
+                                   ner_chunk_size:int | None = 2000
+                                   ) -> KnowledgeBaseIndex:
+
+        """
+
+        Parses a knowledge base once and saves the names in it, so index() can be given the index instead of parsing the same knowledge base on every call.
+
+        The index has every PERSON entity of the knowledge base that passes the checks of _perform_further_elimination(), and how many times it was found.
+        Honorifics and the blacklist depend on the call, so index() still applies them. Build the index again when the knowledge base changes.
+
+        Parameters:
+        knowledge_base (str) : The knowledge base. Can be a path to a directory containing text files, a path to a text file, or just the text itself.
+        path (str) : Where to save the index, a json file.
+        ner_batch_size (int - default: 256) : How many lines spacy parses at a time.
+        ner_n_process (int - default: 1) : How many processes spacy parses with.
+        ner_cache (NERCache - default: None) : A persistent cache of NER results, see index().
+        backend (NERBackend - default: None) : The NER backend to use instead of the spacy model, see index(). Use the same one as index() will.
+        ner_chunk_size (int - default: 2000) : The longest line, in characters, spacy parses whole, see index().
+
+        Returns:
+        knowledge_base_index (KnowledgeBaseIndex) : The index, which can be passed to index() as the knowledge base.
+
+        Raises:
+        SpacyModelNotFound : If the model is needed but not installed.
+
+        """
+
+        _ner = backend if backend is not None else ModelManager.acquire()
+
+        try:
+
+            _names:typing.Dict[str, int] = {}
+
+            for _entities in NERRunner(ner_batch_size, ner_n_process, ner_cache, ner_chunk_size).pipe_stream(_ner, Indexer._read_knowledge_base(knowledge_base)):
+                for _entity in _entities:
+                    if(_entity.label == "PERSON"):
+                        _names[_entity.text] = _names.get(_entity.text, 0) + 1
+
+            _kept, _, _ = Indexer._perform_further_elimination([NameAndOccurrence(_name, _count) for _name, _count in _names.items()], [], [])
+
+            _knowledge_base_index = KnowledgeBaseIndex({_name.name: _name.occurrence for _name in _kept}, _as_backend(_ner).model_key)
+
+        finally:
+            if(backend is None):
+                ModelManager.release(_ner)
+
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"model": _knowledge_base_index.model, "names": _knowledge_base_index.names}, file, ensure_ascii=False, indent=4)
+
+        return _knowledge_base_index
+
+##-------------------start-of-load_knowledge_base_index()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def load_knowledge_base_index(path:str) -> KnowledgeBaseIndex:
+
+        """
+
+        Loads an index saved by build_knowledge_base_index().
+
+        Parameters:
+        path (str) : The path to the index.
+
+        Returns:
+        knowledge_base_index (KnowledgeBaseIndex) : The index, which can be passed to index() as the knowledge base. model is the name and version of the model it was built with, if known.
+
+        """
+
+        with open(path, "r", encoding="utf-8") as file:
+            _data = json.load(file)
+
+        return KnowledgeBaseIndex(_data["names"], tuple(_data["model"]) if _data.get("model") else None) ## type: ignore (a name and version)
+
+##-------------------start-of-_IndexingState---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class _IndexingState:
+
+    """
+
+    Everything a single index call reads and finds. Each call gets its own and drops it when done, which is what keeps calls on one session apart.
+
+    knowledge_base is the knowledge base to read, a path or the text itself, see Indexer._read_knowledge_base(). It is None when knowledge_base_index is set, or when the files of the knowledge base are looked up in the knowledge base cache, see IndexerSession._count_entities_in_files().
+    cancel_event, if given, stops the call once set, see IndexerSession.index().
+
+    """
+
+    def __init__(self, blacklist:typing.List[str], cancel_event:threading.Event | None = None) -> None:
+
+        self.blacklisted_names = list(blacklist)
+        self.cancel_event = cancel_event
+
+        self.text_to_index = ""
+        self.knowledge_base:str | None = None
+        self.knowledge_base_index:KnowledgeBaseIndex | None = None
+        self.knowledge_base_files:typing.List[str] = []
+
+        self.replacement_json:dict = {}
+        self.json_type:typing.Literal["kudasai", "fukuin"] | None = None
+
+        ## dict of entity labels and their occurrences
+        self.entity_occurrences:typing.Dict[str, int] = {}
+        self.indexing_log = ""
+
+##-------------------start-of-check_cancelled()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def check_cancelled(self) -> None:
+
+        """
+
+        Stops indexing if it has been cancelled.
+
+        Raises:
+        CancelledError : If the cancel event is set.
+
+        """
+
+        if(self.cancel_event is not None and self.cancel_event.is_set()):
+            raise CancelledError("Indexing was cancelled.")
+
+##-------------------start-of-IndexerSession---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class IndexerSession:
+
+    """
+
+    An indexer with an explicit lifetime, for indexing many texts in one long-running process, such as a worker.
+
+    Every index() call gets state of its own that is dropped when it returns, so calls never see each other's text, blacklist or log, and several threads can index with one session at once.
+    What is worth sharing between calls is kept by the session: the NER model, loaded on first use and given back by close(), and, if max_knowledge_base_entries is set, the entities found in the knowledge bases it has parsed.
+
+    Use it as a context manager, or call close() when done.
+
+    """
+
+##-------------------start-of-__init__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__(self,
+                 ner:spacy.language.Language | NERBackend | None = None,
+                 ner_batch_size:int = 256,
+                 ner_n_process:int = 1,
+                 ner_cache:NERCache | None = None,
+                 ner_chunk_size:int | None = 2000,
+                 knowledge_base_cache:KnowledgeBaseCache | None = None,
+                 max_knowledge_base_entries:int = 0) -> None:
+
+        """
+
+        Creates a session. Nothing is loaded until the first call.
+
+        Parameters:
+        ner (spacy.language.Language | NERBackend | optional | default=None) : The spacy NER model or NER backend to use. If None, the spacy model is loaded on the first call and given back by close().
+        ner_batch_size (int | optional | default=256) : How many lines spacy parses at a time.
+        ner_n_process (int | optional | default=1) : How many processes spacy parses with, for large texts and knowledge bases.
+        ner_cache (NERCache | optional | default=None) : A persistent cache of NER results, see Indexer.index().
+        ner_chunk_size (int | optional | default=2000) : The longest line, in characters, spacy parses whole, see Indexer.index().
+        knowledge_base_cache (KnowledgeBaseCache | optional | default=None) : A persistent cache of what was found in each file of the knowledge base, see Indexer.index().
+        max_knowledge_base_entries (int | optional | default=0) : How many entities, summed over every knowledge base, the session keeps in memory so a knowledge base that comes up again isn't read or parsed again. Once over it, the least recently used knowledge base is dropped. 0 keeps none.
+
+        Raises:
+        ValueError : If max_knowledge_base_entries is negative.
+
+        """
+
+        if(max_knowledge_base_entries < 0):
+            raise ValueError("max_knowledge_base_entries can't be negative.")
+
+        self._ner = ner
+        self._ner_lock = threading.Lock()
+
+        ## whether the model was loaded by the session, in which case close() gives it back to the ModelManager
+        self._owns_ner = False
+
+        self._ner_runner = NERRunner(ner_batch_size, ner_n_process, ner_cache, ner_chunk_size)
+
+        self.knowledge_base_cache = knowledge_base_cache
+
+        self.max_knowledge_base_entries = max_knowledge_base_entries
+
+        ## the entities found in each knowledge base, keyed by its content or its files, and how many entities each has
+        self._knowledge_bases:collections.OrderedDict[typing.Tuple, typing.Tuple[typing.Dict[str, typing.Dict[str, int]], int]] = collections.OrderedDict()
+        self._knowledge_base_entries = 0
+        self._knowledge_base_lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+
+##-------------------start-of-__enter__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __enter__(self) -> "IndexerSession":
+
+        return self
+
+##-------------------start-of-__exit__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __exit__(self, *args) -> None:
+
+        self.close()
+
+##-------------------start-of-ner()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @property
+    def ner(self) -> spacy.language.Language | NERBackend:
+
+        """
+
+        The spacy NER model or NER backend of the session, the default spacy model is loaded on first use if neither was given.
+
+        Raises:
+        SpacyModelNotFound : If the model is needed but not installed.
+
+        """
+
+        if(self._ner is None):
+            with self._ner_lock:
+                if(self._ner is None):
+                    self._ner = ModelManager.acquire()
+                    self._owns_ner = True
+
+        return self._ner
+
+##-------------------start-of-close()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def close(self) -> None:
+
+        """
+
+        Gives back the model the session loaded itself to the ModelManager and drops the knowledge bases it kept. A model that was passed in is left alone.
+
+        The session loads the model again if it is used after this.
+
+        """
+
+        with self._ner_lock:
+
+            if(self._owns_ner):
+                ModelManager.release(self._ner)
+                self._ner = None
+                self._owns_ner = False
+
+        self.clear_knowledge_bases()
+
+##-------------------start-of-knowledge_base_stats()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def knowledge_base_stats(self) -> LineCacheStats:
+
+        """
+
+        Gets how the knowledge bases kept by the session have done so far.
+
+        Returns:
+        stats (LineCacheStats) : The hits, misses, how many entities are kept, and max_knowledge_base_entries.
+
+        """
+
+        with self._knowledge_base_lock:
+            return LineCacheStats(self._hits, self._misses, self._knowledge_base_entries, self.max_knowledge_base_entries)
+
+##-------------------start-of-clear_knowledge_bases()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def clear_knowledge_bases(self) -> None:
+
+        """
+
+        Drops every knowledge base kept by the session and resets its counters.
+
+        """
+
+        with self._knowledge_base_lock:
+            self._knowledge_bases.clear()
+            self._knowledge_base_entries = 0
+            self._hits = 0
+            self._misses = 0
+
+##-------------------start-of-index()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def index(self,
+              text_to_index:str,
+              knowledge_base:str | KnowledgeBaseIndex,
+              replacement_json:typing.Union[str, dict],
+              blacklist:typing.List[str] = [],
+              cancel_event:threading.Event | None = None
+              ) -> typing.Tuple[typing.List[NameAndOccurrence], str]:
+
+        """
+
+        Determines which names in the text to index are not in the knowledge base or replacement json, see Indexer.index(). Safe to call from several threads at once.
+
+        Parameters:
+        text_to_index (str) : The text to index. Can be a path to a text file, or just the text itself.
+        knowledge_base (str | KnowledgeBaseIndex) : The knowledge base. Can be a path to a directory containing text files, a path to a text file, just the text itself, or an index from Indexer.build_knowledge_base_index().
+        replacement_json (str) : The replacement json. Can be a path to a json, or as the json itself.
+        blacklist (list - str) : A list of strings to ignore.
+        cancel_event (threading.Event | optional | default=None) : Setting this from another thread stops the call before its next NER line.
+
+        Returns:
+        new_names (NameAndOccurrence): A list of names that are not in the knowledge base or replacement_json.
+        indexing_log (str): Log of the indexing process.
+
+        Raises:
+        SpacyModelNotFound : If the model is needed but not installed.
+        CancelledError : If cancel_event was set.
+
+        """
+
+        _state = _IndexingState(blacklist, cancel_event)
+
+        _new_names = self._index(_state, text_to_index, knowledge_base, replacement_json)
 
-        except Exception:
-            raise SpacyModelNotFound
+        return _new_names, _state.indexing_log
 
-        if(len(blacklist) > 0):
-            Indexer._blacklisted_names = blacklist
+##-------------------start-of-_index()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _index(self, state:_IndexingState, text_to_index:str, knowledge_base:str | KnowledgeBaseIndex, replacement_json:typing.Union[str, dict]) -> typing.List[NameAndOccurrence]:
+
+        """
+
+        Indexes the text, writing the log and the entity occurrences to the state.
+
+        Parameters:
+        state (_IndexingState) : The state of the call.
+        text_to_index (str) : The text to index.
+        knowledge_base (str | KnowledgeBaseIndex) : The knowledge base.
+        replacement_json (str | dict) : The replacement json.
+
+        Returns:
+        new_names (NameAndOccurrence): A list of names that are not in the knowledge base or replacement_json.
+
+        """
+
+        _time_start = time.time()
 
         new_names:typing.List[NameAndOccurrence] = []
 
-        Indexer._load_static_data(text_to_index, knowledge_base, replacement_json)
+        self._load_static_data(state, text_to_index, knowledge_base, replacement_json)
 
-        _names_in_knowledge_base, _names_in_text_to_index, _names_in_replacement_json = Indexer._get_names_from_all_sources()
+        _names_in_knowledge_base, _names_in_text_to_index, _names_in_replacement_json = self._get_names_from_all_sources(state)
 
         _names_in_knowledge_base, _names_in_text_to_index, _names_in_replacement_json = Indexer._perform_further_elimination(_names_in_knowledge_base, _names_in_text_to_index, _names_in_replacement_json)
 
         if(replacement_json):
-            _names_in_knowledge_base, _names_in_text_to_index, _names_in_replacement_json = Indexer._trim_honorifics(_names_in_knowledge_base, _names_in_text_to_index, _names_in_replacement_json)
+            _names_in_knowledge_base, _names_in_text_to_index, _names_in_replacement_json = Indexer._trim_honorifics(_names_in_knowledge_base, _names_in_text_to_index, _names_in_replacement_json, state.replacement_json)
 
         _names_in_knowledge_base = set(_name.name for _name in _names_in_knowledge_base)
         _names_in_replacement_json = set(_name.name for _name in _names_in_replacement_json)
 
         _all_names = _names_in_knowledge_base | _names_in_replacement_json
 
+        _all_names_matcher = ContainmentMatcher(_all_names)
+
+        ## a name occurs many times in the text, but is only checked once
+        _is_in_other_sources:typing.Dict[str, bool] = {}
+
         for _name in _names_in_text_to_index:
-            if(not Indexer._is_name_in_other_sources(_name.name, _all_names)):
-                new_names.append(_name)
-                Indexer.indexing_log += (f"Name: {_name.name} Occurrence: {_name.occurrence} was flagged as a unique 'name'\n")
 
-        if(discard_ner_objects):
-            Indexer._ner = None
-            del Indexer._ner
-            import gc
-            gc.collect()
+            if(_name.name not in _is_in_other_sources):
+                _is_in_other_sources[_name.name] = Indexer._is_name_in_other_sources(_name.name, _all_names_matcher)
+
+            if(not _is_in_other_sources[_name.name]):
+                new_names.append(_name)
+                state.indexing_log += (f"Name: {_name.name} Occurrence: {_name.occurrence} was flagged as a unique 'name'\n")
 
         _time_end = time.time()
 
-        Indexer.indexing_log += "\nIgnored Strings: " + str(Indexer._blacklisted_names)
+        state.indexing_log += "\nIgnored Strings: " + str(state.blacklisted_names)
 
-        Indexer.indexing_log += "\nTotal Unique 'Names'  : " + \
+        state.indexing_log += "\nTotal Unique 'Names'  : " + \
             str(len(new_names))
-        Indexer.indexing_log += "\nTime Elapsed : " + \
+        state.indexing_log += "\nTime Elapsed : " + \
             _get_elapsed_time(_time_start, _time_end)
 
-        return new_names, Indexer.indexing_log
\ No newline at end of file
+        return new_names
+
+##-------------------start-of-load_static_data()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _load_static_data(self, state:_IndexingState, text_to_index:str, knowledge_base:str | KnowledgeBaseIndex, replacement_json:typing.Union[str, dict]) -> None:
+
+        """
+
+        Loads the inputs of a call into its state.
+
+        Parameters:
+        state (_IndexingState) : The state of the call.
+        text_to_index (str) : The text to index. Can be a path to a text file, or just the text itself.
+        knowledge_base (str | KnowledgeBaseIndex) : The knowledge base. Can be a path to a directory containing text files, a path to a text file, just the text itself, or an index from Indexer.build_knowledge_base_index().
+        replacement_json (str) : The replacement json. Can be a path to a json, or as the json itself.
+
+        """
+
+        ## text_to_index can be sent in a path to a text file, or just the text itself
+        if(os.path.exists(text_to_index)):
+            with open(text_to_index, "r", encoding="utf-8") as file:
+                state.text_to_index = file.read()
+
+        else:
+            state.text_to_index = text_to_index
+
+        ## an index of the knowledge base already has its names, so there is nothing to read
+        if(isinstance(knowledge_base, KnowledgeBaseIndex)):
+            state.knowledge_base_index = knowledge_base
+
+            _model = _as_backend(self.ner).model_key
+
+            ## another model finds other names in the knowledge base, so its names no longer match the ones found in the text
+            if(knowledge_base.model is not None and _model is not None and tuple(knowledge_base.model) != _model):
+                warnings.warn(f"The knowledge base index was built with {' '.join(knowledge_base.model)}, but the names in the text are found with {' '.join(_model)}. Build the index again with the same backend.", KairyouWarning, stacklevel=4)
+
+        ## files are looked up in the knowledge base cache before they are read, see _count_entities_in_files()
+        elif(self._get_knowledge_base_cache() is not None and os.path.exists(knowledge_base)):
+            state.knowledge_base_files = [os.path.abspath(_path) for _path in Indexer._get_knowledge_base_files(knowledge_base)]
+
+            ## deleted volumes no longer count towards the knowledge base
+            if(os.path.isdir(knowledge_base)):
+                self.knowledge_base_cache.drop_missing(os.path.abspath(knowledge_base), state.knowledge_base_files) ## type: ignore (checked above)
+
+        else:
+            state.knowledge_base = knowledge_base
+
+        ## replacement_json can be sent in a path to a json, or as the json itself
+        if(isinstance(replacement_json, str)):
+
+            try:
+                ## Try to load the string as JSON
+                state.replacement_json = json.loads(replacement_json)
+
+            except json.JSONDecodeError:
+                ## If it fails, treat the string as a file path
+                if(os.path.isfile(replacement_json)):
+                    with open(replacement_json, "r", encoding="utf-8") as file:
+                        state.replacement_json = json.load(file)
+                else:
+                    raise InvalidReplacementJsonPath(replacement_json)
+        else:
+            state.replacement_json = replacement_json
+
+##-------------------start-of-_get_knowledge_base_cache()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _get_knowledge_base_cache(self) -> KnowledgeBaseCache | None:
+
+        """
+
+        Gets the knowledge base cache, if the model can use it.
+
+        Returns:
+        knowledge_base_cache (KnowledgeBaseCache | None) : The cache, None if there is none or the backend has no model_key.
+
+        """
+
+        ## what was found in a file can only be reused for the model that found it
+        if(self.knowledge_base_cache is None or _as_backend(self.ner).model_key is None):
+            return None
+
+        return self.knowledge_base_cache
+
+##-------------------start-of-_get_names_from_all_sources()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _get_names_from_all_sources(self, state:_IndexingState) -> typing.Tuple[typing.List[NameAndOccurrence], typing.List[NameAndOccurrence], typing.List[NameAndOccurrence]]:
+
+        """
+
+        Fetches all names from the knowledge base, text to index, and replacement json and returns them as a list.
+
+        Parameters:
+        state (_IndexingState) : The state of the call.
+
+        Returns:
+        names_in_knowledge_base (NameAndOccurrence): A list of names from the knowledge base.
+        names_in_text_to_index (NameAndOccurrence): A list of names from the text to index.
+        names_in_replacement_json (NameAndOccurrence): A list of names from the replacement json.
+
+        """
+
+        _names, state.json_type = Indexer._get_names_from_replacement_json(state.replacement_json)
+
+        _names_in_replacement_json = [NameAndOccurrence(_name, 1) for _name in _names]
+
+        ## an index of the knowledge base skips its NER, its blacklisted names are dropped here instead
+        if(state.knowledge_base_index is not None):
+            _names_in_knowledge_base = [NameAndOccurrence(_name, _count) for _name, _count in state.knowledge_base_index.names.items() if _name not in state.blacklisted_names]
+
+        else:
+            _names_in_knowledge_base = self._get_names_from_counts(state, self._get_knowledge_base_entities(state))
+
+        _names_in_text_to_index = self._get_names_from_lines(state, state.text_to_index.split("\n"))
+
+        return _names_in_knowledge_base, _names_in_text_to_index, _names_in_replacement_json
+
+##-------------------start-of-_get_names_from_lines()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _get_names_from_lines(self, state:_IndexingState, lines:typing.List[str]) -> typing.List[NameAndOccurrence]:
+
+        """
+
+        Runs NER over lines in batches and collects the PERSON entities, logging the label of every entity that isn't blacklisted.
+
+        Parameters:
+        state (_IndexingState) : The state of the call.
+        lines (list - str) : The lines.
+
+        Returns:
+        names (NameAndOccurrence): The names found, with which occurrence of the name each one is.
+
+        """
+
+        _names = []
+        _name_occurrences = {}
+
+        state.check_cancelled()
+
+        for _entities in self._ner_runner.pipe(self.ner, lines):
+
+            state.check_cancelled()
+
+            for _entity in _entities:
+
+                if(_entity.text in state.blacklisted_names):
+                    continue
+
+                ## log label and occurrence
+                state.entity_occurrences[_entity.label] = state.entity_occurrences.get(_entity.label, 0) + 1
+
+                if(_entity.label == "PERSON"):
+                    _name_occurrences[_entity.text] = _name_occurrences.get(_entity.text, 0) + 1
+                    _names.append(NameAndOccurrence(_entity.text, _name_occurrences[_entity.text]))
+
+        return _names
+
+##-------------------start-of-_get_names_from_counts()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _get_names_from_counts(self, state:_IndexingState, entities:typing.Dict[str, typing.Dict[str, int]]) -> typing.List[NameAndOccurrence]:
+
+        """
+
+        Collects the PERSON entities of a knowledge base, logging the label of every entity that isn't blacklisted, as _get_names_from_lines() does.
+
+        Parameters:
+        state (_IndexingState) : The state of the call.
+        entities (dict - dict - int) : How many times each entity was found, by label.
+
+        Returns:
+        names (NameAndOccurrence): The names found, each once with how many times it was found.
+
+        """
+
+        _names = []
+
+        for _label, _counts in entities.items():
+            for _text, _count in _counts.items():
+
+                if(_text in state.blacklisted_names):
+                    continue
+
+                ## log label and occurrence
+                state.entity_occurrences[_label] = state.entity_occurrences.get(_label, 0) + _count
+
+                if(_label == "PERSON"):
+                    _names.append(NameAndOccurrence(_text, _count))
+
+        return _names
+
+##-------------------start-of-_get_knowledge_base_entities()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _get_knowledge_base_entities(self, state:_IndexingState) -> typing.Dict[str, typing.Dict[str, int]]:
+
+        """
+
+        Gets the entities of the knowledge base of a call, from the knowledge bases kept by the session if it has it, parsing it otherwise.
+
+        Parameters:
+        state (_IndexingState) : The state of the call.
+
+        Returns:
+        entities (dict - dict - int) : How many times each entity was found in the knowledge base, by label. Shared with the session, so it must not be changed.
+
+        """
+
+        _key = self._get_knowledge_base_key(state) if self.max_knowledge_base_entries > 0 else None
+
+        if(_key is not None):
+
+            with self._knowledge_base_lock:
+
+                _kept = self._knowledge_bases.get(_key)
+
+                if(_kept is not None):
+                    self._knowledge_bases.move_to_end(_key)
+                    self._hits += 1
+                    return _kept[0]
+
+                self._misses += 1
+
+        if(state.knowledge_base_files):
+            _entities = self._count_entities_in_files(state, state.knowledge_base_files)
+
+        else:
+            _entities = self._count_entities(state, Indexer._read_knowledge_base(state.knowledge_base)) ## type: ignore (set whenever there are no files)
+
+        _size = sum(len(_counts) for _counts in _entities.values())
+
+        ## a knowledge base bigger than the limit is never kept, rather than dropping every other one for it
+        if(_key is not None and _size <= self.max_knowledge_base_entries):
+
+            with self._knowledge_base_lock:
+
+                if(_key not in self._knowledge_bases):
+                    self._knowledge_bases[_key] = (_entities, _size)
+                    self._knowledge_base_entries += _size
+
+                while(self._knowledge_base_entries > self.max_knowledge_base_entries):
+                    _, (_, _dropped_size) = self._knowledge_bases.popitem(last=False)
+                    self._knowledge_base_entries -= _dropped_size
+
+        return _entities
+
+##-------------------start-of-_get_knowledge_base_key()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _get_knowledge_base_key(self, state:_IndexingState) -> typing.Tuple:
+
+        """
+
+        Gets the key the knowledge base of a call is kept under. A knowledge base that is a path is keyed by the path, size and mtime of each of its files, so it is parsed again once any of them changes.
+
+        Parameters:
+        state (_IndexingState) : The state of the call.
+
+        Returns:
+        key (tuple) : The key.
+
+        """
+
+        if(state.knowledge_base_files):
+            _paths = state.knowledge_base_files
+
+        elif(state.knowledge_base is not None and os.path.exists(state.knowledge_base)):
+            _paths = [os.path.abspath(_path) for _path in Indexer._get_knowledge_base_files(state.knowledge_base)]
+
+        else:
+            return ("text", hashlib.sha1(str(state.knowledge_base).encode("utf-8")).digest())
+
+        _files = []
+
+        for _path in sorted(_paths):
+            _stat = os.stat(_path)
+            _files.append((_path, _stat.st_mtime_ns, _stat.st_size))
+
+        return ("path", tuple(_files))
+
+##-------------------start-of-_count_entities()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _count_entities(self, state:_IndexingState, lines:typing.Iterable[str]) -> typing.Dict[str, typing.Dict[str, int]]:
+
+        """
+
+        Runs NER over the lines of a knowledge base and counts the entities found. The lines are read a block at a time as NER goes, see NERRunner.pipe_stream(), so memory doesn't grow with the size of the knowledge base.
+
+        Parameters:
+        state (_IndexingState) : The state of the call.
+        lines (iterable - str) : The lines.
+
+        Returns:
+        entities (dict - dict - int) : How many times each entity was found, by label.
+
+        """
+
+        _entities:typing.Dict[str, typing.Dict[str, int]] = {}
+
+        state.check_cancelled()
+
+        for _line_entities in self._ner_runner.pipe_stream(self.ner, lines):
+
+            state.check_cancelled()
+
+            for _entity in _line_entities:
+                _entities.setdefault(_entity.label, {})
+                _entities[_entity.label][_entity.text] = _entities[_entity.label].get(_entity.text, 0) + 1
+
+        return _entities
+
+##-------------------start-of-_count_entities_in_files()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _count_entities_in_files(self, state:_IndexingState, paths:typing.List[str]) -> typing.Dict[str, typing.Dict[str, int]]:
+
+        """
+
+        Counts the entities in files of the knowledge base, taking what was found in each unchanged file from the knowledge base cache and only parsing the rest.
+
+        A file is streamed through NER a block of lines at a time, see _count_entities(), and what was found in it is cached before the next file is read.
+
+        Parameters:
+        state (_IndexingState) : The state of the call.
+        paths (list - str) : The absolute paths to the files.
+
+        Returns:
+        entities (dict - dict - int) : How many times each entity was found over all the files, by label.
+
+        """
+
+        _cache = self._get_knowledge_base_cache()
+
+        assert _cache is not None, "The knowledge base cache is None. Please ensure that it is set before calling this method."
+
+        _model:typing.Tuple[str, str] = _as_backend(self.ner).model_key ## type: ignore (the cache is only used for backends with a model_key)
+        _chunk_size = self._ner_runner.chunk_size
+
+        _merged:typing.Dict[str, typing.Dict[str, int]] = {}
+
+        ## each file is done before the next is opened, so only the counts are held, however many files changed
+        for _path in paths:
+
+            state.check_cancelled()
+
+            ## the stat is taken before the file is read, so a change made while reading it gives it a newer mtime than the one cached
+            _stat = os.stat(_path)
+            _entities = _cache.get(_model, _path, _chunk_size, _stat.st_mtime_ns, _stat.st_size)
+
+            ## a file with a new mtime may have been touched without being changed
+            if(_entities is None):
+                _hash = KnowledgeBaseCache.start_content_hash()
+                collections.deque(IndexerSession._read_lines(_path, _hash), maxlen=0)
+
+                _entities = _cache.get(_model, _path, _chunk_size, _stat.st_mtime_ns, _stat.st_size, _hash.digest())
+
+            ## the hash cached is of the lines parsed, in case the file changed since it was hashed above
+            if(_entities is None):
+                _hash = KnowledgeBaseCache.start_content_hash()
+                _entities = self._count_entities(state, IndexerSession._read_lines(_path, _hash))
+
+                _cache.put(_model, _path, _chunk_size, _stat.st_mtime_ns, _stat.st_size, _hash.digest(), _entities)
+
+            for _label, _counts in _entities.items():
+
+                _merged.setdefault(_label, {})
+
+                for _text, _count in _counts.items():
+                    _merged[_label][_text] = _merged[_label].get(_text, 0) + _count
+
+        return _merged
+
+##-------------------start-of-_read_lines()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def _read_lines(path:str, content_hash:typing.Any) -> typing.Generator[str, None, None]:
+
+        """
+
+        Reads the lines of a file one at a time, adding each to a hash of the file's content as it goes, see KnowledgeBaseCache.start_content_hash().
+
+        The lines are those of splitting the whole file on line breaks, apart from the empty line after a trailing line break, which has no entities anyway.
+
+        Parameters:
+        path (str) : The path to the file.
+        content_hash (hashlib._Hash) : The hash, which is only complete once every line has been read.
+
+        Returns:
+        line (str) : Each line, without its line break.
+
+        """
+
+        with open(path, "r", encoding="utf-8") as file:
+
+            for _line in file:
+                content_hash.update(_line.encode("utf-8"))
+                yield _line[:-1] if _line.endswith("\n") else _line
@@ -3,19 +3,19 @@
 ## license that can be found in the LICENSE file.
 
 ## built-in libraries
-import itertools
 import typing
-import time
-import json
-import regex
 
 ## third-party libraries
 import spacy
 
 ## custom modules
-from .katakana_util import KatakanaUtil
-from .util import _validate_replacement_json, _get_elapsed_time, Name, ReplacementType, _kudasai_blank_json, _fukuin_blank_json, _kudasai_replacement_rules
-from .exceptions import  InvalidReplacementJsonName, InvalidReplacementJsonPath, InvalidPreprocessingText, SpacyModelNotFound
+from .backends import NERBackend
+from .client import KairyouClient, _PreprocessingState
+from .cache import LineCache, NERCache
+from .models import ModelManager
+from .plan import ReplacementPlan, _compile_replacement_plan, _get_replacement_plan
+from .util import _kudasai_blank_json, _fukuin_blank_json
+from .exceptions import InvalidPreprocessingText
 
 # -------------------start-of-Kairyou---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
@@ -27,8 +27,8 @@ class Kairyou:
 
     """
 
-    ## The dictionary containing the rules for preprocessing.
-    _replacement_json:dict = {}
+    ## The compiled rules for preprocessing.
+    _plan:ReplacementPlan | None = None
 
     ## The text to be preprocessed. Preprocessing is in-place.
     text_to_preprocess = ""
@@ -39,9 +39,6 @@ class Kairyou:
 
     _total_replacements = 0
 
-    ## How japanese names are separated in the japanese text
-    _JAPANESE_NAME_SEPARATORS = ["・", ""]
-
     ##------------------------/
 
     ## Supported types of json files.
@@ -49,8 +46,6 @@ class Kairyou:
     ## Fukuin is the format used by the original onegai processor and kroatoan's Fukuin. See https://github.com/Bikatr7/Kairyou/tree/main/examples/blank_fukuin.json
     _json_type:typing.Literal["kudasai", "fukuin"] = "kudasai"
 
-    _replacement_rules:typing.List = _kudasai_replacement_rules
-
     #----------------------------/
 
     _ner:spacy.language.Language | None = None
@@ -66,7 +61,7 @@ class Kairyou:
 
         Resets the global variables.
 
-        Resets both logs, the total replacements, json type, and replacement rules to their default values: Empty strings, 0, and Kudasai type respectively.
+        Resets both logs, the total replacements, json type, and plan to their default values: Empty strings, 0, Kudasai type, and None respectively.
 
         """
 
@@ -77,574 +72,337 @@ class Kairyou:
         Kairyou._total_replacements = 0
 
         Kairyou._json_type = "kudasai"
- 
-        Kairyou._replacement_rules = _kudasai_replacement_rules
 
-##-------------------start-of-preprocess()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+        Kairyou._plan = None
+
+##-------------------start-of-_discard_ner()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
     @staticmethod
-    def preprocess(text_to_preprocess:str, replacement_json:typing.Union[dict,str], persist:bool = False, discard_ner_objects:bool = True, add_closing_period:bool = False) -> typing.Tuple[str, str, str]:
+    def _discard_ner() -> None:
 
         """
 
-        Preprocesses the text using the replacement json.
-
-        Using preprocess will effectively reset the global Kairyou client unless persist is set to True.
-
-        Will skip the preprocessing if the replacement json is blank.
-
-        Parameters:
-        text_to_preprocess (str) : The text to be preprocessed.
-        replacement_json (dict | str) : The rules for preprocessing. Can be a dictionary or a path to a json file.
-        persist (bool | optional | default=False) : If True, the global Kairyou client will not be reset upon starting the function.
-        discard_ner_objects (bool | optional | default=True) : Whether to discard the spacy NER object after processing. This is because having the NER object continuously in memory can be memory intensive.
-        add_closing_period (bool | optional | default=False) : Whether to add closing periods (。) before 」 where missing.
-        Returns:
-        Kairyou.text_to_preprocess (str) : The preprocessed text.
-        Kairyou.preprocessing_log (str) : The log of replacements made.
-        Kairyou.error_log (str) : The log of errors encountered (if any).
-
-        Raises:
-        ValueError : If the text to be preprocessed is empty.
+        Gives the NER model back to the ModelManager, which evicts it once it has been unused for ModelManager.idle_timeout seconds.
 
         """
 
-        Kairyou._add_closing_period = add_closing_period
+        if(Kairyou._ner is not None):
+            ModelManager.release(Kairyou._ner)
 
-        ## The spacy NER model used for enhanced replacement checking.
-        try:
+        Kairyou._ner = None
 
-            if(Kairyou._ner is None):
-                Kairyou._ner = spacy.load("ja_core_news_lg")
+##-------------------start-of-_adopt_ner()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
-        except Exception:
-            raise SpacyModelNotFound
-
-        ## If the replacement json is blank, skip the preprocessing.
-        if(replacement_json == _kudasai_blank_json or replacement_json == _fukuin_blank_json):
-            return text_to_preprocess, "Skipped", ""
-
-        if(not persist):
-            Kairyou._reset_globals()
+    @staticmethod
+    def _adopt_ner(client:KairyouClient) -> None:
 
-        if(len(text_to_preprocess) != 0):
-            if(add_closing_period):
-                text_to_preprocess = Kairyou._add_missing_periods(text_to_preprocess)
-            
-            Kairyou.text_to_preprocess = text_to_preprocess
+        """
 
-            if(isinstance(replacement_json, str)):
-                ## try to load the replacement json file
-                try:
+        Takes over the model a client had to load, so it is kept between calls like one Kairyou loaded itself and given back by _discard_ner().
 
-                    with open(replacement_json, 'r', encoding='utf-8') as file: ## type: ignore (also a string)
-                        replacement_json = json.load(file)
+        Parameters:
+        client (KairyouClient) : The client.
 
-                except Exception:
-                    raise InvalidReplacementJsonPath(replacement_json) ## type: ignore (it's a string)
-            
-            Kairyou._replacement_json = replacement_json ## type: ignore (it's a dict)
+        """
 
-            Kairyou._json_type, Kairyou._replacement_rules = _validate_replacement_json(Kairyou._replacement_json)
+        if(Kairyou._ner is None and client._owns_ner):
+            Kairyou._ner = client._ner
+            client._owns_ner = False
 
-        else:
-            raise InvalidPreprocessingText("Text to be preprocessed is empty.")
+##-------------------start-of-compile()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
-        _replacement_tracker = {
-            'punctuation': {},  ## For kutouten
-            'names': {
-                'base': {},     ## Name without honorific
-                'honorific': {} ## Name with honorific - flat structure
-            },
-            'words': {},       ## Regular words
-            'phrases': {},     ## Multi-word phrases
-            'debug': []        ## Track all operations in order
-        }
-
-        _replaced_names = dict()
-        _time_start = time.time()
-
-        Kairyou._replace_non_katakana(_replaced_names, _replacement_tracker)
-        Kairyou._replace_katakana(_replaced_names, _replacement_tracker)
-
-        Kairyou._perform_postprocessing()
-
-        print("\nDetailed Tracking Analysis:")
-        print("--------------------------")
-        
-        total = 0
-        for category in ['punctuation', 'words', 'phrases']:
-            if(_replacement_tracker[category]):
-                print(f"\n{category.title()}:")
-                cat_total = sum(_replacement_tracker[category].values())
-                total += cat_total
-                print(f"Total: {cat_total}")
-                for item, count in _replacement_tracker[category].items():
-                    print(f"  {item}: {count}")
-
-        print("\nNames:")
-        name_total = sum(_replacement_tracker['names']['base'].values())
-        honorific_total = sum(_replacement_tracker['names']['honorific'].values())
-        total += name_total + honorific_total
-        print(f"Base names total: {name_total}")
-        print(f"Honorific names total: {honorific_total}")
-        
-        print("\nDetailed name replacements:")
-        for name, count in _replacement_tracker['names']['base'].items():
-            print(f"  {name}: {count}")
-            honorifics = {k.replace(name, ''): v 
-                         for k, v in _replacement_tracker['names']['honorific'].items() 
-                         if(k.startswith(name))}
-            if(honorifics):
-                for honorific, hon_count in honorifics.items():
-                    print(f"    with {honorific}: {hon_count}")
-
-        print("\nDebug log:")
-        for entry in _replacement_tracker['debug']:
-            print(f"  {entry}")
-
-        print("\nTotals:")
-        print(f"Sum of all tracked replacements: {total}")
-        print(f"Running counter total: {Kairyou._total_replacements}")
+    @staticmethod
+    def compile(replacement_json:typing.Union[dict,str]) -> ReplacementPlan:
 
-        if(discard_ner_objects):
-            Kairyou._ner = None
-            del Kairyou._ner
-            import gc
-            gc.collect()
+        """
 
-        _time_end = time.time()
+        Compiles the replacement json into a plan that can be passed to preprocess() in its place.
 
-        Kairyou.preprocessing_log += "\nTotal Replacements  : " + \
-            str(Kairyou._total_replacements)
-        Kairyou.preprocessing_log += "\nTime Elapsed : " + \
-            _get_elapsed_time(_time_start, _time_end)
+        Loading, validation, name variant expansion, katakana classification, whitelist lookups and ordering are all done here once instead of on every preprocess() call,
+        so compile once when running the same replacement json over many texts.
 
-        return Kairyou.text_to_preprocess, Kairyou.preprocessing_log, Kairyou.error_log
-    
-##-------------------start-of-_perform_postprocessing()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-    
-    @staticmethod
-    def _perform_postprocessing() -> None:
+        Parameters:
+        replacement_json (dict | str) : The rules for preprocessing. Can be a dictionary or a path to a json file.
 
-        """
+        Returns:
+        plan (ReplacementPlan) : The compiled rules. Immutable, so it can be shared freely.
 
-        Performs postprocessing on the text after the replacements have been made.
+        Raises:
+        InvalidReplacementJsonPath : If the replacement json path could not be loaded.
+        InvalidReplacementJsonKeys : If the replacement json is missing keys.
 
         """
 
-        Kairyou._perform_missing_space_correction()
+        return _compile_replacement_plan(replacement_json)
 
-##-------------------start-of-_perform_missing_space_correction()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+##-------------------start-of-preprocess()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
     @staticmethod
-    def _perform_missing_space_correction() -> None:
+    def preprocess(text_to_preprocess:str, replacement_json:typing.Union[dict,str,ReplacementPlan], persist:bool = False, discard_ner_objects:bool = True, add_closing_period:bool = False, line_cache:LineCache | None = None, ner_cache:NERCache | None = None, backend:NERBackend | None = None, parse_once:bool = False) -> typing.Tuple[str, str, str]:
 
         """
 
-        Sometimes, two individual names maybe be replaced separately, rather than as a single name, leading to a missing space. This function corrects that.
-        Seems to occur rarely, but better to have it than not. Only occurs in Kudasai type jsons.
+        Preprocesses the text using the replacement json.
 
-        """
+        Using preprocess will effectively reset the global Kairyou client unless persist is set to True.
+        This is a thin wrapper around KairyouClient, which should be used instead when preprocessing from several threads.
 
-        if(Kairyou._json_type != "kudasai"):
-            return 
+        Will skip the preprocessing if the replacement json is blank.
+        The spacy model is only loaded once a line needs NER, so it is never loaded for a json without entries that need enhanced replacement.
 
-        english_in_text = [(match.group(), match.start()) for match in regex.finditer(r'\p{Latin}+', Kairyou.text_to_preprocess)]
-        full_names = [name for name in Kairyou._replacement_json['full_names'].keys()]
+        Parameters:
+        text_to_preprocess (str) : The text to be preprocessed.
+        replacement_json (dict | str | ReplacementPlan) : The rules for preprocessing. Can be a dictionary, a path to a json file, or a plan from compile(). The last few jsons compiled are kept, a path by its modification time and a dict by its contents, so passing the same one on every call only compiles it once.
+        persist (bool | optional | default=False) : If True, the global Kairyou client will not be reset upon starting the function.
+        discard_ner_objects (bool | optional | default=True) : Whether to discard the spacy NER object after processing. This is because having the NER object continuously in memory can be memory intensive. The ModelManager keeps it loaded for ModelManager.idle_timeout seconds in case another call needs it.
+        add_closing_period (bool | optional | default=False) : Whether to add closing periods (。) before 」 where missing.
+        line_cache (LineCache | optional | default=None) : A cache of preprocessed lines, so lines repeated across calls are only preprocessed once. Only used if every rule works within a single line, a KairyouWarning is given otherwise.
+        ner_cache (NERCache | optional | default=None) : A persistent cache of NER results, so lines parsed in earlier runs aren't parsed again.
+        backend (NERBackend | optional | default=None) : The NER backend to use instead of the global spacy model, such as a SpacyBackend with a smaller model or a DictionaryBackend. Left alone by discard_ner_objects.
+        parse_once (bool | optional | default=False) : Whether to parse the text once and carry the PERSON spans through every replacement, instead of parsing a line again when it changes. See KairyouClient.
 
-        for english, start in english_in_text:
-            for full_name in full_names:
-                first_name, last_name = full_name.split(" ")
-        
-                if(first_name in Kairyou.text_to_preprocess[start:] and last_name in Kairyou.text_to_preprocess[start:]):
-                    Kairyou.text_to_preprocess = Kairyou.text_to_preprocess.replace(first_name + last_name, first_name + " " + last_name)
-                    pass
-        
-##-------------------start-of-_replace_non_katakana()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+        Returns:
+        Kairyou.text_to_preprocess (str) : The preprocessed text.
+        Kairyou.preprocessing_log (str) : The log of replacements made.
+        Kairyou.error_log (str) : The log of errors encountered (if any).
 
-    @staticmethod
-    def _replace_non_katakana(replaced_names:dict, replacement_tracker:dict) -> None:
+        Raises:
+        ValueError : If the text to be preprocessed is empty.
 
         """
 
-        Handles non-katakana replacements.
-
-        Parameters:
-        replaced_names (dict - str) : Names that have been replaced.
-        replacement_tracker (dict) : A dictionary to track the replacements.
-        """
+        Kairyou._add_closing_period = add_closing_period
 
-        ## for non-katakana replacements
-        for _rule in Kairyou._replacement_rules:
+        ## If the replacement json is blank, skip the preprocessing.
+        if(isinstance(replacement_json, ReplacementPlan)):
+            if(replacement_json.is_blank):
+                return text_to_preprocess, "Skipped", ""
 
-            ## unpack the rule
-            _, _json_key, _is_name, _replace_name_param, _honorific_type = _rule
+        elif(replacement_json == _kudasai_blank_json or replacement_json == _fukuin_blank_json):
+            return text_to_preprocess, "Skipped", ""
 
-            if(_is_name == True):
+        if(not persist):
+            Kairyou._reset_globals()
 
-                try:
-                    for _eng, _jap in Kairyou._replacement_json[_json_key].items():
+        if(len(text_to_preprocess) == 0):
+            raise InvalidPreprocessingText("Text to be preprocessed is empty.")
 
-                        ## makes jap entries into a list if not already
-                        if(isinstance(_jap, list) == False):
-                            _jap = [_jap]
+        Kairyou.text_to_preprocess = text_to_preprocess
 
-                        _current_name = Name(" ".join(_jap), _eng)
+        ## a json passed on every call is only compiled again once the file or dict changes
+        Kairyou._plan = _get_replacement_plan(replacement_json)
 
-                        ## katakana is replaced at the end
-                        if(KatakanaUtil.is_katakana_only(_current_name.jap)):
-                            continue
+        Kairyou._json_type = Kairyou._plan.json_type
 
-                        Kairyou._replace_name(_current_name, _replace_name_param, _honorific_type,
-                                             replaced_names, _json_key, is_potential_name=True, 
-                                             is_katakana=False, tracker=replacement_tracker)
+        ## the client works on its own state, which is seeded from and written back to the global one so persist keeps accumulating
+        _client = KairyouClient(Kairyou._plan, ner=backend if backend is not None else Kairyou._ner, add_closing_period=add_closing_period, line_cache=line_cache, ner_cache=ner_cache, parse_once=parse_once)
+        _state = _PreprocessingState(Kairyou.text_to_preprocess, Kairyou.preprocessing_log, Kairyou.error_log, Kairyou._total_replacements)
 
-                except Exception as _e:
-                    Kairyou.error_log += "Issue with the following key : " + _json_key + "\n"
-                    Kairyou.error_log += "Error is as follows : " + str(_e)
-                    continue
+        ## the spacy NER model used for enhanced replacement checking is only loaded by the client if a line needs it
+        try:
+            _client._preprocess(_state)
 
-            else:
-                try:
-                    for _jap, _eng in Kairyou._replacement_json[_json_key].items():
+        finally:
+            Kairyou._adopt_ner(_client)
 
-                        _num_replacements = Kairyou._replace_single_word(
-                            _jap, _eng, is_potential_name=False, tracker=replacement_tracker)
+        Kairyou.text_to_preprocess = _state.text
+        Kairyou.preprocessing_log = _state.preprocessing_log
+        Kairyou.error_log = _state.error_log
+        Kairyou._total_replacements = _state.total_replacements
 
-                        if(_num_replacements > 0):
-                            Kairyou.preprocessing_log += str(_jap) + " → " + str(
-                                _eng) + " : " + str(_num_replacements) + "\n"
+        if(discard_ner_objects):
+            Kairyou._discard_ner()
 
-                except Exception as _e:
-                    Kairyou.error_log += "Issue with the following key : " + _json_key + "\n"
-                    Kairyou.error_log += "Error is as follows : " + str(_e)
-                    continue
+        return Kairyou.text_to_preprocess, Kairyou.preprocessing_log, Kairyou.error_log
 
-##-------------------start-of-_replace_katakana()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+##-------------------start-of-preprocess_batch()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
     @staticmethod
-    def _replace_katakana(replaced_names:dict, replacement_tracker:dict) -> None:
+    def preprocess_batch(texts:typing.Iterable[str], replacement_json:typing.Union[dict,str,ReplacementPlan], discard_ner_objects:bool = True, add_closing_period:bool = False, line_cache:LineCache | None = None, ner_cache:NERCache | None = None, backend:NERBackend | None = None, parse_once:bool = False) -> typing.Generator[typing.Tuple[str, str, str], None, None]:
 
         """
 
-        Handles katakana replacements.
+        Preprocesses many texts, such as the chapters of a series, against one replacement json.
 
-        Parameters:
-        replaced_names (dict - str) : Names we have replaced.
-        replacement_tracker (dict) : A dictionary to track the replacements.
+        The replacement json is loaded and validated once, the spacy model is loaded at most once, when a line first needs it, and NER results are reused for lines repeated across the batch.
+        Unlike preprocess(), this does not touch the global Kairyou client apart from its NER object, see KairyouClient.preprocess_batch().
 
-        """
+        Parameters:
+        texts (iterable - str) : The texts to be preprocessed. Can be a generator, texts are only read as they are needed.
+        replacement_json (dict | str | ReplacementPlan) : The rules for preprocessing. Can be a dictionary, a path to a json file, or a plan from compile().
+        discard_ner_objects (bool | optional | default=True) : Whether to discard the spacy NER object once the batch is done.
+        add_closing_period (bool | optional | default=False) : Whether to add closing periods (。) before 」 where missing.
+        line_cache (LineCache | optional | default=None) : A cache of preprocessed lines, see preprocess().
+        ner_cache (NERCache | optional | default=None) : A persistent cache of NER results, see preprocess().
+        backend (NERBackend | optional | default=None) : The NER backend to use instead of the global spacy model, see preprocess().
+        parse_once (bool | optional | default=False) : Whether to parse each text once, see preprocess().
 
-        _katakana_entries = []
+        Returns:
+        tuple (str, str, str) : The preprocessed text, preprocessing log, and error log of each text, in order.
 
-        for _rule in Kairyou._replacement_rules:
+        Raises:
+        InvalidPreprocessingText : If one of the texts is empty.
+        SpacyModelNotFound : If the model is needed but not installed.
 
-            ## unpack the rule
-            _, _json_key, _is_name, _replace_name_param, _honorific_type = _rule
+        """
 
-            if(_is_name == True):
+        _client = KairyouClient(replacement_json, ner=backend if backend is not None else Kairyou._ner, add_closing_period=add_closing_period, line_cache=line_cache, ner_cache=ner_cache, parse_once=parse_once)
 
-                for _eng, _jap in Kairyou._replacement_json[_json_key].items():
+        try:
+            yield from _client.preprocess_batch(texts)
 
-                    ## makes jap entries into a list if not already
-                    if(isinstance(_jap, list) == False):
-                        _jap = [_jap]
+        finally:
+            Kairyou._adopt_ner(_client)
 
-                    _current_name = Name(" ".join(_jap), _eng)
+            if(discard_ner_objects):
+                Kairyou._discard_ner()
 
-                    if(KatakanaUtil.is_katakana_only(_current_name.jap) and not KatakanaUtil.is_actual_word(_current_name.jap)):
-                        _katakana_entries.append(
-                            (_current_name, _replace_name_param, _honorific_type, _json_key))
-            else:
+##-------------------start-of-preprocess_incremental()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
-                for _jap, _eng in Kairyou._replacement_json[_json_key].items():
+    @staticmethod
+    def preprocess_incremental(text_to_preprocess:str, previous_output:str, previous_replacement_json:typing.Union[dict,str,ReplacementPlan], replacement_json:typing.Union[dict,str,ReplacementPlan], discard_ner_objects:bool = True, add_closing_period:bool = False, backend:NERBackend | None = None) -> typing.Tuple[str, str, str]:
 
-                    if(KatakanaUtil.is_katakana_only(_jap) and not KatakanaUtil.is_actual_word(_jap)):
-                        _katakana_entries.append((_jap, _eng))
+        """
 
-        ## Sort the katakana entries by the length of Japanese phrases in descending order
-        _katakana_entries.sort(key=lambda _entry: len(
-            _entry[0].jap if isinstance(_entry[0], Name) else _entry[0]), reverse=True)
+        Preprocesses a text again after its replacement json changed, only redoing the lines the changed entries can make a difference to, see KairyouClient.preprocess_incremental().
 
-        ## Replace katakana names and words
-        for _entry in _katakana_entries:
+        Falls back to preprocessing the whole text when the rules don't allow going line by line. Does not touch the global Kairyou client apart from its NER object, which is only loaded if a line needs it.
 
-            ## names
-            if(isinstance(_entry[0], Name)):
+        Parameters:
+        text_to_preprocess (str) : The original text.
+        previous_output (str) : The text as preprocessed with the previous json.
+        previous_replacement_json (dict | str | ReplacementPlan) : The json the previous output was made with. Can be a dictionary, a path to a json file, or a plan from compile().
+        replacement_json (dict | str | ReplacementPlan) : The new rules for preprocessing. Can be a dictionary, a path to a json file, or a plan from compile().
+        discard_ner_objects (bool | optional | default=True) : Whether to discard the spacy NER object once done.
+        add_closing_period (bool | optional | default=False) : Whether to add closing periods (。) before 」 where missing. Must be what the previous output was made with.
+        backend (NERBackend | optional | default=None) : The NER backend to use instead of the global spacy model, see preprocess().
 
-                _current_name, _replace_name_param, _honorific_type, _json_key = _entry
+        Returns:
+        text (str) : The preprocessed text.
+        preprocessing_log (str) : The log of replacements made in the lines preprocessed again.
+        error_log (str) : The log of errors encountered (if any).
 
-                try:
-                    Kairyou._replace_name(_current_name, _replace_name_param, _honorific_type,
-                                         replaced_names, _json_key, is_potential_name=True, is_katakana=True, tracker=replacement_tracker)
+        Raises:
+        InvalidPreprocessingText : If the text to be preprocessed is empty.
+        SpacyModelNotFound : If the model is needed but not installed.
 
-                except Exception as _e:
-                    Kairyou.error_log += "Issue with the following key : " + _json_key + "\n"
-                    Kairyou.error_log += "Error is as follows : " + str(_e)
-                    continue
-            else:
+        """
 
-                ## Handling non-names
-                _jap, _eng = _entry
+        _client = KairyouClient(replacement_json, ner=backend if backend is not None else Kairyou._ner, add_closing_period=add_closing_period)
 
-                try:
-                    _num_replacements = Kairyou._replace_single_word(
-                        _jap, _eng, is_potential_name=False, is_katakana=True, tracker=replacement_tracker)
+        try:
+            return _client.preprocess_incremental(text_to_preprocess, previous_output, previous_replacement_json)
 
-                    if(_num_replacements > 0):
-                        Kairyou.preprocessing_log += str(_jap) + " → " + str(
-                            _eng) + " : " + str(_num_replacements) + "\n"
+        finally:
+            Kairyou._adopt_ner(_client)
 
-                except Exception as _e:
-                    Kairyou.error_log += "Issue with the word : " + _jap + "\n"
-                    Kairyou.error_log += "Error is as follows : " + str(_e)
-                    continue
+            if(discard_ner_objects):
+                Kairyou._discard_ner()
 
-##-------------------start-of-_yield_name_replacements()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+##-------------------start-of-preprocess_parallel()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
     @staticmethod
-    def _yield_name_replacements(name:Name, replace_type:ReplacementType, honorific_type:ReplacementType) -> typing.Generator[tuple[str, str, bool], None, None]:
+    def preprocess_parallel(texts:typing.Iterable[str], replacement_json:typing.Union[dict,str,ReplacementPlan], max_workers:int | None = None, add_closing_period:bool = False, backend:NERBackend | None = None) -> typing.Generator[typing.Tuple[str, str, str], None, None]:
 
         """
 
-        Generates tuples of English and Japanese names to be replaced, along with a boolean indicating whether honorifics should be kept or removed.
+        Preprocesses many texts against one replacement json across a pool of processes, see KairyouClient.preprocess_parallel().
+
+        Does not touch the global Kairyou client, each worker process loads its own spacy model once.
 
         Parameters:
-        Name (object - Name) : represents a japanese name along with its english equivalent.
-        replace_type  (object - ReplacementType) : how a name should be replaced.
-        honorific_type (object - ReplacementType) : how a honorific_type should be replaced.
+        texts (iterable - str) : The texts to be preprocessed.
+        replacement_json (dict | str | ReplacementPlan) : The rules for preprocessing. Can be a dictionary, a path to a json file, or a plan from compile().
+        max_workers (int | optional | default=None) : How many processes to use. Defaults to the number of CPUs.
+        add_closing_period (bool | optional | default=False) : Whether to add closing periods (。) before 」 where missing.
+        backend (NERBackend | optional | default=None) : The NER backend to use instead of the default spacy model. It is sent to each worker process, a SpacyBackend is sent as the name of its model.
 
         Returns:
-        tuple (string, string, bool) : tuple containing the japanese name, english name, and a boolean indicating whether honorifics should be kept or removed.
+        tuple (str, str, str) : The preprocessed text, preprocessing log, and error log of each text, in order.
 
-        tuple is wrapped in a generator along with two None values. No, I don't know why.
+        Raises:
+        InvalidPreprocessingText : If one of the texts is empty.
+        SpacyModelNotFound : If the model is needed but not installed.
 
         """
 
-        _japanese_names = name.jap.split(" ")
-        _english_names = name.eng.split(" ")
-
-        ## if the lengths of the names don't match, the entire Name is fucked.
-        try:
-
-            assert len(_japanese_names) == len(_english_names)
-
-        except AssertionError:
-            raise InvalidReplacementJsonName(name)
-
-        if(ReplacementType.FULL_NAME in replace_type):
-            _indices = range(len(_japanese_names))
-            ## create a chain of combinations of indices, starting with combinations of length 2 up to the length of indices
-            _combinations = itertools.chain(
-                *(itertools.combinations(_indices, i) for i in range(2, len(_indices)+1)))
-
-            for _comb in _combinations:
-                for _separator in Kairyou._JAPANESE_NAME_SEPARATORS:
-                    yield (" ".join(map(lambda i: _english_names[i], _comb)),
-                           _separator.join(
-                               map(lambda i: _japanese_names[i], _comb)),
-                           ReplacementType.FULL_NAME in honorific_type)
+        _client = KairyouClient(replacement_json, ner=backend, add_closing_period=add_closing_period)
 
-        if(ReplacementType.FIRST_NAME in replace_type):
-            yield(_english_names[0],
-                   f'{_japanese_names[0]}',
-                   ReplacementType.FIRST_NAME in honorific_type)
+        yield from _client.preprocess_parallel(texts, max_workers=max_workers)
 
-        if(ReplacementType.LAST_NAME in replace_type):
-            yield(_english_names[-1],
-                   f'{_japanese_names[-1]}',
-                   ReplacementType.LAST_NAME in honorific_type)
-
-# -------------------start-of-_replace_single_word()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+##-------------------start-of-preprocess_chunked()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
     @staticmethod
-    def _replace_single_word(word:str, replacement:str, is_potential_name:bool, is_katakana:bool = False, tracker=None, skip_honorific_tracking:bool = False) -> int:
+    def preprocess_chunked(text_to_preprocess:str, replacement_json:typing.Union[dict,str,ReplacementPlan], max_workers:int | None = None, lines_per_chunk:int | None = None, add_closing_period:bool = False, backend:NERBackend | None = None) -> typing.Tuple[str, str, str]:
+
         """
 
-        Replaces a single word in the Japanese text, with an additional check for Katakana words.
+        Preprocesses one large text across a pool of processes by splitting it into chunks of lines, see KairyouClient.preprocess_chunked().
 
-        The function is extremely picky with katakana in general.
+        Gives the same result as preprocess(), but does not touch the global Kairyou client.
 
         Parameters:
-        word (string) : The word to be replaced.
-        replacement (string) : The replacement for the word.
-        is_potential_name (bool) : Indicates if the word is a potential name.
-        is_katakana (bool | optional | default=false) : Indicates if the word is in Katakana.
-        tracker (dict | optional | default=None) : A dictionary to track the replacements.
-        skip_honorific_tracking (bool | optional | default=False) : Indicates if honorific tracking should be skipped.
+        text_to_preprocess (str) : The text to be preprocessed.
+        replacement_json (dict | str | ReplacementPlan) : The rules for preprocessing. Can be a dictionary, a path to a json file, or a plan from compile().
+        max_workers (int | optional | default=None) : How many processes to use. Defaults to the number of CPUs.
+        lines_per_chunk (int | optional | default=None) : How many lines go in each chunk. Defaults to enough for about four chunks per process.
+        add_closing_period (bool | optional | default=False) : Whether to add closing periods (。) before 」 where missing.
+        backend (NERBackend | optional | default=None) : The NER backend to use instead of the default spacy model, see preprocess_parallel().
 
         Returns:
-        _num_occurrences (int) : The number of occurrences of the word replaced.
+        text (str) : The preprocessed text.
+        preprocessing_log (str) : The log of replacements made.
+        error_log (str) : The log of errors encountered (if any).
 
-        """
-        _num_occurrences = 0
-
-        if(is_katakana):
-
-            ## Skip replacement if the word is actually a known katakana word, translation will get it just fine without this.
-            if(KatakanaUtil.is_actual_word(word)):
-                return 0
-            else:
-
-                ## Use NER to ensure we're not replacing a proper name that's not in our list of Katakana words.
-                if(is_potential_name):
-                    _num_occurrences = Kairyou._perform_enhanced_replace(word, replacement, tracker)
-                else:
-                    _num_occurrences = Kairyou.text_to_preprocess.count(word)
-                    if(_num_occurrences > 0):
-                        Kairyou.text_to_preprocess = Kairyou.text_to_preprocess.replace(
-                            word, replacement)
-                        Kairyou._total_replacements += _num_occurrences
-        else:
-            _num_occurrences = Kairyou.text_to_preprocess.count(word)
-            if(_num_occurrences > 0):
-                Kairyou.text_to_preprocess = Kairyou.text_to_preprocess.replace(
-                    word, replacement)
-                Kairyou._total_replacements += _num_occurrences
-
-        if(_num_occurrences > 0):
-            if(tracker is not None and not skip_honorific_tracking):
-                if(word in Kairyou._replacement_json.get('kutouten', {})):
-                    tracker['punctuation'][word] = tracker['punctuation'].get(word, 0) + _num_occurrences
-                elif(' ' in word):  ## Multi-word phrase
-                    tracker['phrases'][word] = tracker['phrases'].get(word, 0) + _num_occurrences
-                elif(is_potential_name):
-                    tracker['names']['base'][word] = tracker['names']['base'].get(word, 0) + _num_occurrences
-                else:
-                    tracker['words'][word] = tracker['words'].get(word, 0) + _num_occurrences
-
-        return _num_occurrences
-
-# -------------------start-of-_replace_name()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+        Raises:
+        InvalidPreprocessingText : If the text to be preprocessed is empty.
+        SpacyModelNotFound : If the model is needed but not installed.
 
-    @staticmethod
-    def _replace_name(name:Name, replace_type:ReplacementType, honorific_type:ReplacementType, replaced_names:dict, json_key:str, is_potential_name:bool, is_katakana:bool, tracker=None) -> None:
         """
 
-        Replaces names in the japanese text based off of tuples returned by _yield_name_replacements.
-
-        Parameters:
-        name (object - Name)  : represents a japanese name along with its english equivalent.
-        replace_type  (object - ReplacementType) : how a name should be replaced.
-        honorific_type (object - ReplacementType) : how a honorific should be replaced.
-        replaced_names (dict - string) : a dict of replaced names and their occurrences.
-        is_katakana (bool) : Indicates if the name is in Katakana.
+        _client = KairyouClient(replacement_json, ner=backend, add_closing_period=add_closing_period)
 
-        """
+        return _client.preprocess_chunked(text_to_preprocess, max_workers=max_workers, lines_per_chunk=lines_per_chunk)
 
-        ## First, check if any part of this name appears in whitelist entries
-        _is_whitelisted = any(part in entry 
-                             for entry in Kairyou._replacement_json.get('enhanced_check_whitelist', {}).values()
-                             for part in name.jap.split())
-
-        for _eng, _jap, _no_honor in Kairyou._yield_name_replacements(name, replace_type, honorific_type):
-
-            ## Skip the replacement if the name has already been processed
-            if(_jap in replaced_names):
-                continue
-
-            _replacement_data = dict()
-
-            ## Process honorifics first
-            ## Both fukuin and kudasai jsons have the honorifics key
-            for _honor, _honorific_english in Kairyou._replacement_json['honorifics'].items():
-                _count = Kairyou._replace_single_word(
-                    f'{_jap}{_honor}',
-                    f'{_eng}-{_honorific_english}',
-
-                    ## If honorifics, don't worry about additional checking
-                    is_potential_name=is_potential_name,
-                    is_katakana=False,
-                    tracker=None
-                )
-                if(_count > 0):
-                    if(tracker is not None):
-                        full_name = f'{_jap}{_honor}'
-                        tracker['names']['honorific'][full_name] = _count
-                        tracker['debug'].append(f"Name with honorific: {full_name} → {_eng}-{_honorific_english} ({_count})")
-                    _replacement_data[_honorific_english] = _count
-
-            ## Then handle base name
-            if(_no_honor):
-                ## Always use enhanced replace for whitelisted names
-                if(_is_whitelisted or Kairyou._json_type == "kudasai" and json_key == "enhanced_check_whitelist" or len(_jap) == 1):
-                    _count = Kairyou._perform_enhanced_replace(_jap, _eng, tracker)
-                elif(is_katakana):
-                    if(KatakanaUtil.is_actual_word(_jap)):
-                        continue
-                    _count = Kairyou._perform_enhanced_replace(_jap, _eng, tracker)
-                else:
-                    _count = Kairyou._replace_single_word(_jap, _eng, is_potential_name=is_potential_name, is_katakana=is_katakana, tracker=tracker)
-
-                if(_count > 0):
-                    _replacement_data['NA'] = _count
-
-            ## Sum and log
-            _total = sum(_replacement_data.values())
-            if(_total > 0):
-                replaced_names[_jap] = _total
-                Kairyou.preprocessing_log += f'{_eng} : {_total} ('
-                Kairyou.preprocessing_log += ', '.join(
-                    [f'{_key}-{_value}' for _key, _value in _replacement_data.items()]) + ')\n'
-
-##-------------------start-of-_perform_enhanced_replace()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+##-------------------start-of-preprocess_stream()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
     @staticmethod
-    def _perform_enhanced_replace(jap:str, replacement:str, tracker=None) -> int:
+    def preprocess_stream(lines_or_file:typing.Union[str, typing.Iterable[str]], replacement_json:typing.Union[dict,str,ReplacementPlan], discard_ner_objects:bool = True, add_closing_period:bool = False, lines_per_block:int = 1000, backend:NERBackend | None = None, strict:bool = False) -> typing.Generator[str, None, typing.Tuple[str, str]]:
+
         """
 
-        Uses NER (Named Entity Recognition) from the spacy module to replace names that need to be more carefully replaced, such as single kanji, katakana names, or those placed in the user whitelist.
+        Preprocesses a text given as lines, yielding the preprocessed lines a block at a time so the whole text is never in memory, see KairyouClient.preprocess_stream().
 
-        May miss true positives, but should not replace false positives.
+        Once the generator is exhausted, the logs are in Kairyou.preprocessing_log and Kairyou.error_log, and are also its return value.
 
         Parameters:
-        jap (str) : Japanese to be replaced.
-        replacement (str) : The replacement for the Japanese
-        tracker (dict) : A dictionary to track the replacements.
+        lines_or_file (str | iterable - str) : The lines, such as an open file, or a path to a text file. A trailing line break on each line is removed.
+        replacement_json (dict | str | ReplacementPlan) : The rules for preprocessing. Can be a dictionary, a path to a json file, or a plan from compile().
+        discard_ner_objects (bool | optional | default=True) : Whether to discard the spacy NER object once the stream is done.
+        add_closing_period (bool | optional | default=False) : Whether to add closing periods (。) before 」 where missing.
+        lines_per_block (int | optional | default=1000) : How many lines are read ahead and preprocessed together.
+        backend (NERBackend | optional | default=None) : The NER backend to use instead of the global spacy model, see preprocess().
+        strict (bool | optional | default=False) : Whether to raise instead of reading the whole text first when the replacement json can't be applied a block at a time. Otherwise a KairyouWarning is given.
 
         Returns:
-        jap_replace_count (int) : How many japanese replacements that were made.
+        line (str) : Each preprocessed line, without a line break.
 
-        """
-
-        i = 0
-        _jap_replace_count = 0
-
-        _jap_lines = Kairyou.text_to_preprocess.split('\n')
-
-        while (i < len(_jap_lines)):
-            if (jap in _jap_lines[i]):
-
-                _sentence = Kairyou._ner(_jap_lines[i]) # type:ignore
-
-                for _entity in _sentence.ents:
-                    if (_entity.text == jap and _entity.label_ == "PERSON"):
-                        _jap_replace_count += 1
-                        _jap_lines[i] = _jap_lines[i][:_entity.start_char] + \
-                            replacement + _jap_lines[i][_entity.end_char:]
-
-            i += 1
+        Raises:
+        InvalidPreprocessingText : If the text is empty.
+        PlanNotStreamable : If strict is set and the replacement json can't be applied a block at a time.
+        SpacyModelNotFound : If the model is needed but not installed.
 
-        Kairyou.text_to_preprocess = '\n'.join(_jap_lines)
-        Kairyou._total_replacements += _jap_replace_count
+        """
 
-        if(_jap_replace_count > 0 and tracker is not None):
-            tracker['names']['base'][jap] = tracker['names']['base'].get(jap, 0) + _jap_replace_count
+        _client = KairyouClient(replacement_json, ner=backend if backend is not None else Kairyou._ner, add_closing_period=add_closing_period)
 
-        return _jap_replace_count
+        try:
+            Kairyou.preprocessing_log, Kairyou.error_log = yield from _client.preprocess_stream(lines_or_file, lines_per_block=lines_per_block, strict=strict)
 
-    @staticmethod
-    def _add_missing_periods(text:str) -> str:
-        """
-        Adds closing periods before 」 where no punctuation is present.
-        Must be called before any replacements occur.
+        finally:
+            Kairyou._adopt_ner(_client)
 
-        Parameters:
-        text (str): The text to process
+            if(discard_ner_objects):
+                Kairyou._discard_ner()
 
-        Returns:
-        str: The processed text with periods added where needed
-        """
-        pattern = r'([^。！？\.\!\?])」'
-        return regex.sub(pattern, r'\1。」', text)
\ No newline at end of file
+        return Kairyou.preprocessing_log, Kairyou.error_log
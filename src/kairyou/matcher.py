@@ -0,0 +1,612 @@
+## Copyright 2024 Kaden Bilyeu (Bikatr7) (https://github.com/Bikatr7) (https://github.com/Bikatr7/Kairyou)
+## Use of this source code is governed by a GNU Lesser General Public License v2.1
+## license that can be found in the LICENSE file.
+
+## built-in libraries
+import typing
+
+## third-party libraries
+import regex
+
+##-------------------start-of-MultiPatternMatcher---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class MultiPatternMatcher:
+
+    """
+
+    Matches many literal patterns against a text in a single left-to-right scan.
+
+    The patterns are compiled into a trie, which is then rendered as one regex so the scan itself runs inside the regex engine instead of in Python.
+    Matching is leftmost-longest and non-overlapping, the same as str.replace() when only one pattern is involved.
+
+    """
+
+##-------------------start-of-__init__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__(self, patterns:typing.Iterable[str]) -> None:
+
+        """
+
+        Compiles the patterns.
+
+        Parameters:
+        patterns (iterable - str) : The literal patterns to match. Duplicates are ignored, order is kept.
+
+        Raises:
+        ValueError : If one of the patterns is empty.
+
+        """
+
+        self.patterns:typing.Tuple[str, ...] = tuple(dict.fromkeys(patterns))
+
+        if(any(len(_pattern) == 0 for _pattern in self.patterns)):
+            raise ValueError("MultiPatternMatcher does not support empty patterns.")
+
+        self._indices = {_pattern: _index for _index, _pattern in enumerate(self.patterns)}
+
+        ## compiled on first use, a plan holds many matchers that a given text never gets to
+        self._compiled:typing.Any = None
+
+##-------------------start-of-_regex()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @property
+    def _regex(self) -> typing.Any:
+
+        """
+
+        The compiled trie of the patterns, None if there are none.
+
+        Two threads may both compile it the first time, which is harmless as they compile the same thing.
+
+        """
+
+        if(self._compiled is None and self.patterns):
+            self._compiled = regex.compile(_build_trie_pattern(self.patterns))
+
+        return self._compiled
+
+##-------------------start-of-finditer()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def finditer(self, text:str) -> typing.Generator[typing.Tuple[int, int, int], None, None]:
+
+        """
+
+        Yields every leftmost-longest, non-overlapping match in the text.
+
+        Parameters:
+        text (str) : The text to scan.
+
+        Returns:
+        tuple (int, int, int) : The start, end, and pattern index of each match.
+
+        """
+
+        if(self._regex is None):
+            return
+
+        for _match in self._regex.finditer(text):
+            yield _match.start(), _match.end(), self._indices[_match.group()]
+
+##-------------------start-of-search()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def search(self, text:str) -> bool:
+
+        """
+
+        Checks if any of the patterns occurs in the text.
+
+        Parameters:
+        text (str) : The text to scan.
+
+        Returns:
+        bool : True if at least one pattern occurs in the text, False otherwise.
+
+        """
+
+        return self._regex is not None and self._regex.search(text) is not None
+
+##-------------------start-of-find_present()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def find_present(self, text:str) -> typing.Set[str]:
+
+        """
+
+        Finds every pattern that occurs in the text, overlapping and nested occurrences included.
+
+        The scan finds the longest pattern starting at each position of the text, any shorter one starting there is a prefix of it.
+
+        Parameters:
+        text (str) : The text to scan.
+
+        Returns:
+        patterns (set - str) : The patterns that occur in the text.
+
+        """
+
+        if(self._regex is None):
+            return set()
+
+        _present = set()
+
+        for _longest in {_match.group() for _match in self._regex.finditer(text, overlapped=True)}:
+
+            for _length in range(1, len(_longest) + 1):
+
+                if(_longest[:_length] in self._indices):
+                    _present.add(_longest[:_length])
+
+        return _present
+
+##-------------------start-of-sub()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def sub(self, text:str, replacements:typing.Sequence[str], edits:typing.List[typing.Tuple[int, int, int]] | None = None) -> typing.Tuple[str, typing.List[int]]:
+
+        """
+
+        Replaces every match with the replacement of its pattern.
+
+        Parameters:
+        text (str) : The text to scan.
+        replacements (sequence - str) : The replacement for each pattern, in the same order as the patterns.
+        edits (list - tuple (int, int, int) | optional | default=None) : If given, the start and end in the text of each match and the length of its replacement are appended to it, in order.
+
+        Returns:
+        text (str) : The text with the replacements made.
+        counts (list - int) : How many times each pattern was replaced.
+
+        """
+
+        _counts = [0] * len(self.patterns)
+
+        if(self._regex is None):
+            return text, _counts
+
+        def _replace(match) -> str:
+            _index = self._indices[match.group()]
+            _counts[_index] += 1
+
+            if(edits is not None):
+                edits.append((match.start(), match.end(), len(replacements[_index])))
+
+            return replacements[_index]
+
+        return self._regex.sub(_replace, text), _counts
+
+##-------------------start-of-ContainmentMatcher---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class ContainmentMatcher:
+
+    """
+
+    Checks if any of many literal patterns occurs in a text, with an Aho-Corasick automaton.
+
+    Each character of the text is one step of the automaton, so a check takes time linear in the length of the text however many patterns there are.
+    Meant for many short texts, such as checking names against every known name. MultiPatternMatcher is faster for long texts, as its scan runs inside the regex engine.
+
+    """
+
+##-------------------start-of-__init__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__(self, patterns:typing.Iterable[str]) -> None:
+
+        """
+
+        Builds the automaton.
+
+        Parameters:
+        patterns (iterable - str) : The literal patterns. The empty pattern occurs in every text, as with the in operator.
+
+        """
+
+        ## the transitions of each state, the state to fall back to when a character has no transition, and whether a pattern ends at the state
+        self._transitions:typing.List[typing.Dict[str, int]] = [{}]
+        self._fallbacks:typing.List[int] = [0]
+        self._accepting:typing.List[bool] = [False]
+
+        for _pattern in patterns:
+
+            _state = 0
+
+            for _char in _pattern:
+
+                if(_char not in self._transitions[_state]):
+                    self._transitions[_state][_char] = len(self._transitions)
+                    self._transitions.append({})
+                    self._fallbacks.append(0)
+                    self._accepting.append(False)
+
+                _state = self._transitions[_state][_char]
+
+            self._accepting[_state] = True
+
+        ## breadth first, so the fallback of a state is always done before the states under it
+        _queue = list(self._transitions[0].values())
+
+        for _state in _queue:
+
+            for _char, _next_state in self._transitions[_state].items():
+
+                _fallback = self._fallbacks[_state]
+
+                while(_fallback and _char not in self._transitions[_fallback]):
+                    _fallback = self._fallbacks[_fallback]
+
+                self._fallbacks[_next_state] = self._transitions[_fallback].get(_char, 0)
+
+                ## a pattern ending at the fallback, the longest suffix that is also a prefix, also ends here
+                self._accepting[_next_state] = self._accepting[_next_state] or self._accepting[self._fallbacks[_next_state]]
+
+                _queue.append(_next_state)
+
+##-------------------start-of-search()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def search(self, text:str) -> bool:
+
+        """
+
+        Checks if any of the patterns occurs in the text.
+
+        Parameters:
+        text (str) : The text to scan.
+
+        Returns:
+        bool : True if at least one pattern occurs in the text, False otherwise.
+
+        """
+
+        if(self._accepting[0]):
+            return True
+
+        _state = 0
+
+        for _char in text:
+
+            while(_state and _char not in self._transitions[_state]):
+                _state = self._fallbacks[_state]
+
+            _state = self._transitions[_state].get(_char, 0)
+
+            if(self._accepting[_state]):
+                return True
+
+        return False
+
+##-------------------start-of-ReplacementPass---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class ReplacementPass:
+
+    """
+
+    A group of replacements that can be made in a single scan while giving the same result as making them one after another with str.replace().
+
+    Build these with compile_replacement_passes(), which is what guarantees that equivalence.
+
+    """
+
+##-------------------start-of-__init__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__(self, replacements:typing.Sequence[typing.Tuple[str, str]]) -> None:
+
+        """
+
+        Compiles the pass.
+
+        Parameters:
+        replacements (sequence - tuple (str, str)) : The (pattern, replacement) pairs of the pass, in rule order.
+
+        """
+
+        self.patterns:typing.Tuple[str, ...] = tuple(_pattern for _pattern, _ in replacements)
+        self.replacements:typing.Tuple[str, ...] = tuple(_replacement for _, _replacement in replacements)
+
+        ## a lone pattern is faster through str.count()/str.replace() than through the regex engine, and empty patterns need them anyway
+        self._matcher = MultiPatternMatcher(self.patterns) if len(self.patterns) > 1 else None
+
+##-------------------start-of-apply()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def apply(self, text:str, edits:typing.List[typing.Tuple[int, int, int]] | None = None) -> typing.Tuple[str, typing.List[int]]:
+
+        """
+
+        Makes the replacements of the pass.
+
+        Parameters:
+        text (str) : The text to replace in.
+        edits (list - tuple (int, int, int) | optional | default=None) : If given, the start and end in the text of each replacement made and the length of what replaced it are appended to it, in order.
+
+        Returns:
+        text (str) : The text with the replacements made.
+        counts (list - int) : How many times each pattern was replaced, in rule order.
+
+        """
+
+        if(self._matcher is None):
+            _count = text.count(self.patterns[0])
+
+            if(_count > 0):
+
+                if(edits is not None):
+                    edits.extend(_find_literal(text, self.patterns[0], len(self.replacements[0])))
+
+                text = text.replace(self.patterns[0], self.replacements[0])
+
+            return text, [_count]
+
+        return self._matcher.sub(text, self.replacements, edits)
+
+##-------------------start-of-_find_literal()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def _find_literal(text:str, pattern:str, replacement_length:int) -> typing.List[typing.Tuple[int, int, int]]:
+
+    """
+
+    Finds where str.replace() replaces a pattern, which is every leftmost non-overlapping occurrence of it.
+
+    Parameters:
+    text (str) : The text.
+    pattern (str) : The pattern, not empty.
+    replacement_length (int) : The length of what replaces it.
+
+    Returns:
+    edits (list - tuple (int, int, int)) : The start and end of each occurrence and the replacement length, in order.
+
+    """
+
+    _edits = []
+    _start = text.find(pattern)
+
+    while(_start != -1):
+        _edits.append((_start, _start + len(pattern), replacement_length))
+        _start = text.find(pattern, _start + len(pattern))
+
+    return _edits
+
+##-------------------start-of-compile_replacement_passes()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def compile_replacement_passes(replacements:typing.Sequence[typing.Tuple[str, str]]) -> typing.List[ReplacementPass]:
+
+    """
+
+    Splits an ordered list of replacements into as few passes as possible, where running the passes in order is byte-identical to calling str.replace() for every replacement in order.
+
+    A replacement starts a new pass when it could interfere with one already in the current pass, see _interferes().
+
+    Parameters:
+    replacements (sequence - tuple (str, str)) : The (pattern, replacement) pairs, in rule order.
+
+    Returns:
+    passes (list - ReplacementPass) : The passes, in order. Their patterns concatenated are the patterns given.
+
+    """
+
+    _passes = []
+    _current:typing.List[typing.Tuple[str, str]] = []
+
+    ## indexes of the current pass, used to only run the precise check on entries that could possibly interfere
+    _patterns:typing.Set[str] = set()
+    _by_pattern_start:typing.Dict[str, typing.List[int]] = {}
+    _by_replacement_start:typing.Dict[str, typing.List[int]] = {}
+    _by_replacement_char:typing.Dict[str, typing.List[int]] = {}
+    _empty_replacements:typing.List[int] = []
+
+    for _pattern, _replacement in replacements:
+
+        _conflicts = len(_pattern) == 0 or (len(_current) == 1 and len(_current[0][0]) == 0)
+
+        ## a pattern of the pass that is a prefix of this one is found with a few lookups, instead of checking everything sharing its first character
+        if(not _conflicts and _current):
+            _conflicts = any(_pattern[:_length] in _patterns for _length in range(1, len(_pattern) + 1))
+
+        if(not _conflicts and _current):
+            _candidates = set(_empty_replacements) if len(_pattern) > 1 else set()
+
+            for _char in set(_pattern[1:]):
+                _candidates.update(_by_pattern_start.get(_char, ()))
+
+            for _char in set(_pattern):
+                _candidates.update(_by_replacement_start.get(_char, ()))
+
+            _candidates.update(_by_replacement_char.get(_pattern[0], ()))
+
+            _conflicts = any(_interferes(_current[_index], (_pattern, _replacement)) for _index in _candidates)
+
+        if(_conflicts and _current):
+            _passes.append(ReplacementPass(_current))
+            _current = []
+            _patterns, _by_pattern_start, _by_replacement_start, _by_replacement_char, _empty_replacements = set(), {}, {}, {}, []
+
+        _index = len(_current)
+        _current.append((_pattern, _replacement))
+        _patterns.add(_pattern)
+
+        if(len(_pattern) > 0):
+            _by_pattern_start.setdefault(_pattern[0], []).append(_index)
+
+        if(len(_replacement) > 0):
+            _by_replacement_start.setdefault(_replacement[0], []).append(_index)
+        else:
+            _empty_replacements.append(_index)
+
+        for _char in set(_replacement):
+            _by_replacement_char.setdefault(_char, []).append(_index)
+
+    if(_current):
+        _passes.append(ReplacementPass(_current))
+
+    return _passes
+
+##-------------------start-of-_interferes()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def _interferes(earlier:typing.Tuple[str, str], later:typing.Tuple[str, str]) -> bool:
+
+    """
+
+    Checks if two replacements could give a different result in a single leftmost-longest scan than when made one after another.
+
+    That happens when the later pattern could win a match the earlier one would have made first (it is longer at the same start, or starts earlier and overlaps),
+    or when the earlier replacement could create a new occurrence of the later pattern.
+
+    Parameters:
+    earlier (tuple - str, str) : The (pattern, replacement) made first.
+    later (tuple - str, str) : The (pattern, replacement) made second.
+
+    Returns:
+    bool : True if the two have to be made in separate passes, False otherwise.
+
+    """
+
+    _earlier_pattern, _earlier_replacement = earlier
+    _later_pattern, _ = later
+
+    ## the later pattern contains the earlier one, so it either wins at the same start or starts earlier
+    if(_earlier_pattern in _later_pattern):
+        return True
+
+    ## the later pattern starts earlier and runs into the earlier one
+    if(_overlaps(_later_pattern, _earlier_pattern)):
+        return True
+
+    return _can_create(_earlier_replacement, _later_pattern)
+
+##-------------------start-of-_can_create()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def _can_create(replacement:str, pattern:str) -> bool:
+
+    """
+
+    Checks if putting the replacement into a text could create a new occurrence of the pattern, either inside the replacement or across its edges.
+
+    Parameters:
+    replacement (str) : The replacement.
+    pattern (str) : The pattern.
+
+    Returns:
+    bool : True if a new occurrence is possible, False otherwise.
+
+    """
+
+    ## removing text joins its neighbours, which can form any pattern longer than one character
+    if(len(replacement) == 0):
+        return len(pattern) > 1
+
+    return (pattern in replacement or
+            replacement in pattern or
+            _overlaps(replacement, pattern) or
+            _overlaps(pattern, replacement))
+
+##-------------------start-of-_overlaps()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def _overlaps(left:str, right:str) -> bool:
+
+    """
+
+    Checks if a proper suffix of left is a proper prefix of right.
+
+    Parameters:
+    left (str) : The string on the left.
+    right (str) : The string on the right.
+
+    Returns:
+    bool : True if the two can overlap, False otherwise.
+
+    """
+
+    if(len(left) == 0 or len(right) == 0):
+        return False
+
+    ## only positions where right could start need checking, and the suffix there has to be shorter than right
+    _index = left.find(right[0], max(1, len(left) - len(right) + 1))
+
+    while(_index != -1):
+
+        if(right.startswith(left[_index:])):
+            return True
+
+        _index = left.find(right[0], _index + 1)
+
+    return False
+
+##-------------------start-of-_build_trie_pattern()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def _build_trie_pattern(patterns:typing.Iterable[str]) -> str:
+
+    """
+
+    Renders the patterns as a regex that walks a trie of them.
+
+    Every branch of the trie starts with a different character, so the engine never has to backtrack between siblings,
+    and a pattern that is a prefix of a longer one is made an optional greedy tail, which is what makes the match the longest one at a given start.
+
+    Parameters:
+    patterns (iterable - str) : The literal patterns.
+
+    Returns:
+    pattern (str) : The regex source.
+
+    """
+
+    _trie:dict = {}
+
+    for _pattern in patterns:
+        _node = _trie
+
+        for _char in _pattern:
+            _node = _node.setdefault(_char, {})
+
+        ## the empty string is never a character, so it marks the end of a pattern
+        _node[""] = True
+
+    return _render_trie_node(_trie)
+
+##-------------------start-of-_render_trie_node()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def _render_trie_node(node:dict) -> str:
+
+    """
+
+    Renders a trie node and everything under it as regex source.
+
+    Parameters:
+    node (dict) : The trie node.
+
+    Returns:
+    pattern (str) : The regex source matching every suffix stored under the node.
+
+    """
+
+    _leaves = []
+    _branches = []
+
+    for _char, _child in node.items():
+
+        if(_char == ""):
+            continue
+
+        ## collapse runs of single-child nodes into one literal, which keeps the recursion as shallow as the branching
+        _literal = regex.escape(_char)
+
+        while(len(_child) == 1 and "" not in _child):
+            _next_char, _child = next(iter(_child.items()))
+            _literal += regex.escape(_next_char)
+
+        if(len(_child) == 1 and len(_literal) == len(regex.escape(_char))):
+            _leaves.append(_literal)
+        elif(len(_child) == 1):
+            _branches.append(_literal)
+        else:
+            _branches.append(_literal + _render_trie_node(_child))
+
+    if(len(_leaves) == 1):
+        _branches.append(_leaves[0])
+    elif(len(_leaves) > 1):
+        _branches.append("[" + "".join(_leaves) + "]")
+
+    if(len(_branches) == 1 and "" not in node):
+        return _branches[0]
+
+    _body = "(?:" + "|".join(_branches) + ")"
+
+    if("" in node):
+        _body += "?"
+
+    return _body
@@ -0,0 +1,384 @@
+## Copyright 2024 Kaden Bilyeu (Bikatr7) (https://github.com/Bikatr7) (https://github.com/Bikatr7/Kairyou)
+## Use of this source code is governed by a GNU Lesser General Public License v2.1
+## license that can be found in the LICENSE file.
+
+## built-in libraries
+import threading
+import typing
+import time
+import gc
+import os
+
+## third-party libraries
+import spacy
+
+## custom modules
+from .types import ModelMetrics
+from .exceptions import SpacyModelNotFound
+
+## The model used for NER unless another is asked for
+DEFAULT_MODEL = "ja_core_news_lg"
+
+## How a model can be loaded:
+## - full : Every component of the pipeline.
+## - ner-only : Only the tokenizer, the NER, and what the NER listens to. Vectors are dropped unless the NER uses them.
+PROFILES = ("full", "ner-only")
+
+## Components that never feed the NER of a pipeline, left out by the ner-only profile before they are loaded
+_NON_NER_COMPONENTS = ["tagger", "morphologizer", "parser", "senter", "sentencizer", "attribute_ruler", "lemmatizer", "trainable_lemmatizer", "entity_linker", "entity_ruler", "textcat", "textcat_multilabel", "spancat", "span_finder"]
+
+##-------------------start-of-_ManagedModel---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class _ManagedModel:
+
+    """
+
+    A loaded model, how many holders it has, and the timer that evicts it once it has been idle long enough.
+
+    """
+
+    def __init__(self, model:spacy.language.Language) -> None:
+
+        self.model = model
+        self.references = 0
+        self.timer:threading.Timer | None = None
+
+##-------------------start-of-ModelManager---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class ModelManager:
+
+    """
+
+    The process-wide manager of spacy models. Kairyou, KairyouClient, Indexer and AsyncKairyou all get their models from it, so a model is only loaded once however many of them use it.
+
+    Every acquire() is paired with a release(). A model nobody holds stays loaded for idle_timeout seconds, so back to back calls reuse it, then it is evicted.
+    If max_memory is set and the process is using more than that when a model's last holder releases it, the model is evicted straight away.
+
+    """
+
+    ## Seconds an unused model stays loaded. 0 evicts it as soon as it is released.
+    idle_timeout:float = 30.0
+
+    ## Bytes of resident memory over which unused models are evicted straight away. None to never check.
+    max_memory:int | None = None
+
+    ## The profile models are loaded with unless another is asked for, see PROFILES.
+    profile:str = "full"
+
+    ## keyed by model name and profile, a model loaded with two profiles is two models
+    _models:typing.Dict[typing.Tuple[str, str], _ManagedModel] = {}
+
+    ## loads, evictions, total load time, and last load time of each model ever loaded
+    _metrics:typing.Dict[typing.Tuple[str, str], typing.List[typing.Any]] = {}
+
+    _lock = threading.RLock()
+
+##-------------------start-of-acquire()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def acquire(name:str = DEFAULT_MODEL, profile:str | None = None) -> spacy.language.Language:
+
+        """
+
+        Gets a model, loading it if it isn't loaded, and holds it until release() is called with it.
+
+        Parameters:
+        name (str | optional | default="ja_core_news_lg") : The name of the spacy model.
+        profile (str | optional | default=None) : How to load the model, see PROFILES. Defaults to ModelManager.profile.
+
+        Returns:
+        model (spacy.language.Language) : The model, the same object for every holder.
+
+        Raises:
+        SpacyModelNotFound : If the model is not installed.
+        ValueError : If the profile is not one of PROFILES.
+
+        """
+
+        _key = (name, ModelManager._get_profile(profile))
+
+        with ModelManager._lock:
+
+            _entry = ModelManager._models.get(_key)
+
+            if(_entry is None):
+
+                _time_start = time.time()
+
+                _model = _load_model(*_key)
+
+                _load_time = time.time() - _time_start
+
+                _metrics = ModelManager._metrics.setdefault(_key, [0, 0, 0.0, 0.0])
+                _metrics[0] += 1
+                _metrics[2] += _load_time
+                _metrics[3] = _load_time
+
+                _entry = _ManagedModel(_model)
+                ModelManager._models[_key] = _entry
+
+            if(_entry.timer is not None):
+                _entry.timer.cancel()
+                _entry.timer = None
+
+            _entry.references += 1
+
+            return _entry.model
+
+##-------------------start-of-release()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def release(model:typing.Any) -> None:
+
+        """
+
+        Stops holding a model. Does nothing for a model the manager didn't load, such as one set directly on Kairyou._ner.
+
+        Parameters:
+        model (spacy.language.Language) : The model, as given by acquire().
+
+        """
+
+        with ModelManager._lock:
+
+            _key = next((_key for _key, _entry in ModelManager._models.items() if _entry.model is model), None)
+
+            if(_key is None):
+                return
+
+            _entry = ModelManager._models[_key]
+            _entry.references = max(0, _entry.references - 1)
+
+            if(_entry.references > 0):
+                return
+
+            if(ModelManager.idle_timeout <= 0 or ModelManager._is_over_memory()):
+                ModelManager._evict(_key)
+                return
+
+            _entry.timer = threading.Timer(ModelManager.idle_timeout, ModelManager._evict_if_idle, args=(_key, _entry))
+            _entry.timer.daemon = True
+            _entry.timer.start()
+
+##-------------------start-of-evict()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def evict(name:str | None = None) -> int:
+
+        """
+
+        Evicts unused models now instead of waiting for their idle timeout. Models that are held are left alone.
+
+        Parameters:
+        name (str | optional | default=None) : The model to evict, whatever profile it was loaded with. All unused models if None.
+
+        Returns:
+        evicted (int) : How many models were evicted.
+
+        """
+
+        with ModelManager._lock:
+
+            _keys = [_key for _key, _entry in ModelManager._models.items() if _entry.references == 0 and (name is None or _key[0] == name)]
+
+            for _key in _keys:
+                ModelManager._evict(_key)
+
+            return len(_keys)
+
+##-------------------start-of-get_metrics()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def get_metrics(name:str = DEFAULT_MODEL, profile:str | None = None) -> ModelMetrics:
+
+        """
+
+        Gets how often a model has been loaded and evicted, and how long loading took.
+
+        Parameters:
+        name (str | optional | default="ja_core_news_lg") : The name of the spacy model.
+        profile (str | optional | default=None) : The profile the model was loaded with, see PROFILES. Defaults to ModelManager.profile.
+
+        Returns:
+        metrics (ModelMetrics) : The metrics of the model. Load times are in seconds.
+
+        Raises:
+        ValueError : If the profile is not one of PROFILES.
+
+        """
+
+        _key = (name, ModelManager._get_profile(profile))
+
+        with ModelManager._lock:
+
+            _entry = ModelManager._models.get(_key)
+            _loads, _evictions, _total_load_time, _last_load_time = ModelManager._metrics.get(_key, [0, 0, 0.0, 0.0])
+
+            return ModelMetrics(name, _entry is not None, _entry.references if _entry is not None else 0, _loads, _evictions, _total_load_time, _last_load_time, _key[1])
+
+##-------------------start-of-_get_profile()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def _get_profile(profile:str | None) -> str:
+
+        """
+
+        Gets the profile to use, checking it exists.
+
+        Parameters:
+        profile (str | None) : The profile, or None for ModelManager.profile.
+
+        Returns:
+        profile (str) : The profile.
+
+        Raises:
+        ValueError : If the profile is not one of PROFILES.
+
+        """
+
+        _profile = profile or ModelManager.profile
+
+        if(_profile not in PROFILES):
+            raise ValueError(f"Unknown profile {_profile!r}, must be one of {PROFILES}.")
+
+        return _profile
+
+##-------------------start-of-_evict_if_idle()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def _evict_if_idle(key:typing.Tuple[str, str], entry:_ManagedModel) -> None:
+
+        """
+
+        Evicts a model once its idle timeout is up, unless it was acquired again since.
+
+        Parameters:
+        key (tuple - (str, str)) : The name and profile of the model.
+        entry (object - _ManagedModel) : The model as it was when released.
+
+        """
+
+        with ModelManager._lock:
+
+            if(ModelManager._models.get(key) is entry and entry.references == 0):
+                ModelManager._evict(key)
+
+##-------------------start-of-_evict()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def _evict(key:typing.Tuple[str, str]) -> None:
+
+        """
+
+        Drops a model and frees its memory.
+
+        Parameters:
+        key (tuple - (str, str)) : The name and profile of the model.
+
+        """
+
+        _entry = ModelManager._models.pop(key)
+
+        if(_entry.timer is not None):
+            _entry.timer.cancel()
+
+        ModelManager._metrics[key][1] += 1
+
+        del _entry
+        gc.collect()
+
+##-------------------start-of-_is_over_memory()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @staticmethod
+    def _is_over_memory() -> bool:
+
+        """
+
+        Checks if the process is using more resident memory than max_memory. Only possible where /proc is available, elsewhere this is always False.
+
+        Returns:
+        bool : True if over max_memory, False otherwise.
+
+        """
+
+        if(ModelManager.max_memory is None):
+            return False
+
+        try:
+            with open("/proc/self/statm", "r") as _file:
+                _resident_pages = int(_file.read().split()[1])
+
+        except (OSError, ValueError, IndexError):
+            return False
+
+        return _resident_pages * os.sysconf("SC_PAGE_SIZE") > ModelManager.max_memory
+
+##-------------------start-of-_load_model()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def _load_model(name:str, profile:str) -> spacy.language.Language:
+
+    """
+
+    Loads a spacy model with a profile.
+
+    The ner-only profile leaves out the components that never feed the NER, then removes whatever else the NER doesn't listen to, such as a tok2vec only the parser used.
+    The vectors are dropped too, unless the NER was trained with them, as in the md and lg pipelines. The entities found are the same as with the full pipeline.
+
+    Parameters:
+    name (str) : The name of the model.
+    profile (str) : The profile, one of PROFILES.
+
+    Returns:
+    model (spacy.language.Language) : The model.
+
+    Raises:
+    SpacyModelNotFound : If the model is not installed.
+
+    """
+
+    try:
+        if(profile == "full"):
+            return spacy.load(name)
+
+        _model = spacy.load(name, exclude=_NON_NER_COMPONENTS)
+
+    except Exception:
+        raise SpacyModelNotFound
+
+    _kept = {"ner"}
+
+    for _name, _component in _model.pipeline:
+        if("ner" in getattr(_component, "listening_components", [])):
+            _kept.add(_name)
+
+    for _name in [_name for _name in _model.pipe_names if _name not in _kept]:
+        _model.remove_pipe(_name)
+
+    if(not any(_uses_vectors(_model.config["components"][_name]) for _name in _model.pipe_names)):
+        _model.vocab.reset_vectors(shape=(0, 0))
+
+    return _model
+
+##-------------------start-of-_uses_vectors()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def _uses_vectors(config:typing.Any) -> bool:
+
+    """
+
+    Checks if the config of a component has a model that reads static vectors.
+
+    Parameters:
+    config (any) : The config, or a part of it.
+
+    Returns:
+    bool : True if it reads static vectors, False otherwise.
+
+    """
+
+    if(isinstance(config, dict)):
+        return bool(config.get("include_static_vectors") or config.get("pretrained_vectors")) or any(_uses_vectors(_value) for _value in config.values())
+
+    if(isinstance(config, (list, tuple))):
+        return any(_uses_vectors(_value) for _value in config)
+
+    return False
@@ -0,0 +1,420 @@
+## Copyright 2024 Kaden Bilyeu (Bikatr7) (https://github.com/Bikatr7) (https://github.com/Bikatr7/Kairyou)
+## Use of this source code is governed by a GNU Lesser General Public License v2.1
+## license that can be found in the LICENSE file.
+
+## built-in libraries
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import typing
+
+## third-party libraries
+import spacy
+import regex
+
+## custom modules
+from .backends import NERBackend, SpacyBackend
+from .cache import NERCache
+from .types import Entity
+
+## where a sentence ends, a run of them such as 。」 is one end
+_sentence_ends = regex.compile(r"[。！？」]+")
+
+##-------------------start-of-NERRunner---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class NERRunner:
+
+    """
+
+    Runs a NER backend over lines, in batches that a spacy backend can spread over several processes.
+
+    Every NER call of KairyouClient and Indexer goes through one of these. If it has a NERCache, lines are looked up in it first and only the rest are parsed.
+    Lines longer than chunk_size, such as whole paragraphs of scraped web novels, are split into sentences for the backend, see chunk_line(), and the entities found are put back together.
+
+    """
+
+##-------------------start-of-__init__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__(self, batch_size:int = 256, n_process:int = 1, cache:NERCache | None = None, chunk_size:int | None = 2000) -> None:
+
+        """
+
+        Creates the runner.
+
+        Parameters:
+        batch_size (int | optional | default=256) : How many lines spacy parses at a time.
+        n_process (int | optional | default=1) : How many processes spacy parses with. Only used when there are enough lines to give each process a full batch, as starting them costs more than a few lines take.
+        cache (NERCache | optional | default=None) : A persistent cache of NER results to look lines up in before parsing them. Only used with backends that have a model_key.
+        chunk_size (int | optional | default=2000) : The longest line, in characters, the backend is given whole. Longer lines are parsed a chunk of sentences at a time. None to always parse whole lines.
+
+        Raises:
+        ValueError : If batch_size, n_process, or chunk_size is less than 1.
+
+        """
+
+        if(batch_size < 1 or n_process < 1 or (chunk_size is not None and chunk_size < 1)):
+            raise ValueError("batch_size, n_process, and chunk_size must be at least 1.")
+
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.cache = cache
+        self.chunk_size = chunk_size
+
+##-------------------start-of-parse()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def parse(self, ner:spacy.language.Language | NERBackend, line:str) -> typing.Tuple[Entity, ...]:
+
+        """
+
+        Parses a single line.
+
+        Parameters:
+        ner (spacy.language.Language | NERBackend) : The backend, or a spacy model to use as one.
+        line (str) : The line.
+
+        Returns:
+        entities (tuple - Entity) : The entities in the line, in order.
+
+        """
+
+        ## a long line is parsed as several chunks, which pipe() puts back together
+        if(self.chunk_size is not None and len(line) > self.chunk_size):
+            return tuple(self.pipe(ner, (line,)))[0]
+
+        _backend = _as_backend(ner)
+        _model = _backend.model_key if self.cache is not None else None
+
+        if(_model is None):
+            return next(iter(_backend.pipe((line,), self.batch_size, 1)))
+
+        _cache:NERCache = self.cache ## type: ignore (checked above)
+
+        _cached = _cache.get_many(_model, (line,))
+
+        if(line in _cached):
+            return _cached[line]
+
+        _entities = next(iter(_backend.pipe((line,), self.batch_size, 1)))
+
+        _cache.put_many(_model, ((line, _entities),))
+
+        return _entities
+
+##-------------------start-of-pipe()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def pipe(self, ner:spacy.language.Language | NERBackend, lines:typing.Sequence[str]) -> typing.Generator[typing.Tuple[Entity, ...], None, None]:
+
+        """
+
+        Parses many lines in batches.
+
+        Parameters:
+        ner (spacy.language.Language | NERBackend) : The backend, or a spacy model to use as one.
+        lines (sequence - str) : The lines.
+
+        Returns:
+        entities (tuple - Entity) : The entities in each line, in order, as each batch is done.
+
+        """
+
+        _backend = _as_backend(ner)
+
+        if(self.chunk_size is None or all(len(_line) <= self.chunk_size for _line in lines)):
+            yield from self._pipe_cached(_backend, lines)
+            return
+
+        ## the chunks are parsed and cached as lines of their own, then the entities of each are moved back to where the chunk starts in its line
+        _chunks = [chunk_line(_line, self.chunk_size) for _line in lines]
+        _parsed = self._pipe_cached(_backend, [_line[_start:_end] for _line, _spans in zip(lines, _chunks) for _start, _end in _spans])
+
+        try:
+
+            for _spans in _chunks:
+                yield tuple(Entity(_entity.text, _entity.label, _entity.start_char + _start, _entity.end_char + _start) for _start, _ in _spans for _entity in next(_parsed))
+
+        finally:
+            _parsed.close()
+
+##-------------------start-of-pipe_stream()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def pipe_stream(self, ner:spacy.language.Language | NERBackend, lines:typing.Iterable[str], lines_per_block:int | None = None) -> typing.Generator[typing.Tuple[Entity, ...], None, None]:
+
+        """
+
+        Parses lines that are read as they are needed, such as those of a knowledge base too large to hold in memory, a block at a time.
+
+        The next block is read in a background thread while the current one is parsed, so reading overlaps with NER, and no more than two blocks are held at once.
+
+        Parameters:
+        ner (spacy.language.Language | NERBackend) : The backend, or a spacy model to use as one.
+        lines (iterable - str) : The lines. Only read from by one thread at a time.
+        lines_per_block (int | optional | default=None) : How many lines are parsed at a time. Defaults to four batches for each process.
+
+        Returns:
+        entities (tuple - Entity) : The entities in each line, in order, as each batch is done.
+
+        Raises:
+        ValueError : If lines_per_block is less than 1.
+
+        """
+
+        _lines_per_block = lines_per_block if lines_per_block is not None else self.batch_size * self.n_process * 4
+
+        if(_lines_per_block < 1):
+            raise ValueError("lines_per_block must be at least 1.")
+
+        _lines = iter(lines)
+
+        def _read_block() -> typing.List[str]:
+            return list(itertools.islice(_lines, _lines_per_block))
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="kairyou-reader") as _reader:
+
+            _next_block = _reader.submit(_read_block)
+
+            while(True):
+
+                _block = _next_block.result()
+
+                if(not _block):
+                    return
+
+                _next_block = _reader.submit(_read_block)
+
+                yield from self.pipe(ner, _block)
+
+##-------------------start-of-_pipe_cached()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _pipe_cached(self, backend:NERBackend, lines:typing.Sequence[str]) -> typing.Generator[typing.Tuple[Entity, ...], None, None]:
+
+        """
+
+        Parses many lines in batches, looking them up in the cache first if there is one.
+
+        Parameters:
+        backend (NERBackend) : The backend.
+        lines (sequence - str) : The lines.
+
+        Returns:
+        entities (tuple - Entity) : The entities in each line, in order, as each batch is done.
+
+        """
+
+        _model = backend.model_key if self.cache is not None else None
+
+        if(_model is None):
+            yield from self._pipe(backend, lines)
+            return
+
+        _cache:NERCache = self.cache ## type: ignore (checked above)
+
+        _cached = _cache.get_many(_model, lines)
+        _missing = [_line for _line in dict.fromkeys(lines) if _line not in _cached]
+
+        ## the missing lines are parsed in the order they first appear, so they are only parsed as far as the caller has read
+        _parsed = zip(_missing, self._pipe(backend, _missing))
+        _pending:typing.List[typing.Tuple[str, typing.Tuple[Entity, ...]]] = []
+
+        try:
+
+            for _line in lines:
+
+                while(_line not in _cached):
+
+                    _entry = next(_parsed)
+                    _cached[_entry[0]] = _entry[1]
+                    _pending.append(_entry)
+
+                    if(len(_pending) >= self.batch_size):
+                        _cache.put_many(_model, _pending)
+                        _pending = []
+
+                yield _cached[_line]
+
+        ## lines parsed before the caller stopped reading are still cached
+        finally:
+            _cache.put_many(_model, _pending)
+
+##-------------------start-of-_pipe()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _pipe(self, backend:NERBackend, lines:typing.Sequence[str]) -> typing.Generator[typing.Tuple[Entity, ...], None, None]:
+
+        """
+
+        Parses many lines in batches, without the cache.
+
+        Parameters:
+        ner (spacy.language.Language | NERBackend) : The backend, or a spacy model to use as one.
+        lines (sequence - str) : The lines.
+
+        Returns:
+        entities (tuple - Entity) : The entities in each line, in order, as each batch is done.
+
+        """
+
+        ## nothing to parse, such as when every line was cached
+        if(not lines):
+            return
+
+        _n_process = self.n_process if len(lines) >= self.batch_size * self.n_process else 1
+
+        yield from backend.pipe(lines, self.batch_size, _n_process)
+
+##-------------------start-of-chunk_line()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def chunk_line(line:str, chunk_size:int) -> typing.List[typing.Tuple[int, int]]:
+
+    """
+
+    Splits a line into chunks of whole sentences, ending after 。, ！, ？, or 」, each at most chunk_size characters long.
+
+    A sentence longer than chunk_size on its own is cut every chunk_size characters.
+
+    Parameters:
+    line (str) : The line.
+    chunk_size (int) : The longest a chunk can be.
+
+    Returns:
+    chunks (list - tuple - int) : The start and end of each chunk in the line, in order. Together they cover the whole line.
+
+    """
+
+    if(len(line) <= chunk_size):
+        return [(0, len(line))]
+
+    _chunks:typing.List[typing.Tuple[int, int]] = []
+    _start = _end = 0
+
+    for _sentence_end in [_match.end() for _match in _sentence_ends.finditer(line)] + [len(line)]:
+
+        if(_sentence_end - _start > chunk_size):
+
+            if(_end > _start):
+                _chunks.append((_start, _end))
+                _start = _end
+
+            while(_sentence_end - _start > chunk_size):
+                _chunks.append((_start, _start + chunk_size))
+                _start += chunk_size
+
+        _end = _sentence_end
+
+    if(_end > _start):
+        _chunks.append((_start, _end))
+
+    return _chunks
+
+##-------------------start-of-_as_backend()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def _as_backend(ner:spacy.language.Language | NERBackend) -> NERBackend:
+
+    """
+
+    Gets the backend to run, wrapping a spacy model in a SpacyBackend.
+
+    Parameters:
+    ner (spacy.language.Language | NERBackend) : The backend, or a spacy model.
+
+    Returns:
+    backend (NERBackend) : The backend.
+
+    """
+
+    return ner if isinstance(ner, NERBackend) else SpacyBackend(nlp=ner)
+
+##-------------------start-of-_SpanIndex---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class _SpanIndex:
+
+    """
+
+    The PERSON spans of a whole text, kept valid as the text is edited, so the text only has to be parsed once.
+
+    Spans are kept in order of where they start, and edits are mapped through them in a single merge. A span an edit touches is dropped, as it no longer holds the name NER found.
+
+    """
+
+    def __init__(self, spans:typing.Iterable[Entity]) -> None:
+
+        _spans = sorted(spans, key=lambda _span: _span.start_char)
+
+        self.starts = [_span.start_char for _span in _spans]
+        self.ends = [_span.end_char for _span in _spans]
+        self.alive = [True] * len(_spans)
+
+        ## the spans of each name, in order
+        self._by_text:typing.Dict[str, typing.List[int]] = {}
+
+        for _index, _span in enumerate(_spans):
+            self._by_text.setdefault(_span.text, []).append(_index)
+
+##-------------------start-of-find()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def find(self, text:str) -> typing.List[int]:
+
+        """
+
+        Finds the spans of a name.
+
+        Parameters:
+        text (str) : The name.
+
+        Returns:
+        spans (list - int) : The index of each live span whose text is the name, in order.
+
+        """
+
+        return [_index for _index in self._by_text.get(text, []) if self.alive[_index]]
+
+##-------------------start-of-drop()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def drop(self, spans:typing.Iterable[int]) -> None:
+
+        """
+
+        Drops spans, such as ones that were replaced.
+
+        Parameters:
+        spans (iterable - int) : The index of each span.
+
+        """
+
+        for _index in spans:
+            self.alive[_index] = False
+
+##-------------------start-of-apply()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def apply(self, edits:typing.Sequence[typing.Tuple[int, int, int]]) -> None:
+
+        """
+
+        Maps the spans through edits made to the text, moving the ones after an edit and dropping the ones an edit touches.
+
+        Parameters:
+        edits (sequence - tuple (int, int, int)) : The start and end of each edit in the text before it, and the length of what replaced it. In order and not overlapping, as one scan makes them.
+
+        """
+
+        if(not edits):
+            return
+
+        _edit = 0
+        _shift = 0
+
+        for _index, _start in enumerate(self.starts):
+
+            if(not self.alive[_index]):
+                continue
+
+            _end = self.ends[_index]
+
+            ## edits that end before the span only move it
+            while(_edit < len(edits) and edits[_edit][1] <= _start):
+                _shift += edits[_edit][2] - (edits[_edit][1] - edits[_edit][0])
+                _edit += 1
+
+            if(_edit < len(edits) and edits[_edit][0] < _end):
+                self.alive[_index] = False
+                continue
+
+            self.starts[_index] = _start + _shift
+            self.ends[_index] = _end + _shift
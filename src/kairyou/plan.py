@@ -0,0 +1,901 @@
+## Copyright 2024 Kaden Bilyeu (Bikatr7) (https://github.com/Bikatr7) (https://github.com/Bikatr7/Kairyou)
+## Use of this source code is governed by a GNU Lesser General Public License v2.1
+## license that can be found in the LICENSE file.
+
+## built-in libraries
+import collections
+import itertools
+import threading
+import hashlib
+import typing
+import json
+import os
+
+## custom modules
+from .katakana_util import KatakanaUtil
+from .matcher import MultiPatternMatcher, ReplacementPass, compile_replacement_passes, _can_create
+from .util import _validate_replacement_json, Name, ReplacementType, _kudasai_blank_json, _fukuin_blank_json
+from .exceptions import InvalidReplacementJsonName, InvalidReplacementJsonPath
+
+## How japanese names are separated in the japanese text
+_JAPANESE_NAME_SEPARATORS = ["・", ""]
+
+## How many compiled plans are kept for jsons passed straight to preprocessing, see _get_replacement_plan()
+_PLAN_CACHE_SIZE = 8
+
+_plan_cache:collections.OrderedDict = collections.OrderedDict()
+_plan_cache_lock = threading.Lock()
+
+##-------------------start-of-NameVariant---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class NameVariant(typing.NamedTuple):
+
+    """
+
+    One form a name can take in the text, such as the full name or just the first name.
+
+    bare_replacement is how the variant is replaced when it appears without an honorific:
+    - None : it is only replaced alongside an honorific.
+    - "plain" : it is replaced everywhere.
+    - "enhanced" : it is only replaced where NER says it is a person.
+    - "unlogged" : it is not replaced, and the variant is left out of the log. (katakana that turned out to be an actual word)
+
+    """
+
+    jap:str
+    eng:str
+    bare_replacement:typing.Literal["plain", "enhanced", "unlogged"] | None
+
+##-------------------start-of-CompiledName---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class CompiledName(typing.NamedTuple):
+
+    """
+
+    A name entry from the replacement json, expanded into the variants it is replaced as.
+
+    If the entry is invalid, variants is empty and error holds what would have been written to the error log.
+
+    """
+
+    name:Name
+    json_key:str
+    variants:typing.Tuple[NameVariant, ...]
+    error:str | None
+
+##-------------------start-of-PlanOp---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class PlanOp(typing.NamedTuple):
+
+    """
+
+    A single replacement of the plan, in the order the replacements are made. Every replacement made while preprocessing is counted against one of these.
+
+    Kinds:
+    - word : An entry of a non-name category, or a katakana word.
+    - honorific : A name variant followed by an honorific, jap and eng are the full japanese and replacement. (e.g. 綾小路さん → Ayanokōji-san)
+    - plain : A name variant on its own, replaced everywhere.
+    - enhanced : A name variant on its own, only replaced where NER says it is a person.
+
+    """
+
+    kind:typing.Literal["word", "honorific", "plain", "enhanced"]
+    jap:str
+    eng:typing.Any
+
+    ## For name ops, the index of the variant in ReplacementPlan.variants and for honorifics, the english honorific.
+    variant:int | None = None
+    honorific:str | None = None
+
+##-------------------start-of-PlanVariant---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class PlanVariant(typing.NamedTuple):
+
+    """
+
+    A name variant of the plan, which is logged as one line with the counts of all of its ops.
+
+    guard holds the earlier variants with the same japanese. If any of them made a logged replacement, this one is skipped entirely.
+
+    """
+
+    jap:str
+    eng:str
+    ops:typing.Tuple[int, ...]
+    unlogged:bool
+    guard:typing.Tuple[int, ...]
+
+##-------------------start-of-PlanStep---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class PlanStep(typing.NamedTuple):
+
+    """
+
+    Something preprocessing does to the text, in order. Each step makes the replacements of one or more ops.
+
+    Kinds:
+    - pass : A ReplacementPass over the text, see compile_replacement_passes().
+    - enhanced : A single enhanced op.
+    - sequential : Ops made one at a time with str.replace(), for replacements that are not strings. A failure is logged against the op and the next op is tried.
+    - category : The same as sequential, but a failure stops the rest of the ops in the step, as it does for a whole category.
+
+    """
+
+    kind:typing.Literal["pass", "enhanced", "sequential", "category"]
+    ops:typing.Tuple[int, ...]
+    replacement_pass:ReplacementPass | None = None
+
+    ## If set, the step is skipped when the variant with this index is, see PlanVariant.
+    guard:int | None = None
+
+    ## For category steps, the json key named in the error log.
+    json_key:str | None = None
+
+    ## The patterns the step looks for, None if it has to run whatever the text holds (sequential and category steps, and passes with an empty pattern).
+    ## A step with none of its patterns in the text is skipped, unless one of its creators, the earlier steps whose replacements could form one of them, changed the text first.
+    patterns:typing.FrozenSet[str] | None = None
+    creators:typing.Tuple[int, ...] = ()
+
+##-------------------start-of-ReplacementPlan---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class ReplacementPlan(typing.NamedTuple):
+
+    """
+
+    A replacement json with all the per-call setup already done: validation, name variant expansion, katakana classification, whitelist lookups and ordering.
+
+    Build it once with Kairyou.compile() and pass it to Kairyou.preprocess() in place of the json to reuse it across calls. It is never modified by preprocessing.
+
+    """
+
+    json_type:typing.Literal["kudasai", "fukuin"]
+
+    ## If the json given was a blank one, in which case preprocessing is skipped.
+    is_blank:bool
+
+    ## Both fukuin and kudasai jsons have the honorifics key
+    honorifics:typing.Tuple[typing.Tuple[str, str], ...]
+
+    ops:typing.Tuple[PlanOp, ...]
+    variants:typing.Tuple[PlanVariant, ...]
+    steps:typing.Tuple[PlanStep, ...]
+
+    ## What is logged, in order. ("op", op index) for words, ("variant", variant index) for names, and ("error", message) for invalid entries.
+    entries:typing.Tuple[typing.Tuple[str, typing.Any], ...]
+
+    ## Used for tracking and postprocessing.
+    kutouten:typing.FrozenSet[str]
+    full_names:typing.Tuple[str, ...]
+
+    ## If no replacement can match or create a line break, in which case the text can be split into chunks of lines and each replaced on its own.
+    is_line_local:bool
+
+    ## If any op is an enhanced one, which are the only ones that need NER. If not, the spacy model is never loaded.
+    needs_ner:bool
+
+    ## Matches the patterns of every step in one scan, to find the steps a text can skip, see PlanStep.
+    scanner:MultiPatternMatcher
+
+##-------------------start-of-load_replacement_json()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def _load_replacement_json(replacement_json:typing.Union[dict, str]) -> dict:
+
+    """
+
+    Loads the replacement json if given as a path.
+
+    Parameters:
+    replacement_json (dict | str) : The rules for preprocessing. Can be a dictionary or a path to a json file.
+
+    Returns:
+    replacement_json (dict) : The rules for preprocessing.
+
+    Raises:
+    InvalidReplacementJsonPath : If the path could not be loaded.
+
+    """
+
+    if(isinstance(replacement_json, str)):
+        ## try to load the replacement json file
+        try:
+
+            with open(replacement_json, 'r', encoding='utf-8') as file:
+                return json.load(file)
+
+        except Exception:
+            raise InvalidReplacementJsonPath(replacement_json)
+
+    return replacement_json
+
+##-------------------start-of-compile_replacement_plan()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def _compile_replacement_plan(replacement_json:typing.Union[dict, str]) -> ReplacementPlan:
+
+    """
+
+    Compiles a replacement json into a ReplacementPlan. See Kairyou.compile().
+
+    Parameters:
+    replacement_json (dict | str) : The rules for preprocessing. Can be a dictionary or a path to a json file.
+
+    Returns:
+    plan (ReplacementPlan) : The compiled plan.
+
+    Raises:
+    InvalidReplacementJsonPath : If the path could not be loaded.
+    InvalidReplacementJsonKeys : If the replacement json is missing keys.
+
+    """
+
+    ## only a blank dict skips preprocessing, a path to a blank json never has
+    _is_blank = replacement_json == _kudasai_blank_json or replacement_json == _fukuin_blank_json
+
+    _replacement_json = _load_replacement_json(replacement_json)
+
+    _json_type, _replacement_rules = _validate_replacement_json(_replacement_json)
+
+    _whitelist = _replacement_json.get('enhanced_check_whitelist', {})
+
+    _builder = _PlanBuilder(tuple(_replacement_json['honorifics'].items()))
+
+    _katakana_entries = []
+
+    for _rule in _replacement_rules:
+
+        ## unpack the rule
+        _, _json_key, _is_name, _replace_name_param, _honorific_type = _rule
+
+        if(_is_name == True):
+
+            ## an invalid name stops the rest of the category
+            for _eng, _jap in _replacement_json[_json_key].items():
+
+                try:
+                    ## makes jap entries into a list if not already
+                    if(isinstance(_jap, list) == False):
+                        _jap = [_jap]
+
+                    _current_name = Name(" ".join(_jap), _eng)
+
+                    ## katakana is replaced at the end
+                    if(KatakanaUtil.is_katakana_only(_current_name.jap)):
+                        continue
+
+                    _builder.add_name(_compile_name(_current_name, _replace_name_param, _honorific_type, _json_key, _json_type, _whitelist, is_katakana=False))
+
+                except Exception as _e:
+                    _builder.add_error(_format_error(_json_key, _e))
+                    break
+
+            ## unlike the category above, a bad entry here is an actual exception, as it always has been
+            for _eng, _jap in _replacement_json[_json_key].items():
+
+                ## makes jap entries into a list if not already
+                if(isinstance(_jap, list) == False):
+                    _jap = [_jap]
+
+                _current_name = Name(" ".join(_jap), _eng)
+
+                if(KatakanaUtil.is_katakana_only(_current_name.jap) and not KatakanaUtil.is_actual_word(_current_name.jap)):
+
+                    try:
+                        _katakana_entries.append(_compile_name(_current_name, _replace_name_param, _honorific_type, _json_key, _json_type, _whitelist, is_katakana=True))
+
+                    except Exception as _e:
+                        _katakana_entries.append(CompiledName(_current_name, _json_key, (), _format_error(_json_key, _e)))
+
+        else:
+
+            _entries = tuple(_replacement_json[_json_key].items())
+
+            _builder.add_words(_entries, _json_key)
+
+            for _jap, _eng in _entries:
+
+                if(KatakanaUtil.is_katakana_only(_jap) and not KatakanaUtil.is_actual_word(_jap)):
+                    _katakana_entries.append((_jap, _eng))
+
+    ## Sort the katakana entries by the length of Japanese phrases in descending order
+    _katakana_entries.sort(key=lambda _entry: len(
+        _entry.name.jap if isinstance(_entry, CompiledName) else _entry[0]), reverse=True)
+
+    for _entry in _katakana_entries:
+
+        if(not isinstance(_entry, CompiledName)):
+            _builder.add_words((_entry,), None)
+
+        elif(_entry.error is not None):
+            _builder.add_error(_entry.error)
+
+        else:
+            _builder.add_name(_entry)
+
+    _builder.flush()
+
+    _is_line_local = all(len(_op.jap) > 0 and "\n" not in _op.jap and not (isinstance(_op.eng, str) and "\n" in _op.eng) for _op in _builder.ops)
+
+    return ReplacementPlan(json_type=_json_type,
+                           is_blank=_is_blank,
+                           honorifics=_builder.honorifics,
+                           ops=tuple(_builder.ops),
+                           variants=tuple(_builder.variants),
+                           steps=tuple(_builder.steps),
+                           entries=tuple(_builder.entries),
+                           kutouten=frozenset(_replacement_json.get('kutouten', {})),
+                           full_names=tuple(_replacement_json['full_names'].keys()) if _json_type == "kudasai" else (),
+                           is_line_local=_is_line_local,
+                           needs_ner=any(_op.kind == "enhanced" for _op in _builder.ops),
+                           scanner=MultiPatternMatcher(itertools.chain.from_iterable(_step.patterns for _step in _builder.steps if _step.patterns is not None)))
+
+##-------------------start-of-_get_replacement_plan()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def _get_replacement_plan(replacement_json:typing.Union[dict, str, ReplacementPlan]) -> ReplacementPlan:
+
+    """
+
+    Gets the plan for a replacement json, compiling it only if it hasn't been compiled since it last changed.
+
+    A path is known by its modification time and size, a dict by a hash of its contents, so passing the same json to every preprocess call only compiles it once.
+    The last _PLAN_CACHE_SIZE plans are kept. A dict whose contents can't be hashed is compiled every time.
+
+    Parameters:
+    replacement_json (dict | str | ReplacementPlan) : The rules for preprocessing. Can be a dictionary, a path to a json file, or a plan, which is returned as is.
+
+    Returns:
+    plan (ReplacementPlan) : The compiled plan.
+
+    Raises:
+    InvalidReplacementJsonPath : If the path could not be loaded.
+    InvalidReplacementJsonKeys : If the replacement json is missing keys.
+
+    """
+
+    if(isinstance(replacement_json, ReplacementPlan)):
+        return replacement_json
+
+    _key = _get_plan_cache_key(replacement_json)
+
+    if(_key is None):
+        return _compile_replacement_plan(replacement_json)
+
+    with _plan_cache_lock:
+
+        _plan = _plan_cache.get(_key)
+
+        if(_plan is not None):
+            _plan_cache.move_to_end(_key)
+            return _plan
+
+    _plan = _compile_replacement_plan(replacement_json)
+
+    with _plan_cache_lock:
+
+        _plan_cache[_key] = _plan
+        _plan_cache.move_to_end(_key)
+
+        while(len(_plan_cache) > _PLAN_CACHE_SIZE):
+            _plan_cache.popitem(last=False)
+
+    return _plan
+
+##-------------------start-of-_get_plan_cache_key()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def _get_plan_cache_key(replacement_json:typing.Union[dict, str]) -> typing.Tuple[str, ...] | None:
+
+    """
+
+    Gets what a replacement json's compiled plan is cached under.
+
+    Parameters:
+    replacement_json (dict | str) : A dictionary or a path to a json file.
+
+    Returns:
+    key (tuple - str) : The key, None if the json can't be cached.
+
+    """
+
+    if(isinstance(replacement_json, str)):
+
+        try:
+            _stat = os.stat(replacement_json)
+
+        ## left to compiling to raise
+        except OSError:
+            return None
+
+        return ("path", os.path.abspath(replacement_json), str(_stat.st_mtime_ns), str(_stat.st_size))
+
+    ## repr keeps the key order, which is the rule order, and tells lists from tuples, which compile differently
+    try:
+        return ("dict", hashlib.sha256(repr(replacement_json).encode("utf-8")).hexdigest())
+
+    except Exception:
+        return None
+
+##-------------------start-of-_get_fingerprint()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def _get_fingerprint(plan:ReplacementPlan) -> str:
+
+    """
+
+    Gets a fingerprint of what a plan does to a text, which is the same for plans compiled from the same rules.
+
+    Parameters:
+    plan (ReplacementPlan) : The plan.
+
+    Returns:
+    fingerprint (str) : A hex digest of the plan's ops, steps and full names.
+
+    """
+
+    _steps = tuple((_step.kind, _step.ops, _step.guard) for _step in plan.steps)
+    _ops = tuple((_op.kind, _op.jap, _op.eng, _op.variant) for _op in plan.ops)
+
+    return hashlib.sha256(repr((plan.json_type, _ops, _steps, plan.full_names)).encode("utf-8")).hexdigest()
+
+##-------------------start-of-_get_changed_patterns()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def _get_changed_patterns(previous_plan:ReplacementPlan, plan:ReplacementPlan) -> typing.Tuple[typing.FrozenSet[str], typing.FrozenSet[str]] | None:
+
+    """
+
+    Works out which japanese a line has to contain for a change from one plan to the next to make a difference to it. See KairyouClient.preprocess_incremental().
+
+    Ops are matched up by kind, japanese and replacement, so an entry that was added, removed or modified in any category leaves ops only one of the plans has, and their japanese is changed.
+    The ops both plans have must be made in the same order in both, or any line could come out differently.
+    A changed op can only match in a line if its japanese is in the line to begin with, or is created by the replacement of another op that matched first.
+    So any op whose replacement could create a changed japanese has its own japanese added, until nothing more is.
+
+    Parameters:
+    previous_plan (ReplacementPlan) : The plan the text was preprocessed with.
+    plan (ReplacementPlan) : The new plan.
+
+    Returns:
+    patterns (frozenset - str) : The japanese that makes a line need preprocessing again.
+    full_names (frozenset - str) : The full names only one of the plans corrects missing spaces for.
+    None if the plans can't be compared line by line, in which case the whole text needs preprocessing again.
+
+    """
+
+    if(previous_plan.json_type != plan.json_type):
+        return None
+
+    ## a failing op of a category step stops the ops after it, so whether those are made doesn't show in the ops themselves
+    if(any(_step.kind in ("sequential", "category") for _step in itertools.chain(previous_plan.steps, plan.steps))):
+        return None
+
+    _previous_keys = [(_op.kind, _op.jap, _op.eng) for _op in previous_plan.ops]
+    _keys = [(_op.kind, _op.jap, _op.eng) for _op in plan.ops]
+
+    _previous_counts = collections.Counter(_previous_keys)
+    _counts = collections.Counter(_keys)
+
+    _changed = {_key for _key in _previous_counts.keys() | _counts.keys() if _previous_counts[_key] != _counts[_key]}
+
+    if([_key for _key in _previous_keys if _key not in _changed] != [_key for _key in _keys if _key not in _changed]):
+        return None
+
+    ## full names are corrected one after another, so the ones both plans have must be in the same order too
+    _previous_full_names, _full_names = set(previous_plan.full_names), set(plan.full_names)
+
+    if([_name for _name in previous_plan.full_names if _name in _full_names] != [_name for _name in plan.full_names if _name in _previous_full_names]):
+        return None
+
+    _patterns = {_jap for _, _jap, _ in _changed}
+    _new_patterns = set(_patterns)
+
+    _replacements = {(_op.jap, _op.eng) for _op in itertools.chain(previous_plan.ops, plan.ops)}
+
+    while(_new_patterns):
+
+        _characters = set("".join(_new_patterns))
+        _added = set()
+
+        for _jap, _eng in _replacements:
+
+            if(_jap in _patterns or _jap in _added):
+                continue
+
+            ## a replacement that shares no character with a pattern can only create it by removing text
+            if(_eng != "" and _characters.isdisjoint(_eng)):
+                continue
+
+            if(any(_can_create(_eng, _pattern) for _pattern in _new_patterns)):
+                _added.add(_jap)
+
+        _patterns |= _added
+        _new_patterns = _added
+
+    return frozenset(_patterns), frozenset(_previous_full_names ^ _full_names)
+
+##-------------------start-of-_PlanBuilder---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class _PlanBuilder:
+
+    """
+
+    Lays out the ops of a plan in the order they are made and groups them into steps.
+
+    Plain replacements are collected until something has to happen between them and the next one (an enhanced replacement, or a variant that may be skipped),
+    and are then split into as few passes as possible. That's what lets every name and honorific combination be found in one scan instead of one per combination.
+
+    """
+
+##-------------------start-of-__init__()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__(self, honorifics:typing.Tuple[typing.Tuple[str, str], ...]) -> None:
+
+        self.honorifics = honorifics
+
+        self.ops:typing.List[PlanOp] = []
+        self.variants:typing.List[PlanVariant] = []
+        self.steps:typing.List[PlanStep] = []
+        self.entries:typing.List[typing.Tuple[str, typing.Any]] = []
+
+        ## variants by japanese, to guard the ones that repeat it
+        self._variants_by_jap:typing.Dict[str, typing.List[int]] = {}
+
+        ## plain ops not yet put in a step
+        self._pending:typing.List[int] = []
+
+        ## the steps making each replacement, by every character of the replacement and by its first one, and the steps with an empty replacement, see _add_step()
+        self._writers_by_char:typing.Dict[str, typing.Dict[str, typing.Set[int]]] = {}
+        self._writers_by_start:typing.Dict[str, typing.Dict[str, typing.Set[int]]] = {}
+        self._empty_writers:typing.List[int] = []
+
+##-------------------start-of-add_words()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def add_words(self, entries:typing.Tuple[typing.Tuple[str, typing.Any], ...], json_key:str | None) -> None:
+
+        """
+
+        Adds a non-name category, or a single katakana word if json_key is None.
+
+        Parameters:
+        entries (tuple - tuple (str, any)) : The japanese and its replacement for every entry, in rule order.
+        json_key (str | None) : The category, named in the error log if a replacement fails.
+
+        """
+
+        _ops = []
+
+        for _jap, _eng in entries:
+            _ops.append(len(self.ops))
+            self.ops.append(PlanOp("word", _jap, _eng))
+            self.entries.append(("op", _ops[-1]))
+
+        ## the automaton only deals in strings, anything else goes through the old path so it fails the same way it always has
+        if(all(isinstance(_eng, str) for _, _eng in entries)):
+            self._pending.extend(_ops)
+
+        else:
+            self.flush()
+            self._add_step(PlanStep("category" if json_key is not None else "sequential", tuple(_ops), json_key=json_key))
+
+##-------------------start-of-add_name()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def add_name(self, compiled_name:CompiledName) -> None:
+
+        """
+
+        Adds the variants of a name, each as its honorific ops followed by its bare op.
+
+        Parameters:
+        compiled_name (object - CompiledName) : The name.
+
+        """
+
+        _previous = None
+
+        for _variant in compiled_name.variants:
+
+            ## a variant repeating the one right before it can never replace anything, the text hasn't changed since that one found nothing,
+            ## and if it did find something, this one would be skipped
+            if(_variant == _previous and _variant.bare_replacement != "unlogged"):
+                continue
+
+            _previous = _variant
+
+            _index = len(self.variants)
+            _guard = tuple(self._variants_by_jap.get(_variant.jap, ()))
+
+            if(_guard and self._is_redundant(_variant, _guard)):
+                continue
+
+            _ops = []
+
+            for _honor, _honorific_english in self.honorifics:
+                _ops.append(len(self.ops))
+                self.ops.append(PlanOp("honorific", f'{_variant.jap}{_honor}', f'{_variant.eng}-{_honorific_english}', _index, _honorific_english))
+
+            if(_variant.bare_replacement in ("plain", "enhanced")):
+                _ops.append(len(self.ops))
+                self.ops.append(PlanOp(_variant.bare_replacement, _variant.jap, _variant.eng, _index)) ## type: ignore (checked above)
+
+            self.variants.append(PlanVariant(_variant.jap, _variant.eng, tuple(_ops), _variant.bare_replacement == "unlogged", _guard))
+            self.entries.append(("variant", _index))
+            self._variants_by_jap.setdefault(_variant.jap, []).append(_index)
+
+            ## a guarded variant gets steps of its own, so they can be skipped as a whole
+            if(_guard):
+                self.flush()
+
+            for _op in _ops:
+
+                if(self.ops[_op].kind == "enhanced"):
+                    self.flush(guard=_index if _guard else None)
+                    self._add_step(PlanStep("enhanced", (_op,), guard=_index if _guard else None))
+
+                else:
+                    self._pending.append(_op)
+
+            if(_guard):
+                self.flush(guard=_index)
+
+##-------------------start-of-_is_redundant()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _is_redundant(self, variant:NameVariant, guard:typing.Tuple[int, ...]) -> bool:
+
+        """
+
+        Checks if a guarded variant can never replace anything, in which case it can be left out of the plan, as skipping it or not makes no difference.
+
+        That's the case when an earlier variant with the same japanese has already replaced every pattern it has, and nothing since could have created them again.
+        If the variant isn't skipped, none of its guard replaced anything, so none of them were skipped either and the earlier variant did run.
+
+        Parameters:
+        variant (object - NameVariant) : The variant.
+        guard (tuple - int) : The earlier variants with the same japanese.
+
+        Returns:
+        bool : True if the variant can be left out, False otherwise.
+
+        """
+
+        _patterns = [f'{variant.jap}{_honor}' for _honor, _ in self.honorifics]
+        _replacements = [f'{variant.eng}-{_honorific_english}' for _, _honorific_english in self.honorifics]
+
+        if(variant.bare_replacement in ("plain", "enhanced")):
+            _patterns.append(variant.jap)
+            _replacements.append(variant.eng)
+
+        ## a variant without any patterns never replaces anything
+        if(not _patterns):
+            return True
+
+        _chars = set("".join(_patterns))
+
+        for _earlier in guard:
+
+            ## and neither does an earlier one without any ops
+            if(not self.variants[_earlier].ops):
+                continue
+
+            ## enhanced ops leave the japanese wherever NER didn't find a person, so only plain ones count
+            _cleared = {self.ops[_op].jap for _op in self.variants[_earlier].ops if self.ops[_op].kind != "enhanced"}
+
+            if(not _cleared.issuperset(_patterns)):
+                continue
+
+            _since = [_op.eng for _op in self.ops[self.variants[_earlier].ops[0]:]] + _replacements
+
+            ## anything that isn't a string fails to replace, and most replacements share no characters with the patterns at all
+            if(not any(isinstance(_replacement, str) and (len(_replacement) == 0 or not _chars.isdisjoint(_replacement)) and
+                       any(_can_create(_replacement, _pattern) for _pattern in _patterns)
+                       for _replacement in _since)):
+                return True
+
+        return False
+
+##-------------------start-of-add_error()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def add_error(self, message:str) -> None:
+
+        """
+
+        Adds an invalid entry, which only shows up in the error log.
+
+        Parameters:
+        message (str) : The error log entry.
+
+        """
+
+        self.entries.append(("error", message))
+
+##-------------------start-of-flush()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def flush(self, guard:int | None = None) -> None:
+
+        """
+
+        Turns the pending plain ops into passes.
+
+        Parameters:
+        guard (int | None | optional | default=None) : The guard of the passes, see PlanStep.
+
+        """
+
+        _start = 0
+
+        for _pass in compile_replacement_passes([(self.ops[_op].jap, self.ops[_op].eng) for _op in self._pending]):
+            _end = _start + len(_pass.patterns)
+            self._add_step(PlanStep("pass", tuple(self._pending[_start:_end]), _pass, guard))
+            _start = _end
+
+        self._pending = []
+
+##-------------------start-of-_add_step()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def _add_step(self, step:PlanStep) -> None:
+
+        """
+
+        Adds a step, working out the patterns it looks for and the earlier steps that could create them, see PlanStep.
+
+        Parameters:
+        step (object - PlanStep) : The step.
+
+        """
+
+        _index = len(self.steps)
+        _ops = [self.ops[_op] for _op in step.ops]
+
+        if(step.kind in ("pass", "enhanced") and all(len(_op.jap) > 0 for _op in _ops)):
+
+            _patterns = frozenset(_op.jap for _op in _ops)
+
+            ## removing text joins its neighbours, which can form any pattern longer than one character
+            _creators = set(self._empty_writers) if any(len(_pattern) > 1 for _pattern in _patterns) else set()
+
+            ## any other replacement creating a pattern either holds its first character or starts with one of its characters
+            for _pattern in _patterns:
+
+                _candidates = dict(self._writers_by_char.get(_pattern[0], {}))
+
+                for _char in set(_pattern):
+                    _candidates.update(self._writers_by_start.get(_char, {}))
+
+                for _replacement, _writers in _candidates.items():
+
+                    if(not _creators.issuperset(_writers) and _can_create(_replacement, _pattern)):
+                        _creators.update(_writers)
+
+            step = step._replace(patterns=_patterns, creators=tuple(sorted(_creators)))
+
+        for _op in _ops:
+
+            if(not isinstance(_op.eng, str)):
+                continue
+
+            if(len(_op.eng) == 0):
+                self._empty_writers.append(_index)
+                continue
+
+            self._writers_by_start.setdefault(_op.eng[0], {}).setdefault(_op.eng, set()).add(_index)
+
+            for _char in set(_op.eng):
+                self._writers_by_char.setdefault(_char, {}).setdefault(_op.eng, set()).add(_index)
+
+        self.steps.append(step)
+
+##-------------------start-of-_compile_name()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def _compile_name(name:Name, replace_type:ReplacementType, honorific_type:ReplacementType, json_key:str, json_type:str, whitelist:dict, is_katakana:bool) -> CompiledName:
+
+    """
+
+    Expands a name into its variants and decides how each of them is replaced without an honorific.
+
+    Parameters:
+    name (object - Name) : represents a japanese name along with its english equivalent.
+    replace_type (object - ReplacementType) : how a name should be replaced.
+    honorific_type (object - ReplacementType) : how a honorific should be replaced.
+    json_key (str) : The category the name is from.
+    json_type (str) : The type of replacement json, either "kudasai" or "fukuin".
+    whitelist (dict) : The enhanced check whitelist of the replacement json.
+    is_katakana (bool) : Indicates if the name is in Katakana.
+
+    Returns:
+    compiled_name (CompiledName) : The expanded name.
+
+    Raises:
+    InvalidReplacementJsonName : If the japanese and english names have a different number of parts.
+
+    """
+
+    ## First, check if any part of this name appears in whitelist entries
+    _is_whitelisted = any(part in entry
+                         for entry in whitelist.values()
+                         for part in name.jap.split())
+
+    _variants = []
+
+    for _eng, _jap, _no_honor in _yield_name_replacements(name, replace_type, honorific_type):
+
+        _bare_replacement = None
+
+        if(_no_honor):
+            ## Always use enhanced replace for whitelisted names
+            if(_is_whitelisted or json_type == "kudasai" and json_key == "enhanced_check_whitelist" or len(_jap) == 1):
+                _bare_replacement = "enhanced"
+            elif(is_katakana):
+                _bare_replacement = "unlogged" if KatakanaUtil.is_actual_word(_jap) else "enhanced"
+            else:
+                _bare_replacement = "plain"
+
+        _variants.append(NameVariant(_jap, _eng, _bare_replacement))
+
+    return CompiledName(name, json_key, tuple(_variants), None)
+
+##-------------------start-of-_format_error()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def _format_error(json_key:str, error:Exception) -> str:
+
+    """
+
+    Formats an error the way preprocessing writes it to the error log.
+
+    Parameters:
+    json_key (str) : The category the error happened in.
+    error (Exception) : The error.
+
+    Returns:
+    message (str) : The error log entry.
+
+    """
+
+    return "Issue with the following key : " + json_key + "\n" + "Error is as follows : " + str(error)
+
+##-------------------start-of-_yield_name_replacements()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def _yield_name_replacements(name:Name, replace_type:ReplacementType, honorific_type:ReplacementType) -> typing.Generator[tuple[str, str, bool], None, None]:
+
+    """
+
+    Generates tuples of English and Japanese names to be replaced, along with a boolean indicating whether honorifics should be kept or removed.
+
+    Parameters:
+    Name (object - Name) : represents a japanese name along with its english equivalent.
+    replace_type  (object - ReplacementType) : how a name should be replaced.
+    honorific_type (object - ReplacementType) : how a honorific_type should be replaced.
+
+    Returns:
+    tuple (string, string, bool) : tuple containing the japanese name, english name, and a boolean indicating whether honorifics should be kept or removed.
+
+    tuple is wrapped in a generator along with two None values. No, I don't know why.
+
+    """
+
+    _japanese_names = name.jap.split(" ")
+    _english_names = name.eng.split(" ")
+
+    ## if the lengths of the names don't match, the entire Name is fucked.
+    try:
+
+        assert len(_japanese_names) == len(_english_names)
+
+    except AssertionError:
+        raise InvalidReplacementJsonName(name)
+
+    if(ReplacementType.FULL_NAME in replace_type):
+        _indices = range(len(_japanese_names))
+        ## create a chain of combinations of indices, starting with combinations of length 2 up to the length of indices
+        _combinations = itertools.chain(
+            *(itertools.combinations(_indices, i) for i in range(2, len(_indices)+1)))
+
+        for _comb in _combinations:
+            for _separator in _JAPANESE_NAME_SEPARATORS:
+                yield (" ".join(map(lambda i: _english_names[i], _comb)),
+                       _separator.join(
+                           map(lambda i: _japanese_names[i], _comb)),
+                       ReplacementType.FULL_NAME in honorific_type)
+
+    if(ReplacementType.FIRST_NAME in replace_type):
+        yield(_english_names[0],
+               f'{_japanese_names[0]}',
+               ReplacementType.FIRST_NAME in honorific_type)
+
+    if(ReplacementType.LAST_NAME in replace_type):
+        yield(_english_names[-1],
+               f'{_japanese_names[-1]}',
+               ReplacementType.LAST_NAME in honorific_type)
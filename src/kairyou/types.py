@@ -7,4 +7,30 @@ import typing
 
 class NameAndOccurrence(typing.NamedTuple):
     name:str
-    occurrence:int
\ No newline at end of file
+    occurrence:int
+
+class Entity(typing.NamedTuple):
+    text:str
+    label:str
+    start_char:int
+    end_char:int
+
+class LineCacheStats(typing.NamedTuple):
+    hits:int
+    misses:int
+    size:int
+    max_size:int
+
+class ModelMetrics(typing.NamedTuple):
+    name:str
+    is_loaded:bool
+    references:int
+    loads:int
+    evictions:int
+    total_load_time:float
+    last_load_time:float
+    profile:str = "full"
+
+class KnowledgeBaseIndex(typing.NamedTuple):
+    names:typing.Dict[str, int]
+    model:typing.Tuple[str, str] | None
@@ -2,8 +2,17 @@
 ## Use of this source code is governed by a GNU Lesser General Public License v2.1
 ## license that can be found in the LICENSE file.
 
-from kairyou import Kairyou, Indexer
-from kairyou import KatakanaUtil
+from concurrent.futures import ThreadPoolExecutor
+import tempfile
+import warnings
+import json
+import asyncio
+import os
+
+from kairyou import Kairyou, KairyouClient, AsyncKairyou, Indexer, IndexerSession, LineCache, NERCache, KnowledgeBaseCache, ModelManager, KairyouWarning, PlanNotStreamable
+from kairyou import KatakanaUtil, NERBackend, SpacyBackend, DictionaryBackend, FakeBackend, Entity
+from kairyou.matcher import MultiPatternMatcher, ContainmentMatcher, compile_replacement_passes
+from kairyou.ner import NERRunner
 
 ##-------------------start-of-read_file()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
@@ -15,6 +24,12 @@ def read_file(filename):
     except:
         raise FileNotFoundError("File not found")
     
+##-------------------start-of-preprocess_async()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+async def preprocess_async(texts, plan):
+    async with AsyncKairyou(max_workers=2) as kairyou:
+        return await asyncio.gather(*(kairyou.preprocess(text, plan) for text in texts))
+
 ##-------------------start-of-main()---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
 def main():
@@ -26,6 +41,144 @@ def main():
 
     preprocessed_text, preprocessing_log, error_log = Kairyou.preprocess(text, "tests//testing_replacements.json")
 
+    ## the model Indexer loaded is reused rather than loaded again
+    if(ModelManager.get_metrics().loads != 1):
+        raise ValueError("Test failed")
+
+    ## a backend is only used for the call it is passed to
+    Indexer.index(text, testing_knowledge_base, "tests//testing_replacements.json", backend=FakeBackend(), discard_ner_objects=False)
+
+    if(Indexer.index(text, testing_knowledge_base, "tests//testing_replacements.json")[0] != names_and_occurrences or ModelManager.get_metrics().loads != 1):
+        raise ValueError("Test failed")
+
+    ## an index of the knowledge base gives the same names without parsing it again
+    spacy_backend = SpacyBackend()
+
+    with tempfile.TemporaryDirectory() as directory:
+        Indexer.build_knowledge_base_index(testing_knowledge_base, os.path.join(directory, "index.json"), backend=spacy_backend)
+        knowledge_base_index = Indexer.load_knowledge_base_index(os.path.join(directory, "index.json"))
+
+    if(Indexer.index(text, knowledge_base_index, "tests//testing_replacements.json", backend=spacy_backend)[0] != names_and_occurrences):
+        raise ValueError("Test failed")
+
+    ## an index built with another model is warned about, as that model finds other names
+    with warnings.catch_warnings(record=True) as caught_warnings:
+        warnings.simplefilter("always")
+
+        with tempfile.TemporaryDirectory() as directory:
+            Indexer.build_knowledge_base_index(testing_knowledge_base, os.path.join(directory, "index.json"), backend=FakeBackend())
+            fake_knowledge_base_index = Indexer.load_knowledge_base_index(os.path.join(directory, "index.json"))
+
+        Indexer.index(text, fake_knowledge_base_index, "tests//testing_replacements.json", backend=spacy_backend)
+
+        if(not any(issubclass(_warning.category, KairyouWarning) for _warning in caught_warnings)):
+            raise ValueError("Test failed")
+
+    ## a knowledge base file that hasn't changed is taken from the cache instead of being parsed again
+    knowledge_base_cache = KnowledgeBaseCache(":memory:")
+
+    with tempfile.TemporaryDirectory() as directory:
+
+        with open(os.path.join(directory, "volume_1.txt"), "w", encoding="utf-8") as file:
+            file.write(testing_knowledge_base)
+
+        if(any(Indexer.index(text, directory, "tests//testing_replacements.json", backend=spacy_backend, knowledge_base_cache=knowledge_base_cache)[0] != names_and_occurrences for _ in range(2)) or knowledge_base_cache.stats().hits != 1):
+            raise ValueError("Test failed")
+
+    ## a session gives every call the same names, and parses a knowledge base it has kept only once
+    with IndexerSession(spacy_backend, max_knowledge_base_entries=100000) as session:
+        if(any(session.index(text, testing_knowledge_base, "tests//testing_replacements.json")[0] != names_and_occurrences for _ in range(2)) or session.knowledge_base_stats().hits != 1):
+            raise ValueError("Test failed")
+
+    spacy_backend.close()
+
+    ## a json passed on every call is only compiled the first time
+    if(KairyouClient("tests//testing_replacements.json").plan is not KairyouClient("tests//testing_replacements.json").plan):
+        raise ValueError("Test failed")
+
+    ## a compiled plan has to give the same result as the json it was compiled from
+    plan = Kairyou.compile("tests//testing_replacements.json")
+
+    if(Kairyou.preprocess(text, plan)[0] != preprocessed_text or Kairyou.preprocess(text, plan)[0] != preprocessed_text):
+        raise ValueError("Test failed")
+
+    ## so does a client, including when it is shared between threads
+    client = KairyouClient(plan)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        if(any(_result[0] != preprocessed_text for _result in executor.map(client.preprocess, [text] * 4))):
+            raise ValueError("Test failed")
+
+    if([_result[0] for _result in Kairyou.preprocess_batch([text, text], plan)] != [preprocessed_text, preprocessed_text]):
+        raise ValueError("Test failed")
+
+    ## so does one that only remembers the NER results of a single line
+    if([_result[0] for _result in client.preprocess_batch([text, text], entity_cache_size=1)] != [preprocessed_text, preprocessed_text]):
+        raise ValueError("Test failed")
+
+    if(Kairyou.preprocess_chunked(text, plan, max_workers=2, lines_per_chunk=1)[0] != preprocessed_text):
+        raise ValueError("Test failed")
+
+    ## a plan that needs the whole text reads every line before preprocessing, which is warned about, or refused if strict
+    with warnings.catch_warnings(record=True) as caught_warnings:
+        warnings.simplefilter("always")
+
+        if("\n".join(Kairyou.preprocess_stream(text.split("\n"), plan, lines_per_block=3)) != preprocessed_text or not any(issubclass(_warning.category, KairyouWarning) for _warning in caught_warnings)):
+            raise ValueError("Test failed")
+
+    try:
+        next(Kairyou.preprocess_stream(text.split("\n"), plan, strict=True))
+        raise ValueError("Test failed")
+
+    except PlanNotStreamable:
+        pass
+
+    ## a name in two categories needs the whole text, so the line cache can't be used, which is warned about
+    with warnings.catch_warnings(record=True) as caught_warnings:
+        warnings.simplefilter("always")
+
+        if(Kairyou.preprocess(text, plan, line_cache=LineCache())[0] != preprocessed_text or not any(issubclass(_warning.category, KairyouWarning) for _warning in caught_warnings)):
+            raise ValueError("Test failed")
+
+    ## a plan that works line by line takes the lines it has seen from the line cache
+    line_local_plan = Kairyou.compile("examples//cote_fukuin.json")
+    line_local_text = Kairyou.preprocess(text, line_local_plan)[0]
+
+    line_cache = LineCache()
+
+    if(any(Kairyou.preprocess(text, line_local_plan, line_cache=line_cache)[0] != line_local_text for _ in range(2)) or line_cache.stats().hits == 0):
+        raise ValueError("Test failed")
+
+    ## and can be streamed a couple of lines at a time, giving the lines of the whole text
+    if("\n".join(Kairyou.preprocess_stream(text.split("\n"), line_local_plan, lines_per_block=2, strict=True)) != line_local_text):
+        raise ValueError("Test failed")
+
+    ## changing one of its entries only preprocesses the lines that entry is on again
+    changed_replacements = json.loads(read_file("examples//cote_fukuin.json"))
+    changed_replacements["specials"]["ケヤキモール"] = "Keyaki Shopping Mall"
+
+    incremental_text, incremental_log, _ = Kairyou.preprocess_incremental(text, line_local_text, line_local_plan, changed_replacements)
+    lines_preprocessed, total_lines = map(int, incremental_log.rsplit("Lines Preprocessed : ", 1)[1].split("/"))
+
+    if(incremental_text != Kairyou.preprocess(text, changed_replacements)[0] or incremental_text == line_local_text or not 0 < lines_preprocessed < total_lines):
+        raise ValueError("Test failed")
+
+    ## the second run takes every NER result from the cache
+    ner_cache = NERCache(":memory:")
+
+    if(any(Kairyou.preprocess(text, plan, ner_cache=ner_cache)[0] != preprocessed_text for _ in range(2)) or ner_cache.stats().hits == 0):
+        raise ValueError("Test failed")
+
+    ## carrying the spans of one parse through the replacements gives the same text as parsing changed lines again
+    if(KairyouClient(plan, parse_once=True).preprocess(text)[0] != preprocessed_text):
+        raise ValueError("Test failed")
+
+    if(Kairyou.preprocess_incremental(text, preprocessed_text, plan, "tests//testing_replacements.json")[0] != preprocessed_text):
+        raise ValueError("Test failed")
+
+    if(any(_result[0] != preprocessed_text for _result in asyncio.run(preprocess_async([text] * 3, plan)))):
+        raise ValueError("Test failed")
+
     katakana_only = KatakanaUtil.is_katakana_only("テスト")
 
     not_katakana_only = KatakanaUtil.is_katakana_only("テストtest")
@@ -55,6 +208,64 @@ def main():
     if(KatakanaUtil.is_partially_english("テスト")):
         raise ValueError("Test failed")
     
+    if(list(MultiPatternMatcher(["ab", "abc", "bcd"]).finditer("abcd")) != [(0, 3, 1)]):
+        raise ValueError("Test failed")
+
+    if(not ContainmentMatcher(["綾小路", "小路清"]).search("綾小路清隆") or ContainmentMatcher(["綾小路清", "清隆"]).search("小路清")):
+        raise ValueError("Test failed")
+
+    ## the ner-only profile finds the same entities as the full pipeline
+    ner_only = SpacyBackend(profile="ner-only")
+
+    if(Kairyou.preprocess(text, plan, backend=ner_only)[0] != preprocessed_text):
+        raise ValueError("Test failed")
+
+    ner_only.close()
+
+    if(list(DictionaryBackend(["綾小路", "綾小路清隆"]).pipe(["綾小路清隆くん"])) != [(Entity("綾小路清隆", "PERSON", 0, 5),)]):
+        raise ValueError("Test failed")
+
+    ## a backend that doesn't implement pipe() can't be created
+    try:
+        type("IncompleteBackend", (NERBackend,), {})()
+        raise ValueError("Test failed")
+
+    except TypeError:
+        pass
+
+    ## entries without honorifics have nothing to replace but the name itself, which is not an error
+    no_honorifics = {**json.loads(read_file("examples//blank_kudasai.json")), "name_like": {"Kouhai": "後輩", "Junior": "後輩"}}
+
+    if(Kairyou.preprocess("後輩", no_honorifics, backend=FakeBackend())[2] != ""):
+        raise ValueError("Test failed")
+
+    ## the same text always gives the same result without a model
+    if(Kairyou.preprocess(text, plan, backend=FakeBackend())[0] != KairyouClient(plan, ner=FakeBackend()).preprocess(text)[0]):
+        raise ValueError("Test failed")
+
+    ## a long line is parsed a chunk of sentences at a time, with the entities moved back to where they are in the line
+    long_line = "".join(text.split("\n"))
+
+    if(list(NERRunner(chunk_size=100).pipe(FakeBackend(), [long_line])) != list(NERRunner(chunk_size=None).pipe(FakeBackend(), [long_line]))):
+        raise ValueError("Test failed")
+
+    ## lines read as they are needed give the same entities as a list of them
+    if(list(NERRunner().pipe_stream(FakeBackend(), iter(text.split("\n")), lines_per_block=2)) != list(NERRunner().pipe(FakeBackend(), text.split("\n")))):
+        raise ValueError("Test failed")
+
+    ## a single scan must give the same text as replacing one entry after another
+    _entries = [("……。", "..."), ("…。", "..."), ("。", "."), ("……", "..."), ("......", "...")]
+    _sequential = _scanned = "……。…。。…………"
+
+    for _jap, _eng in _entries:
+        _sequential = _sequential.replace(_jap, _eng)
+
+    for _pass in compile_replacement_passes(_entries):
+        _scanned, _ = _pass.apply(_scanned)
+
+    if(_sequential != _scanned):
+        raise ValueError("Test failed")
+
     print("All tests passed")
 
 